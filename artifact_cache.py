@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# File name of the manifest of the figures and tables written to an output
+# directory, saved in that directory. It maps the path of each artifact
+# (relative to the directory) to a hash of the data and parameters it was
+# generated from, so artifacts whose inputs haven't changed are not generated
+# again. Set to None to always regenerate every artifact.
+MANIFEST = 'artifact_cache.json'
+
+
+def data_hash(*inputs):
+    """
+    Hash of the data and parameters an artifact is generated from. DataFrames
+    and Series are hashed row by row together with their column names, arrays
+    by their contents and anything else by its repr.
+    """
+    digest = hashlib.sha1()
+
+    for value in inputs:
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr(list(value.columns)))
+            digest.update(pd.util.hash_pandas_object(value, index=False).values.tobytes())
+        elif isinstance(value, pd.Series):
+            digest.update(repr(value.name))
+            digest.update(pd.util.hash_pandas_object(value, index=False).values.tobytes())
+        elif isinstance(value, np.ndarray):
+            digest.update(repr((value.dtype.str, value.shape)))
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(repr(value))
+
+    return digest.hexdigest()
+
+
+def manifest_path(out_dir):
+    """
+    Path of the manifest of the artifacts written to out_dir (None if
+    manifests are turned off).
+    """
+    if MANIFEST is None:
+        return None
+
+    return os.path.join(out_dir, MANIFEST)
+
+
+def artifact_key(manifest_path, path):
+    """
+    Key of the artifact at path in the manifest at manifest_path: its path
+    relative to the manifest, so the manifest stays valid wherever the
+    analysis is run from.
+    """
+    if manifest_path is None:
+        return path
+
+    return os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(manifest_path)))
+
+
+def load_manifest(manifest_path):
+    """
+    Load the manifest of artifacts at manifest_path (an empty dict if there is
+    none).
+    """
+    if manifest_path is None or not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_path):
+    """
+    Save the manifest of artifacts to manifest_path. It is written to a
+    temporary file first, so an interrupted run never leaves a partial
+    manifest.
+    """
+    if manifest_path is None:
+        return
+
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.rename(manifest_path + '.tmp', manifest_path)
+
+
+def is_fresh(manifest, manifest_path, path, digest):
+    """
+    Check whether the artifact at path exists and was generated from inputs
+    with the given hash, according to the manifest loaded from manifest_path.
+    """
+    return manifest.get(artifact_key(manifest_path, path)) == digest and os.path.exists(path)
+
+
+def record(manifest, manifest_path, path, digest):
+    """
+    Record in the manifest loaded from manifest_path that the artifact at path
+    was generated from inputs with the given hash.
+    """
+    manifest[artifact_key(manifest_path, path)] = digest
@@ -0,0 +1,216 @@
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from bs4 import BeautifulSoup
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+import espn_projection_bias
+import matchups_table
+import players_table
+import score_analysis
+import score_engine
+import slots_table
+import teams_table
+import synthetic_db
+
+# Saved ESPN pages the parsers are benchmarked on
+FIXTURE_DIR = os.path.join(BENCH_DIR, 'fixtures')
+
+# Every run appends its results to RESULTS_FILE (ignored by git, as timings
+# are only comparable on the same host) as JSON lines, or to the file given
+# with RESULTS_FLAG=PATH. A benchmark that is more than REGRESSION_THRESHOLD
+# times slower than the median of its last HISTORY results on the same host
+# is reported as a regression.
+RESULTS_FILE = os.path.join(BENCH_DIR, 'results.jsonl')
+RESULTS_FLAG = '--results'
+HISTORY = 5
+REGRESSION_THRESHOLD = 1.25
+
+REPEAT = 5 # runs of each benchmark, of which the fastest is recorded
+PAGES = 20 # pages parsed per run of a parser benchmark
+
+
+def load_fixture(name):
+    """
+    Text of a saved page in FIXTURE_DIR.
+    """
+    with io.open(os.path.join(FIXTURE_DIR, name + '.html'), encoding='utf-8') as f:
+        return f.read()
+
+
+def best_time(func, repeat=None):
+    """
+    Seconds taken by the fastest of repeat calls of func.
+    """
+    times = []
+    for _ in range(repeat or REPEAT):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+
+    return min(times)
+
+
+def parser_benchmarks():
+    """
+    Time each parser on its saved page, from the page HTML to parsed rows.
+    Returns a list of (benchmark, params, seconds per page) tuples.
+    """
+    clubhouse = load_fixture('clubhouse')
+    boxscore = load_fixture('boxscorequick')
+    schedule = load_fixture('schedule')
+    settings = load_fixture('settings')
+
+    parsers = [
+        ('parse_lineup', lambda: players_table.parse_lineup(1, 1, players_table.find_lineup_table(clubhouse))),
+        ('parse_lineup_html', lambda: players_table.parse_lineup_html(1, 1, clubhouse)),
+        ('parse_scoring', lambda: players_table.parse_scoring(players_table.find_scoring_tables(boxscore))),
+        ('parse_scoring_html', lambda: players_table.parse_scoring_html(boxscore)),
+        ('parse_matchups', lambda: matchups_table.parse_matchups(5, BeautifulSoup(schedule, 'lxml').find_all('table')[1])),
+        ('parse_teams', lambda: teams_table.parse_teams(1, BeautifulSoup(clubhouse, 'lxml'))),
+        ('parse_slots', lambda: slots_table.parse_slots(BeautifulSoup(settings, 'lxml').find_all('table')[2]))]
+
+    results = []
+    for name, parse in parsers:
+        seconds = best_time(lambda: [parse() for _ in range(PAGES)]) / PAGES
+        results.append((name, {}, seconds))
+
+    return results
+
+
+def data_benchmarks(ff_db, leagues, seasons):
+    """
+    Time the analysis functions on a synthetic database of leagues x seasons
+    league-seasons (see synthetic_db). Returns a list of (benchmark, params,
+    seconds) tuples.
+    """
+    params = {'leagues': leagues, 'seasons': seasons}
+    weeks = range(1, 14)
+    league_id, season_id = 1, 2018
+
+    # Scores are cached in the database after the first call, so the analysis
+    # benchmarks below run against a warm ScoreCache
+    benchmarks = [
+        ('get_league_scores_uncached', lambda: score_engine.get_league_scores(ff_db, weeks, use_cache=False)),
+        ('get_scores', lambda: [score_analysis.get_scores(ff_db, team_id, 1, league_id, season_id) for team_id in range(1, 11)]),
+        ('make_standings_tables', lambda: score_analysis.make_standings_tables(ff_db, weeks)),
+        ('get_relative_errors', lambda: espn_projection_bias.get_relative_errors(ff_db))]
+
+    results = [(name, params, best_time(func)) for name, func in benchmarks]
+
+    errors = espn_projection_bias.get_relative_errors(ff_db)
+    seconds = best_time(lambda: espn_projection_bias.bootstrap(errors, 10000, np.mean, 0.05, seed=0), 3)
+    results.append(('bootstrap', dict(params, num_samples=10000), seconds))
+
+    return results
+
+
+def git_commit():
+    """
+    Commit of the working tree being benchmarked (None outside a git
+    checkout).
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                       stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path=None):
+    """
+    All results recorded in path (RESULTS_FILE by default).
+    """
+    path = path or RESULTS_FILE
+    if not os.path.exists(path):
+        return []
+
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline(history, benchmark, params, host):
+    """
+    Median seconds of the last HISTORY results of a benchmark with the same
+    params on the same host (None if there are none).
+    """
+    earlier = [result['seconds'] for result in history
+               if result['benchmark'] == benchmark and result['params'] == params and result['host'] == host]
+    if not earlier:
+        return None
+
+    return float(np.median(earlier[-HISTORY:]))
+
+
+def main():
+    """
+    Run all benchmarks from the command line, optionally on a synthetic
+    database of a given number of leagues and seasons (4 x 3 by default):
+
+    python benchmarks/run_benchmarks.py [LEAGUES SEASONS] [--results=PATH]
+
+    Results are compared with earlier runs on the same host and appended to
+    PATH (RESULTS_FILE by default). Exits with status 1 if any benchmark
+    regressed.
+    """
+    results_file = RESULTS_FILE
+    argv = []
+    for arg in sys.argv[1:]:
+        if arg.startswith(RESULTS_FLAG + '='):
+            results_file = arg[len(RESULTS_FLAG)+1:]
+        else:
+            argv.append(arg)
+
+    leagues = int(argv[0]) if len(argv) > 0 else 4
+    seasons = int(argv[1]) if len(argv) > 1 else 3
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        ff_db = os.path.join(tmp_dir, 'synthetic.sqlite')
+        print 'Creating a synthetic database of {} leagues x {} seasons ...'.format(leagues, seasons)
+        synthetic_db.make_database(ff_db, leagues, seasons)
+
+        results = parser_benchmarks() + data_benchmarks(ff_db, leagues, seasons)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    history = load_history(results_file)
+    host = platform.node()
+    run = {'time': int(time.time()), 'commit': git_commit(), 'host': host, 'python': platform.python_version()}
+
+    regressed = []
+    print '\n{:<28} {:>12} {:>12} {:>8}'.format('Benchmark', 'Seconds', 'Baseline', 'Ratio')
+    for name, params, seconds in results:
+        before = baseline(history, name, params, host)
+        ratio = seconds / before if before else None
+        flag = ''
+        if ratio is not None and ratio > REGRESSION_THRESHOLD:
+            regressed.append(name)
+            flag = ' REGRESSION'
+        print '{:<28} {:>12.5f} {:>12} {:>8}{}'.format(name, seconds, '{:.5f}'.format(before) if before else '-',
+                                                       '{:.2f}'.format(ratio) if ratio else '-', flag)
+
+    with open(results_file, 'a') as f:
+        for name, params, seconds in results:
+            f.write(json.dumps(dict(run, benchmark=name, params=params, seconds=round(seconds, 6)), sort_keys=True) + '\n')
+
+    if regressed:
+        print '\n{} benchmarks regressed: {}'.format(len(regressed), ', '.join(regressed))
+        return 1
+
+    print '\nNo regressions.'
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import os
+import sys
+import numpy.random as npr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db_writer
+import schema
+
+# Roster of every synthetic team: the starting slots of an ESPN standard
+# league and a seven player bench
+slots = [('QB', 1), ('RB', 2), ('WR', 2), ('TE', 1), ('FLEX', 1), ('DST', 1), ('K', 1)]
+starters = [('QB', 'QB'), ('RB', 'RB'), ('RB', 'RB'), ('WR', 'WR'), ('WR', 'WR'), ('TE', 'TE'),
+            ('FLEX', 'RB'), ('D/ST', 'D/ST'), ('K', 'K')]
+bench = ['QB', 'RB', 'RB', 'WR', 'WR', 'TE', 'D/ST']
+
+# Mean and standard deviation of the actual points of each position
+points = {'QB': (17.0, 7.0), 'RB': (10.0, 6.0), 'WR': (10.0, 6.5), 'TE': (7.0, 4.5),
+          'D/ST': (8.0, 5.0), 'K': (8.0, 3.5)}
+
+
+def round_robin(n_teams, n_weeks, rng):
+    """
+    Pairs of team_ids meeting in each week: a round robin over randomly ordered
+    teams, repeated as often as needed.
+    """
+    order = list(rng.permutation(n_teams) + 1)
+    rounds = []
+    for _ in range(n_teams - 1):
+        rounds.append([(order[i], order[-1 - i]) for i in range(n_teams // 2)])
+        order = [order[0], order[-1]] + order[1:-1]
+
+    return [rounds[week % len(rounds)] for week in range(n_weeks)]
+
+
+def make_database(path, leagues=4, seasons=3, teams=10, weeks=13, seed=0):
+    """
+    Create a database at path (replacing any file there) with the schema of
+    schema.py, filled with leagues x seasons synthetic league-seasons of teams
+    teams each, and a full roster of players with projected and actual points
+    for every team and week. Returns the number of player rows written.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+    rng = npr.RandomState(seed)
+    conn = db_writer.connect(path)
+    cur = conn.cursor()
+    schema.create_schema(cur)
+
+    roster = starters + [('Bench', position) for position in bench]
+    count = 0
+
+    for league_id in range(1, leagues + 1):
+        for season_id in range(2018 - seasons + 1, 2019):
+            team_rows = [(league_id, season_id, team_id, 'T' + str(team_id), 'Team ' + str(team_id),
+                          'Division ' + str(team_id % 2 + 1), 'Owner ' + str(team_id), None)
+                         for team_id in range(1, teams + 1)]
+            db_writer.write_rows(conn, '''INSERT INTO Teams (league_id, season_id, team_id,
+                team_abbr, team_name, division, owner, co_owner)
+                VALUES ( ?, ?, ?, ?, ?, ?, ?, ? )''', team_rows)
+
+            db_writer.write_rows(conn, '''INSERT INTO Slots (league_id, season_id, position, slots)
+                VALUES ( ?, ?, ?, ? )''', [(league_id, season_id, position, n) for position, n in slots])
+
+            matchup_rows = [(league_id, season_id, week + 1, 'Team ' + str(home), 'Team ' + str(away))
+                            for week, pairs in enumerate(round_robin(teams, weeks, rng)) for home, away in pairs]
+            db_writer.write_rows(conn, '''INSERT INTO Matchups (league_id, season_id, week, home, away)
+                VALUES ( ?, ?, ?, ?, ? )''', matchup_rows)
+
+            # Every player of a team keeps the same name all season, so
+            # players appear in many weeks like they do in real leagues
+            player_rows = []
+            for week in range(1, weeks + 1):
+                for team_id in range(1, teams + 1):
+                    for i, (slot, position) in enumerate(roster):
+                        mean, std = points[position]
+                        projected = round(max(0.0, rng.normal(mean, std / 2)), 1) if rng.rand() > 0.05 else 0.0
+                        actual = round(rng.normal(mean, std), 1)
+                        player_rows.append((league_id, season_id, week, team_id, slot,
+                                            'Player {}-{}-{}'.format(league_id, team_id, i), 'NE', position,
+                                            projected, actual))
+            count += db_writer.write_rows(conn, '''INSERT INTO Players (league_id, season_id, week,
+                team_id, slot, player, team, position, projected_points, actual_points)
+                VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )''', player_rows)
+
+    schema.analyze(cur)
+    conn.commit()
+    conn.close()
+
+    return count
+
+
+def main():
+    """
+    Create a synthetic database from the command line:
+
+    python benchmarks/synthetic_db.py DATABASE [LEAGUES SEASONS]
+    """
+    path = sys.argv[1]
+    leagues = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    seasons = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    count = make_database(path, leagues, seasons)
+    print '{} player rows of {} leagues x {} seasons written to {}'.format(count, leagues, seasons, path)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import multiprocessing
+import numpy as np
+import numpy.random as npr
+import pandas as pd
+import scipy.stats
+
+# Largest number of data points resampled at once. Resamples are drawn in
+# chunks of MAX_CHUNK_ELEMENTS / len(data) rows, so peak memory stays the same
+# however many resamples are drawn.
+MAX_CHUNK_ELEMENTS = 2**22
+
+# Number of groups left out in turn by the grouped jackknife that estimates the
+# BCa acceleration
+JACKKNIFE_GROUPS = 100
+
+# Data, statistics and resample buffer of each worker process
+_worker = {}
+
+
+def chunk_plan(n, num_samples, seed):
+    """
+    Split num_samples resamples of n data points (in total over all groups
+    resampled together) into (size, seed) chunks. Each chunk gets its own seed
+    derived from seed, so results don't depend on how the chunks are spread
+    over processes.
+    """
+    chunk_size = max(1, min(num_samples, MAX_CHUNK_ELEMENTS // max(n, 1)))
+    sizes = [chunk_size] * (num_samples // chunk_size)
+    if num_samples % chunk_size:
+        sizes.append(num_samples % chunk_size)
+
+    seeds = npr.RandomState(seed).randint(0, 2**31 - 1, size=len(sizes))
+
+    return zip(sizes, seeds)
+
+
+def resample_chunk(data, statistics, size, seed, buffer):
+    """
+    Draw size resamples of data into buffer and calculate each statistic on
+    every resample. data is either one array of n data points, or a 2-D array
+    of several groups of n data points that are resampled with the same
+    indices. Returns an array of shape (len(statistics), size), or
+    (len(statistics), groups, size) for grouped data.
+    """
+    n = data.shape[-1]
+    idx = npr.RandomState(seed).randint(0, n, (size, n))
+    samples = buffer[..., :size, :]
+    np.take(data, idx, axis=-1, out=samples)
+
+    return np.array([statistic(samples, -1) for statistic in statistics])
+
+
+def init_worker(datasets, statistics, elements):
+    """
+    Set up a worker process with the datasets, statistics and a reusable
+    resample buffer of elements data points, enough for a chunk of any of the
+    datasets.
+    """
+    _worker['datasets'] = datasets
+    _worker['statistics'] = statistics
+    _worker['buffer'] = np.empty(elements, dtype=np.result_type(*datasets))
+
+
+def run_chunk(chunk):
+    """
+    Resample a (dataset index, size, seed, chunk size) chunk in a worker
+    process.
+    """
+    i, size, seed, chunk_size = chunk
+    data = _worker['datasets'][i]
+    shape = data.shape[:-1] + (chunk_size, data.shape[-1])
+    buffer = _worker['buffer'][:int(np.prod(shape))].reshape(shape)
+
+    return resample_chunk(data, _worker['statistics'], size, seed, buffer)
+
+
+def resample_datasets(datasets, num_samples, statistics, seed=None, processes=1):
+    """
+    Resample each of a list of datasets (see resample). The chunks of every
+    dataset are spread over one pool of processes worker processes (or run in
+    this process if processes is 1), which gets the datasets once, so many
+    small datasets cost no more than one large one. Results are the same as
+    resampling each dataset on its own with the same seed.
+
+    Returns a list of the results of resample, in the order of datasets.
+    """
+    datasets = [np.asarray(data) for data in datasets]
+    plans = [chunk_plan(data.size, num_samples, seed) for data in datasets]
+    tasks = [(i, size, chunk_seed, plan[0][0]) for i, plan in enumerate(plans) for size, chunk_seed in plan]
+    elements = max(plan[0][0] * data.size for data, plan in zip(datasets, plans))
+
+    if processes == 1:
+        init_worker(datasets, statistics, elements)
+        chunks = [run_chunk(task) for task in tasks]
+        _worker.clear()
+    else:
+        pool = multiprocessing.Pool(processes, init_worker, (datasets, statistics, elements))
+        try:
+            chunks = pool.map(run_chunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    results = [[] for _ in datasets]
+    for task, chunk in zip(tasks, chunks):
+        results[task[0]].append(chunk)
+
+    return [np.concatenate(result, axis=-1) for result in results]
+
+
+def resample(data, num_samples, statistics, seed=None, processes=1):
+    """
+    Calculate each statistic on num_samples bootstrap resamples of data, with
+    all statistics sharing the same resamples. data may also be a 2-D array of
+    equally sized groups, which then share the same resample indices. Chunks of
+    resamples are spread over processes worker processes (or run in this
+    process if processes is 1). Results are reproducible for a given seed,
+    whatever the number of processes.
+
+    Returns an array of shape (len(statistics), num_samples), or
+    (len(statistics), groups, num_samples) for grouped data.
+    """
+    return resample_datasets([data], num_samples, statistics, seed, processes)[0]
+
+
+def jackknife_acceleration(data, statistic, groups=None):
+    """
+    Estimate the BCa acceleration of statistic with a grouped jackknife: the
+    data is split into groups, and the statistic is recalculated with each
+    group left out in turn.
+    """
+    if groups is None:
+        groups = JACKKNIFE_GROUPS
+
+    parts = np.array_split(np.arange(len(data)), min(groups, len(data)))
+    theta = np.array([statistic(np.delete(data, part)) for part in parts])
+    diff = theta.mean() - theta
+
+    denom = 6.0 * np.sum(diff**2)**1.5
+    if denom == 0:
+        return 0.0
+
+    return np.sum(diff**3) / denom
+
+
+def confidence_interval(data, dist, statistic, alpha, method='percentile'):
+    """
+    100.0*(1-alpha) CI for statistic from its sorted bootstrap distribution
+    dist. method is 'percentile' or 'bca' (bias-corrected and accelerated).
+    The jackknife of BCa needs at least 2 data points, so the CI of a single
+    data point is always the percentile CI.
+    """
+    num_samples = len(dist)
+    low, high = alpha/2.0, 1 - alpha/2.0
+
+    if method not in ('percentile', 'bca'):
+        raise ValueError("method must be 'percentile' or 'bca'")
+    if method == 'bca' and len(data) > 1:
+        theta = statistic(data)
+        z0 = scipy.stats.norm.ppf(np.clip(np.mean(dist < theta), 1.0/num_samples, 1 - 1.0/num_samples))
+        a = jackknife_acceleration(data, statistic)
+        z_low, z_high = scipy.stats.norm.ppf([low, high])
+        low = scipy.stats.norm.cdf(z0 + (z0 + z_low) / (1 - a*(z0 + z_low)))
+        high = scipy.stats.norm.cdf(z0 + (z0 + z_high) / (1 - a*(z0 + z_high)))
+
+    return dist[min(int(low*num_samples), num_samples-1)], dist[min(int(high*num_samples), num_samples-1)]
+
+
+def bootstrap_statistics(data, num_samples, statistics, alpha, seed=None, processes=1, method='percentile'):
+    """
+    Bootstrap several statistics of data in a single resampling pass. For each
+    statistic, returns a tuple of:
+    (1) Sorted distribution of statistic
+    (2) Mean statistic
+    (3) 100.0*(1-alpha) CI for statistic (low)
+    (4) 100.0*(1-alpha) CI for statistic (high)
+    """
+    data = np.asarray(data)
+    dists = np.sort(resample(data, num_samples, statistics, seed, processes), axis=1)
+
+    results = []
+    for statistic, dist in zip(statistics, dists):
+        ci_low, ci_high = confidence_interval(data, dist, statistic, alpha, method)
+        results.append((dist, np.mean(dist), ci_low, ci_high))
+
+    return results
+
+
+def bootstrap_groups(table, column, groupings, num_samples, statistics, alpha, seed=None, processes=1, method='percentile'):
+    """
+    Bootstrap several statistics of a column of table for every group of
+    several groupings in one call. groupings is a list of tuples of grouping
+    columns, e.g. [(), ('position', ), ('position', 'slot', 'week')], where ()
+    stands for all rows. statistics is a dict of statistic functions keyed by
+    name.
+
+    All statistics share the same resamples, and groups of the same size
+    (across all groupings) share the same resample indices. The bootstrap
+    distribution of each group is unaffected by this; only the resamples of
+    different groups are no longer independent of each other.
+
+    Returns a DataFrame with one row per group and statistic, holding the group
+    keys ('All' for columns not grouped on), the statistic name, the number of
+    data points n, the statistic of the data, the mean of its bootstrap
+    distribution and its 100.0*(1-alpha) CI.
+    """
+    names = sorted(statistics)
+    functions = [statistics[name] for name in names]
+    columns = sorted(set(col for grouping in groupings for col in grouping))
+
+    # Collect the data of every group, keyed by group size
+    groups = {}
+    for grouping in groupings:
+        if grouping:
+            grouped = table.groupby(list(grouping))[column]
+        else:
+            grouped = [((), table[column])]
+        for key, values in grouped:
+            if not isinstance(key, tuple):
+                key = (key, )
+            labels = dict(zip(grouping, key))
+            group = tuple(labels.get(col, 'All') for col in columns)
+            groups.setdefault(len(values), []).append((group, values.values))
+
+    # Groups of every size are resampled over one pool of processes
+    sizes = sorted(groups)
+    datasets = [np.array([values for _, values in groups[n]]) for n in sizes]
+    resamples = resample_datasets(datasets, num_samples, functions, seed, processes)
+
+    rows = []
+    for n, samples in zip(sizes, resamples):
+        dists = np.sort(samples, axis=-1)
+
+        for i, (group, values) in enumerate(groups[n]):
+            for j, (name, statistic) in enumerate(zip(names, functions)):
+                dist = dists[j, i]
+                ci_low, ci_high = confidence_interval(values, dist, statistic, alpha, method)
+                rows.append(group + (name, n, statistic(values), np.mean(dist), ci_low, ci_high))
+
+    results = pd.DataFrame(rows, columns=columns + ['statistic', 'n', 'value', 'mean', 'ci_low', 'ci_high'])
+
+    return results.sort_values(columns + ['statistic']).reset_index(drop=True)
@@ -0,0 +1,238 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import numpy as np
+import pandas as pd
+
+# A compact store of the Players table of ff_db is saved next to it, in the
+# directory ff_db + STORE_SUFFIX
+STORE_SUFFIX = '.compact'
+CHUNK_SIZE = 100000 # rows read from ff_db at once while building a store
+
+# Columns of the store. String columns are dictionary-encoded to the integer
+# codes of their distinct values (-1 for NULL); all columns are saved as
+# fixed-width NumPy arrays that are memory-mapped when the store is opened.
+column_dtypes = {'league_id': 'int32',
+                 'season_id': 'int16',
+                 'week': 'int16',
+                 'team_id': 'int16',
+                 'slot': 'int16',
+                 'position': 'int16',
+                 'team': 'int16',
+                 'player': 'int32',
+                 'projected_points': 'float64',
+                 'actual_points': 'float64'}
+encoded_columns = ['slot', 'position', 'team', 'player']
+store_columns = ['league_id', 'season_id', 'week', 'team_id', 'slot', 'position',
+                 'team', 'player', 'projected_points', 'actual_points']
+
+
+def store_path(ff_db):
+    """
+    Directory of the compact store of ff_db.
+    """
+    return ff_db + STORE_SUFFIX
+
+
+def source_version(cur):
+    """
+    Number of rows and largest id of the Players table. Any write by the
+    scrapers changes one of them, since rewritten rows get new ids.
+    """
+    cur.execute('SELECT COUNT(*), MAX(id) FROM Players')
+
+    return list(cur.fetchone())
+
+
+def build_store(ff_db, path=None):
+    """
+    Build the compact store of the Players table of ff_db at path (by default
+    store_path(ff_db)), replacing any store already there. Rows are sorted by
+    league_id, season_id, week and team_id, so the rows of a week are
+    contiguous and loading a season only touches its own pages. Returns the
+    number of rows stored.
+    """
+    if path is None:
+        path = store_path(ff_db)
+
+    conn = sqlite3.connect(ff_db)
+    cur = conn.cursor()
+
+    version = source_version(cur)
+    num_rows = version[0]
+
+    # Build in a temporary directory that replaces the old store when done
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    arrays = dict((column, np.lib.format.open_memmap(os.path.join(tmp_path, column + '.npy'), 'w+', column_dtypes[column], (num_rows, )))
+                  for column in store_columns)
+    codes = dict((column, {}) for column in encoded_columns)
+
+    cur.execute('''SELECT %s FROM Players
+        ORDER BY league_id, season_id, week, team_id, id''' % ', '.join(store_columns))
+
+    start = 0
+    while True:
+        rows = cur.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        stop = start + len(rows)
+        for i, column in enumerate(store_columns):
+            values = [row[i] for row in rows]
+            if column in encoded_columns:
+                code = codes[column]
+                values = [-1 if value is None else code.setdefault(value, len(code)) for value in values]
+            arrays[column][start:stop] = values
+        start = stop
+
+    conn.close()
+
+    # Rows of each (league_id, season_id, week) partition
+    keys = np.column_stack([arrays['league_id'], arrays['season_id'], arrays['week']])
+    bounds = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+    starts = np.concatenate([[0], bounds]) if num_rows else np.array([], dtype=int)
+    stops = np.concatenate([bounds, [num_rows]]) if num_rows else np.array([], dtype=int)
+    partitions = [[int(val) for val in keys[first]] + [int(first), int(last)] for first, last in zip(starts, stops)]
+
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    meta = {'rows': num_rows,
+            'version': version,
+            'partitions': partitions,
+            'dictionaries': dict((column, sorted(code, key=code.get)) for column, code in codes.items())}
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+    return num_rows
+
+
+def open_store(path):
+    """
+    Open a compact store. Returns a dict of its metadata, with the arrays of
+    each column memory-mapped read-only in a 'columns' dict. Pages of the
+    arrays are shared by all processes that open the store.
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        store = json.load(f)
+
+    store['columns'] = dict((column, np.load(os.path.join(path, column + '.npy'), mmap_mode='r'))
+                            for column in store_columns)
+
+    return store
+
+
+def is_current(ff_db, store):
+    """
+    Check whether a store opened with open_store still matches the Players
+    table of ff_db.
+    """
+    conn = sqlite3.connect(ff_db)
+    version = source_version(conn.cursor())
+    conn.close()
+
+    return version == store['version']
+
+
+def select_rows(store, weeks=None, league_id=None, season_id=None):
+    """
+    Indices of the rows of a store for a set of weeks, a league_id and a
+    season_id (all of them if None), from its partition bounds.
+    """
+    ranges = [np.arange(start, stop) for league, season, week, start, stop in store['partitions']
+              if (league_id is None or league == league_id)
+              and (season_id is None or season == season_id)
+              and (weeks is None or week in weeks)]
+
+    return np.concatenate(ranges) if ranges else np.array([], dtype=int)
+
+
+def encode(store, column, value):
+    """
+    Code of a value of a dictionary-encoded column (-2, which matches no rows,
+    if the value doesn't occur).
+    """
+    values = store['dictionaries'][column]
+
+    return values.index(value) if value in values else -2
+
+
+def decode(store, column, codes):
+    """
+    Strings of an array of codes of a dictionary-encoded column.
+    """
+    values = np.array(store['dictionaries'][column] + [None], dtype=object)
+
+    return values[codes] # code -1 is the None at the end
+
+
+def current_store(ff_db):
+    """
+    Open the compact store of ff_db. Returns None if ff_db has no compact store,
+    or if the Players table changed since the store was built, so callers can
+    fall back to reading ff_db.
+    """
+    path = store_path(ff_db)
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+
+    store = open_store(path)
+    if not is_current(ff_db, store):
+        return None
+
+    return store
+
+
+def load_players(ff_db, weeks=None, league_id=None, season_id=None, columns=None):
+    """
+    Load columns of the Players table of ff_db (all columns of the store if
+    None) from its compact store, optionally only for a set of weeks, a
+    league_id and a season_id. Returns None if there is no up-to-date compact
+    store (see current_store).
+    """
+    store = current_store(ff_db)
+    if store is None:
+        return None
+
+    if weeks is not None:
+        weeks = set(int(week) for week in weeks)
+    idx = select_rows(store, weeks, league_id, season_id)
+
+    players = pd.DataFrame()
+    for column in columns or store_columns:
+        values = store['columns'][column][idx]
+        if column in encoded_columns:
+            values = decode(store, column, values)
+        elif column_dtypes[column].startswith('int'):
+            values = values.astype(np.int64)
+        players[column] = values
+
+    return players
+
+
+def main():
+    """
+    Build the compact store of a database from the command line:
+
+    python compact_store.py DATABASE
+    """
+    ff_db = sys.argv[1]
+
+    num_rows = build_store(ff_db)
+    print '{} player rows saved to {}'.format(num_rows, store_path(ff_db))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
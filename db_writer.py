@@ -0,0 +1,105 @@
+import itertools
+import sqlite3
+import time
+from contextlib import contextmanager
+import metrics
+
+# Pragmas applied to every connection opened for writing. WAL journaling with
+# synchronous=NORMAL only syncs to disk at checkpoints instead of on every
+# commit. Use synchronous='FULL' for maximum durability.
+JOURNAL_MODE = 'WAL'
+SYNCHRONOUS = 'NORMAL'
+BATCH_SIZE = 1000 # rows written per transaction
+
+# Seconds a write waits for another connection (e.g. a scraper running at the
+# same time) to finish writing before giving up
+TIMEOUT = 60
+
+
+def connect(ff_db, journal_mode=None, synchronous=None):
+    """
+    Open a long-lived connection to ff_db for bulk writes.
+    """
+    conn = sqlite3.connect(ff_db, timeout=TIMEOUT)
+    cur = conn.cursor()
+    cur.execute('PRAGMA journal_mode = {}'.format(journal_mode or JOURNAL_MODE))
+    cur.execute('PRAGMA synchronous = {}'.format(synchronous or SYNCHRONOUS))
+
+    return conn
+
+
+@contextmanager
+def transaction(conn):
+    """
+    Run the body of a with statement in a transaction, like 'with conn:', which
+    is committed if the body succeeds and rolled back if it raises. The time
+    spent executing the statements and committing them are recorded
+    separately (see metrics).
+    """
+    start = time.time()
+    try:
+        yield
+    except Exception:
+        conn.rollback()
+        raise
+    metrics.observe('db.execute', time.time() - start)
+
+    with metrics.timer('db.commit'):
+        conn.commit()
+
+
+def write_rows(conn, sqlstr, rows, batch_size=None):
+    """
+    Write rows (a list or generator of parameter tuples for sqlstr) with
+    executemany. Each batch of batch_size rows is written in a single
+    transaction, so only batch_size rows are held in memory at once. A
+    batch_size of 0 writes all rows in one transaction. Returns the number of
+    rows written.
+    """
+    if batch_size is None:
+        batch_size = BATCH_SIZE
+
+    rows = iter(rows)
+    count = 0
+
+    while True:
+        if batch_size:
+            batch = list(itertools.islice(rows, batch_size))
+        else:
+            batch = list(rows)
+        if not batch:
+            break
+
+        with transaction(conn):
+            conn.executemany(sqlstr, batch)
+        count += len(batch)
+        metrics.count('db.rows', len(batch))
+
+        if not batch_size:
+            break
+
+    return count
+
+
+def page_batches(pages, batch_size=None):
+    """
+    Group (key, rows) tuples into lists holding at least batch_size rows (the
+    last list may hold fewer), so all rows of a key are always written in the
+    same transaction.
+    """
+    if batch_size is None:
+        batch_size = BATCH_SIZE
+
+    batch = []
+    count = 0
+
+    for key, rows in pages:
+        batch.append((key, rows))
+        count += len(rows)
+        if count >= batch_size:
+            yield batch
+            batch = []
+            count = 0
+
+    if batch:
+        yield batch
@@ -1,14 +1,90 @@
 import sys
 import os
+import multiprocessing
 import numpy as np
-import numpy.random as npr
 import pandas as pd
 import sqlite3
-import scipy as sp
 import scipy.stats
 from matplotlib import pylab as plt
+import bootstrap_engine
+import compact_store
+import metrics
+import parquet_store
 
 
+def relative_error_query(position_filter=None, slot_filter=None):
+    """
+    SQL query (and its parameters) for the relative projection error of player
+    scores, with BYE week and injured players (projected points of 0) and the
+    position and slot filters of get_relative_errors applied in the database.
+    """
+    # projected_points may be stored as an integer, so cast to avoid integer
+    # division
+    sqlstr = '''SELECT (CAST(Players.projected_points AS REAL) - Players.actual_points)
+        / Players.projected_points AS error
+        FROM Players WHERE Players.projected_points != 0'''
+    params = []
+
+    if position_filter is not None:
+        sqlstr += ' AND Players.position = ?'
+        params.append(position_filter)
+
+    if slot_filter is not None:
+        sqlstr += ' AND Players.slot != ?'
+        params.append(slot_filter)
+
+    return sqlstr, params
+
+
+def iter_relative_errors(ff_db, position_filter=None, slot_filter=None, chunksize=100000):
+    """
+    Generate arrays of at most chunksize relative projection errors, with the
+    same filters as get_relative_errors, so errors can be processed without
+    loading them all into memory at once. ff_db may also be a Parquet store
+    (see parquet_store), which is read one partition (league, season and week)
+    at a time. If ff_db has an up-to-date compact store (see compact_store),
+    errors are calculated from its arrays, with filters matched on codes.
+    """
+    store = None if parquet_store.is_store(ff_db) else compact_store.current_store(ff_db)
+    if store is not None:
+        columns = store['columns']
+        position_code = compact_store.encode(store, 'position', position_filter)
+        slot_code = compact_store.encode(store, 'slot', slot_filter)
+        for start in xrange(0, store['rows'], chunksize):
+            chunk = slice(start, start + chunksize)
+            projected = columns['projected_points'][chunk]
+            actual = columns['actual_points'][chunk]
+            keep = (projected != 0) & ~np.isnan(projected)
+            if position_filter is not None:
+                keep &= columns['position'][chunk] == position_code
+            if slot_filter is not None:
+                keep &= (columns['slot'][chunk] != slot_code) & (columns['slot'][chunk] != -1)
+            yield (projected[keep] - actual[keep]) / projected[keep]
+        return
+
+    if parquet_store.is_store(ff_db):
+        for league_id, season_id, week in parquet_store.partitions(ff_db, 'Players'):
+            players = parquet_store.read_table(ff_db, 'Players', ['position', 'slot', 'projected_points', 'actual_points'], league_id, season_id, [week])
+            keep = (players['projected_points'] != 0) & players['projected_points'].notnull()
+            if position_filter is not None:
+                keep &= players['position'] == position_filter
+            if slot_filter is not None:
+                # Like Players.slot != ? in SQL, a missing slot never matches
+                keep &= players['slot'].notnull() & (players['slot'] != slot_filter)
+            players = players.loc[keep, :]
+            yield ((players['projected_points'] - players['actual_points']) / players['projected_points']).values
+        return
+
+    conn = sqlite3.connect(ff_db)
+
+    sqlstr, params = relative_error_query(position_filter, slot_filter)
+    for chunk in pd.read_sql_query(sqlstr, conn, params=params, chunksize=chunksize):
+        yield chunk['error'].values
+
+    conn.close()
+
+
+@metrics.timed('analysis.relative_errors')
 def get_relative_errors(ff_db, position_filter=None, slot_filter=None):
     """
     Calculate the relative projection error for all relevent player scores saved
@@ -16,68 +92,112 @@ def get_relative_errors(ff_db, position_filter=None, slot_filter=None):
     to get errors for that position only. Default is to get errors for all
     positions. Set slot_filter to 'Bench' to get errors only for starters.
     Default is to get errors for starters and bench players.
+
+    Filtering and the error calculation are done in the database, and only the
+    error column is loaded.
     """
+    chunks = list(iter_relative_errors(ff_db, position_filter, slot_filter))
+    if not chunks:
+        return np.array([])
+
+    errors = np.concatenate(chunks)
+
+    return errors
+
+
+def error_table_query():
+    """
+    SQL query for the week, position, role and relative projection error of
+    player scores, with BYE week and injured players (projected points of 0)
+    left out (see get_error_table).
+    """
+    return '''SELECT Players.week, Players.position,
+        CASE WHEN Players.slot = 'Bench' THEN 'Bench' ELSE 'Starter' END AS role,
+        (CAST(Players.projected_points AS REAL) - Players.actual_points)
+        / Players.projected_points AS error
+        FROM Players WHERE Players.projected_points != 0'''
+
+
+def get_error_table(ff_db):
+    """
+    Calculate the relative projection error for all relevent player scores saved
+    in ff_db. Returns a DataFrame with the week, position, role ('Starter' or
+    'Bench') and error of each player score, for analysis of many positions and
+    slots at once (see bias_breakdown). ff_db may also be a Parquet store, and
+    players are read from the compact store of ff_db if it has an up-to-date
+    one.
+    """
+    columns = ['week', 'position', 'slot', 'projected_points', 'actual_points']
+    if parquet_store.is_store(ff_db):
+        players = parquet_store.read_table(ff_db, 'Players', columns)
+    else:
+        players = compact_store.load_players(ff_db, columns=columns)
+
+    if players is not None:
+        players = players.loc[(players['projected_points'] != 0) & players['projected_points'].notnull(), :].reset_index(drop=True)
+        players['role'] = np.where(players['slot'] == 'Bench', 'Bench', 'Starter')
+        players['error'] = (players['projected_points'] - players['actual_points']) / players['projected_points']
+        return players[['week', 'position', 'role', 'error']]
+
     conn = sqlite3.connect(ff_db)
-    cur = conn.cursor()
 
-    sqlstr = '''SELECT Players.slot, Players.position, Players.projected_points,
-        Players.actual_points FROM Players'''
-    players = pd.read_sql_query(sqlstr, conn)
+    players = pd.read_sql_query(error_table_query(), conn)
 
-    players['error'] = (players['projected_points'] - players['actual_points']) / players['projected_points']
+    conn.close()
 
-    # eliminate BYE week and injured players from analysis
-    players = players.ix[players['projected_points']!=0, :].reset_index(drop=True)
+    return players[['week', 'position', 'role', 'error']]
 
-    if position_filter is not None:
-        players = players.ix[players['position']==position_filter, :].reset_index(drop=True)
 
-    if slot_filter is not None:
-        players = players.ix[players['slot']!=slot_filter, :].reset_index(drop=True)
+@metrics.timed('analysis.bias_breakdown')
+def bias_breakdown(ff_db, num_samples=10000, alpha=0.05, by_week=False, seed=0, processes=1, method='percentile'):
+    """
+    Bootstrap the mean and median relative projection error, with 100.0*(1-alpha)
+    CIs, for all players and broken down by position, by role (starter/bench)
+    and by position and role. Set by_week to also break each of these down by
+    week. Every breakdown comes out of a single call of
+    bootstrap_engine.bootstrap_groups. Returns a DataFrame with one row per group
+    and statistic.
+    """
+    errors = get_error_table(ff_db)
 
-    errors = players['error'].values
+    groupings = [(), ('position', ), ('role', ), ('position', 'role')]
+    if by_week:
+        groupings += [grouping + ('week', ) for grouping in groupings]
 
-    return errors
+    return bootstrap_engine.bootstrap_groups(errors, 'error', groupings, num_samples,
+                                             {'mean': np.mean, 'median': np.median},
+                                             alpha, seed, processes, method)
 
 
-def bootstrap(data, num_samples, statistic, alpha):
+def bootstrap(data, num_samples, statistic, alpha, seed=None, processes=1, method='percentile'):
     """
     Implementation of bootstrap sampling that returns the following:
     (1) Distiubution of statistic
     (2) Mean statisitic
     (3) 100.0*(1-alpha) CI for statistic (low)
     (4) 100.0*(1-alpha) CI for statistic (high)
-    """
-    n = len(data)
-    idx = npr.randint(0, n, (num_samples, n))
-    samples = data[idx]
-    stat = np.sort(statistic(samples, 1))
 
-    return stat, np.mean(stat), stat[int((alpha/2.0)*num_samples)], stat[int((1-alpha/2.0)*num_samples)]
+    Resamples are drawn in fixed-size chunks, so memory use doesn't grow with
+    num_samples. See bootstrap_engine for the seed, processes and method ('bca'
+    or 'percentile') options, and for bootstrapping several statistics at once.
+    """
+    return bootstrap_engine.bootstrap_statistics(data, num_samples, [statistic], alpha, seed, processes, method)[0]
 
 
-def main():
+def make_bias_report(ff_db, position_filter=None, slot_filter=None, out_dir=None, processes=1):
     """
-    User-specified parameters:
-    (1) ff_db: name of database to extract data from
-    (2) position_filter: filters data by position
-    (3) slot_filter: filters data by starter/bench designation
-
-    Returns:
-    (1) Creates 'figures' directory in current working directory (if it doesn't
-        already exist)
-    (2) Generates a figure that contains subplots with the following
-        information: (a) distribution of realtive errors, (b) distribution of
-        mean realtive errors (bootstrapped) with 95% CI and (c) distribution of
-        median relative errors (bootstrapped) with 95% CI
+    Save the figure and table of main, for the players of ff_db matching
+    position_filter and slot_filter, to 'figures' and 'tables' directories in
+    out_dir (the current working directory by default). Returns the figure.
     """
-    ff_db = 'DATABASE_NAME.sqlite'
-    position_filter=None
-    slot_filter=None
+    out_dir = out_dir or os.getcwd()
 
     errors = get_relative_errors(ff_db, position_filter, slot_filter)
-    dist_mean, m_mean, ci_low_mean, ci_high_mean = bootstrap(errors, 10000, np.mean, 0.05)
-    dist_median, m_median, ci_low_median, ci_high_median = bootstrap(errors, 10000, np.median, 0.05)
+
+    # Bootstrap the mean and median from the same resamples
+    results = bootstrap_engine.bootstrap_statistics(errors, 10000, [np.mean, np.median], 0.05, seed=0, processes=processes)
+    dist_mean, m_mean, ci_low_mean, ci_high_mean = results[0]
+    dist_median, m_median, ci_low_median, ci_high_median = results[1]
 
     fig, ax = plt.subplots(nrows=1, ncols=3, facecolor='white')
     fig.tight_layout()
@@ -103,15 +223,51 @@ def main():
     ax[2].set_title('95% CI: (' + '{0:.3f}'.format(ci_low_median) + ', ' + '{0:.3f}'.format(ci_high_median) + ')', fontsize=10)
 
     # Make a directory for saving figures if it doesn't already exist
-    if not os.path.exists('figures'):
-        os.makedirs('figures')
+    if not os.path.exists(out_dir + '/figures'):
+        os.makedirs(out_dir + '/figures')
+
+    fig.savefig(out_dir + '/figures/espn_projection_bias.png' ,dpi=300)
+
+    # Bias for every position and starter/bench combination
+    if not os.path.exists(out_dir + '/tables'):
+        os.makedirs(out_dir + '/tables')
+
+    breakdown = bias_breakdown(ff_db, 10000, 0.05, processes=processes)
+    breakdown.to_csv(out_dir + '/tables/espn_projection_bias.csv', index=False)
+
+    return fig
+
+
+def main():
+    """
+    User-specified parameters:
+    (1) ff_db: name of database to extract data from
+    (2) position_filter: filters data by position
+    (3) slot_filter: filters data by starter/bench designation
+
+    Returns:
+    (1) Creates 'figures' directory in current working directory (if it doesn't
+        already exist)
+    (2) Generates a figure that contains subplots with the following
+        information: (a) distribution of realtive errors, (b) distribution of
+        mean realtive errors (bootstrapped) with 95% CI and (c) distribution of
+        median relative errors (bootstrapped) with 95% CI
+    (3) Creates 'tables' directory in current working directory (if it doesn't
+        already exist)
+    (4) Saves the mean and median relative errors with 95% CIs for all players,
+        each position, starters/bench and each position's starters/bench to the
+        'tables' directory
+    """
+    ff_db = 'DATABASE_NAME.sqlite'
+    position_filter=None
+    slot_filter=None
 
-    cwd = os.getcwd()
-    fig.savefig(cwd + '/figures/espn_projection_bias.png' ,dpi=300)
+    make_bias_report(ff_db, position_filter, slot_filter, processes=multiprocessing.cpu_count())
 
     plt.show()
 
 
 if __name__ == '__main__':
+    metrics.enable_from_argv()
     main()
     sys.exit(0)
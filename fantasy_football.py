@@ -0,0 +1,205 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import matplotlib
+matplotlib.use('Agg')
+import espn_projection_bias
+import job_graph
+import league_settings
+import matchups_table
+import metrics
+import page_cache
+import page_fetcher
+import players_table
+import score_analysis
+import season_simulator
+import slots_table
+import teams_table
+
+# Jobs of each pool running at once. Scraping jobs mostly wait on ESPN, so
+# several run together (sharing one rate limit). Analysis jobs already spread
+# their work over every CPU core, so they run one at a time.
+SCRAPE_JOBS = 4
+ANALYSIS_JOBS = 1
+
+
+def parse_weeks(text):
+    """
+    List of the weeks in a week (e.g. '3') or an inclusive range of weeks
+    (e.g. '1-13').
+    """
+    try:
+        if '-' in text:
+            first, last = [int(week) for week in text.split('-')]
+            return range(first, last+1)
+        return [int(text)]
+    except ValueError:
+        raise argparse.ArgumentTypeError('{} is not a week or a range of weeks'.format(text))
+
+
+def positive_int(text):
+    """
+    An integer of at least 1 (e.g. a number of workers).
+    """
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError('{} is not an integer of at least 1'.format(text))
+
+    return value
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments in argv (sys.argv by default).
+    """
+    parser = argparse.ArgumentParser(
+        description='Scrape and analyze ESPN fantasy football league-seasons.',
+        epilog='Pass {} (or {}=LOG_FILE) to record metrics of the run (see metrics.py).'.format(metrics.FLAG, metrics.FLAG))
+    parser.add_argument('ff_db', help='database to save data to and analyze')
+    parser.add_argument('-l', '--leagues', type=int, nargs='+', required=True, help='ids of ESPN FF leagues')
+    parser.add_argument('-s', '--seasons', type=int, nargs='+', required=True, help='years of FF seasons')
+    parser.add_argument('-w', '--weeks', type=parse_weeks, nargs='+', required=True,
+                        help='matchup weeks, e.g. 1-13 or 1 2 3')
+    parser.add_argument('-o', '--output', default=None,
+                        help='directory for figures and tables (current working directory by default)')
+    parser.add_argument('--no-scrape', dest='scrape', action='store_false', help='only analyze data already in ff_db')
+    parser.add_argument('--no-analysis', dest='analysis', action='store_false', help='only scrape data')
+    parser.add_argument('--no-sync', dest='sync', action='store_false', help='fetch weeks already final in ff_db again')
+    parser.add_argument('--current-week', type=int, default=None,
+                        help='first week that isn\'t final, before which every week is final (worked out from the date by default)')
+    parser.add_argument('--jobs', type=positive_int, default=SCRAPE_JOBS, help='scraping jobs run at once')
+    parser.add_argument('--max-workers', type=positive_int, default=8, help='pages fetched at once by each players job')
+    parser.add_argument('--requests-per-second', type=float, default=10,
+                        help='limit on requests made to ESPN by all jobs together (0 for no limit)')
+    parser.add_argument('--processes', type=positive_int, default=multiprocessing.cpu_count(),
+                        help='processes used by each analysis job')
+    parser.add_argument('--preview-dpi', type=int, default=None, help='resolution of previews of the figures')
+    parser.add_argument('--num-schedules', type=int, default=10000,
+                        help='random schedules for schedule luck standings')
+    parser.add_argument('--num-seasons', type=int, default=10000,
+                        help='simulated seasons for playoff odds (0 to skip the simulation)')
+    parser.add_argument('--playoff-teams', type=int, default=4, help='teams making the playoffs')
+    parser.add_argument('--byes', type=int, default=0, help='playoff teams with a first round bye')
+
+    args = parser.parse_args(argv)
+    args.weeks = sorted(set(week for weeks in args.weeks for week in weeks))
+
+    return args
+
+
+def league_season_dir(output, league_id, season_id):
+    """
+    Directory the figures and tables of a league-season are saved to.
+    """
+    return os.path.join(output or os.getcwd(), str(league_id), str(season_id))
+
+
+def add_league_season(graph, args, league_id, season_id, limiter):
+    """
+    Add the jobs scraping and analyzing a league-season to graph:
+
+    settings -> teams, matchups, players
+    slots
+    slots, teams, matchups, players -> report, playoff_odds
+
+    Returns the name of the players job (None if data isn't scraped).
+    """
+    ff_db = args.ff_db
+    weeks = args.weeks
+    name = '{}:{}'.format(league_id, season_id)
+    data = []
+    players = None
+
+    if args.scrape:
+        settings = graph.add('settings:' + name, lambda: league_settings.get_num_teams(league_id, season_id), pool='scrape')
+        data.append(graph.add('slots:' + name, lambda: slots_table.scrape_slots(ff_db, league_id, season_id),
+                              pool='scrape'))
+        data.append(graph.add('teams:' + name,
+                              lambda num_teams: teams_table.scrape_teams(ff_db, league_id, season_id, num_teams),
+                              [settings], pool='scrape'))
+        data.append(graph.add('matchups:' + name,
+                              lambda num_teams: matchups_table.scrape_matchups(ff_db, league_id, season_id, num_teams),
+                              [settings], pool='scrape'))
+
+        # The players job fans out over every week and team_id in the
+        # pipeline of players_table
+        def scrape_players(num_teams):
+            stream = players_table.scrape_players(ff_db, league_id, season_id, weeks, num_teams, args.max_workers,
+                                                  sync=args.sync, limiter=limiter, current_week=args.current_week)
+            print '\nPlayers of {}\n{}'.format(name, stream.report())
+
+        players = graph.add('players:' + name, scrape_players, [settings], pool='scrape')
+        data.append(players)
+
+    if args.analysis:
+        out_dir = league_season_dir(args.output, league_id, season_id)
+        graph.add('report:' + name,
+                  lambda *_: score_analysis.make_report(ff_db, league_id, season_id, weeks, out_dir=out_dir,
+                                                        processes=args.processes, preview_dpi=args.preview_dpi,
+                                                        num_schedules=args.num_schedules),
+                  data, pool='analysis')
+        if args.num_seasons:
+            graph.add('playoff_odds:' + name,
+                      lambda *_: season_simulator.save_playoff_odds(ff_db, league_id, season_id, weeks[-1], out_dir,
+                                                                    args.num_seasons, args.playoff_teams, args.byes,
+                                                                    args.processes),
+                      data, pool='analysis')
+
+    return players
+
+
+def build_graph(args):
+    """
+    Graph (see job_graph.JobGraph) of the jobs scraping and analyzing every
+    league-season of args. All jobs fetching pages share one rate limit. The
+    projection bias of all players in ff_db is analyzed once all players jobs
+    are done.
+    """
+    graph = job_graph.JobGraph({'scrape': args.jobs, 'analysis': ANALYSIS_JOBS})
+    limiter = page_fetcher.HostRateLimiter(args.requests_per_second or None)
+
+    players = []
+    for league_id in args.leagues:
+        for season_id in args.seasons:
+            players.append(add_league_season(graph, args, league_id, season_id, limiter))
+
+    def projection_bias(*_):
+        fig = espn_projection_bias.make_bias_report(args.ff_db, out_dir=args.output, processes=args.processes)
+        espn_projection_bias.plt.close(fig)
+
+    if args.analysis:
+        graph.add('projection_bias', projection_bias, [name for name in players if name is not None],
+                  pool='analysis')
+
+    return graph
+
+
+def main():
+    """
+    Scrape and analyze league-seasons from the command line, e.g.:
+
+    python fantasy_football.py DATABASE_NAME.sqlite --leagues 123456 --seasons 2017 --weeks 1-13
+
+    Runs every job of build_graph, with independent jobs at the same time.
+    Exits with status 1 if any job failed.
+    """
+    args = parse_args()
+
+    graph = build_graph(args)
+    graph.run()
+
+    print '\n' + graph.report()
+    if args.scrape:
+        page_cache.flush()
+        print page_cache.report()
+
+    return 1 if graph.failed() else 0
+
+
+if __name__ == '__main__':
+    metrics.enable_from_argv()
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import Queue
+import sys
+import threading
+import time
+import traceback
+import metrics
+
+POLL_INTERVAL = 0.1 # seconds between checks for finished jobs
+
+
+class JobGraph(object):
+    """
+    Run a graph of jobs with dependencies, each job as soon as all jobs it
+    depends on have finished. Independent jobs run concurrently in threads.
+    Every job belongs to a pool, and workers is a dict of the most jobs of
+    each pool running at once (e.g. many scraping jobs waiting on ESPN, but one
+    analysis job at a time, as it already uses every CPU core). Jobs that are
+    ready at the same time start in the order they were added.
+
+    If a job raises, its traceback is printed and the jobs depending on it are
+    skipped, but independent jobs keep running.
+    """
+    def __init__(self, workers):
+        for pool, num in workers.items():
+            if num < 1:
+                raise ValueError('Pool {} needs at least 1 worker, not {}'.format(pool, num))
+
+        self.workers = workers
+        self.jobs = {}
+        self.order = []
+        self.status = {}
+        self.results = {}
+        self.errors = {}
+        self.seconds = {}
+        self.elapsed = 0.0
+
+    def add(self, name, func, deps=(), pool=None):
+        """
+        Add a job calling func with the results of the jobs named in deps as
+        arguments, in the order of deps. Jobs can only depend on jobs added
+        before them, so the graph never has cycles. pool defaults to the first
+        pool in workers, in sorted order. Returns name.
+        """
+        if name in self.jobs:
+            raise ValueError('Job {} added twice'.format(name))
+        for dep in deps:
+            if dep not in self.jobs:
+                raise ValueError('Job {} depends on unknown job {}'.format(name, dep))
+        if pool is None:
+            pool = sorted(self.workers)[0]
+        if pool not in self.workers:
+            raise ValueError('Job {} is in unknown pool {}'.format(name, pool))
+
+        self.jobs[name] = {'func': func, 'deps': list(deps), 'pool': pool}
+        self.order.append(name)
+
+        return name
+
+    def run(self):
+        """
+        Run all jobs and return a dict of the results of the jobs that
+        succeeded. The status of every job ('done', 'failed' or 'skipped') is
+        kept in status, and the exc_info of every failed job in errors.
+        """
+        finished = Queue.Queue()
+        running = dict((pool, 0) for pool in self.workers)
+        waiting = list(self.order)
+        start = time.time()
+
+        def work(name):
+            job = self.jobs[name]
+            args = [self.results[dep] for dep in job['deps']]
+            began = time.time()
+            try:
+                result, error = job['func'](*args), None
+            except Exception:
+                result, error = None, sys.exc_info()
+            finished.put((name, result, error, time.time() - began))
+
+        while True:
+            # Start every waiting job whose dependencies are done, while its
+            # pool has a free worker. A job depending on a failed or skipped
+            # job is skipped, and since jobs only depend on earlier jobs, one
+            # pass skips every job downstream of a failure.
+            for name in list(waiting):
+                job = self.jobs[name]
+                states = [self.status.get(dep) for dep in job['deps']]
+                if any(state in ('failed', 'skipped') for state in states):
+                    waiting.remove(name)
+                    self.status[name] = 'skipped'
+                    metrics.emit('job', job=name, pool=job['pool'], status='skipped')
+                elif all(state == 'done' for state in states) and running[job['pool']] < self.workers[job['pool']]:
+                    waiting.remove(name)
+                    self.status[name] = 'running'
+                    running[job['pool']] += 1
+                    thread = threading.Thread(target=work, args=(name, ))
+                    thread.daemon = True
+                    thread.start()
+
+            if not any(running.values()):
+                break
+
+            # Wait for a job to finish, waking up now and then so the run can
+            # be interrupted
+            try:
+                name, result, error, seconds = finished.get(timeout=POLL_INTERVAL)
+            except Queue.Empty:
+                continue
+
+            pool = self.jobs[name]['pool']
+            running[pool] -= 1
+            self.seconds[name] = seconds
+            if error is None:
+                self.status[name] = 'done'
+                self.results[name] = result
+            else:
+                self.status[name] = 'failed'
+                self.errors[name] = error
+                print '\nJob {} failed:'.format(name)
+                traceback.print_exception(*error)
+            metrics.emit('job', job=name, pool=pool, status=self.status[name], seconds=round(seconds, 3))
+
+        self.elapsed = time.time() - start
+
+        return self.results
+
+    def failed(self):
+        """
+        Names of the jobs that failed in the last run.
+        """
+        return [name for name in self.order if self.status.get(name) == 'failed']
+
+    def report(self):
+        """
+        Summary of the status and run time of each job of the last run.
+        """
+        counts = dict((state, sum(self.status.get(name) == state for name in self.order))
+                      for state in ['done', 'failed', 'skipped'])
+        lines = ['Jobs: {} done, {} failed, {} skipped in {:.1f} s'.format(
+                 counts['done'], counts['failed'], counts['skipped'], self.elapsed)]
+        for name in self.order:
+            seconds = '{:.1f} s'.format(self.seconds[name]) if name in self.seconds else '-'
+            lines.append('  {:<32} {:<10} {:<8} {:>10}'.format(name, self.jobs[name]['pool'],
+                                                               self.status.get(name, 'not run'), seconds))
+
+        return '\n'.join(lines)
@@ -0,0 +1,61 @@
+import datetime
+from bs4 import BeautifulSoup
+import page_fetcher
+
+# Days after the end of an NFL week (the Tuesday after its Monday game) before
+# its data is final. ESPN applies stat corrections through Thursday, and a late
+# Monday game can end after midnight.
+FINAL_DELAY = 3
+
+
+def load_settings_page(league_id, season_id):
+    """
+    Load the league settings page.
+    """
+    url = '{}/leaguesetup/settings?leagueId={}&seasonId={}'.format(page_fetcher.BASE_URL, league_id, season_id)
+
+    return BeautifulSoup(page_fetcher.fetch_page(url), 'lxml')
+
+
+def get_num_teams(league_id, season_id):
+    """
+    Get the number of teams in the league from the league settings page.
+    """
+    soup = load_settings_page(league_id, season_id)
+    table_settings = soup.find_all('table')
+    table_settings = table_settings[1]
+
+    rows = table_settings.find_all('tr')
+    for row in rows:
+        fields = [val.get_text() for val in row.children if len(val.get_text()) > 0]
+        if fields[0] == "Number of Teams":
+            num_teams = int(fields[1])
+
+    return num_teams
+
+
+def nfl_weeks(season_id):
+    """
+    Number of weeks of the NFL regular season of season_id.
+    """
+    return 17 if season_id < 2021 else 18
+
+
+def get_current_week(season_id, today=None):
+    """
+    First week of the NFL season season_id that isn't final on today (the
+    current date by default). Week 1 starts on the Tuesday after Labor Day (the
+    first Monday of September) and every week lasts seven days. A week is final
+    FINAL_DELAY days after it ends, i.e. on the Friday after its Monday game,
+    once stat corrections are in. Before the season starts this is week 1.
+    Once the season is over, this is the week after its last week, so every
+    week of a completed season is final.
+    """
+    if today is None:
+        today = datetime.date.today()
+
+    september = datetime.date(season_id, 9, 1)
+    labor_day = september + datetime.timedelta(days=(7 - september.weekday()) % 7)
+    week = (today - labor_day - datetime.timedelta(days=1 + FINAL_DELAY)).days // 7 + 1
+
+    return min(max(week, 1), nfl_weeks(season_id) + 1)
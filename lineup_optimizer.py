@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+
+# Player positions eligible for each slot of the Slots table. Slot names are
+# stored without '/' (e.g. 'RB/WR' is 'RBWR'). Slots not listed here only take
+# players of the same position.
+slot_eligibility = {'FLEX': ['RB', 'WR', 'TE'],
+                    'RBWR': ['RB', 'WR'],
+                    'WRTE': ['WR', 'TE'],
+                    'RBWRTE': ['RB', 'WR', 'TE'],
+                    'OP': ['QB', 'RB', 'WR', 'TE'],
+                    'QBRBWRTE': ['QB', 'RB', 'WR', 'TE'],
+                    'DST': ['D/ST'],
+                    'DTDE': ['DT', 'DE'],
+                    'DL': ['DT', 'DE'],
+                    'CBS': ['CB', 'S'],
+                    'DB': ['CB', 'S'],
+                    'DP': ['DT', 'DE', 'LB', 'CB', 'S']}
+
+# Slots that never count towards a team's score
+inactive_slots = ['Bench', 'IR']
+
+
+def lineup_seats(slots):
+    """
+    Expand the Slots table into a list of the individual starting lineup slots
+    ('seats'), e.g. two 'RB' seats for an RB slots value of 2.
+    """
+    seats = []
+    for position, num in zip(slots['position'], slots['slots']):
+        if position not in inactive_slots:
+            seats.extend([position] * int(num))
+
+    return seats
+
+
+def eligible_positions(seat):
+    """
+    Player positions that can fill a seat.
+    """
+    return slot_eligibility.get(seat, [seat])
+
+
+def eligibility_table(seats):
+    """
+    Map each player position to a boolean array of the seats it can fill.
+    """
+    table = {}
+    for i, seat in enumerate(seats):
+        for position in eligible_positions(seat):
+            table.setdefault(position, np.zeros(len(seats), dtype=bool))[i] = True
+
+    return table
+
+
+def is_greedy_exact(seats):
+    """
+    Check whether filling the seats greedily is optimal: every seat takes either
+    a single position, or one shared set of flex positions. The best players of
+    each position then fill the dedicated seats, and the best of the remaining
+    flex-eligible players fill the flex seats.
+    """
+    flex_sets = set(tuple(sorted(eligible_positions(seat))) for seat in seats if len(eligible_positions(seat)) > 1)
+
+    return len(flex_sets) <= 1
+
+
+def optimal_lineup(points, positions, seats, table=None):
+    """
+    Solve for the lineup with the most points for one team and week. points and
+    positions describe the players on the roster, and seats comes from
+    lineup_seats. Every seat that can be filled is filled (even by a player with
+    negative points), and among those lineups the one with the most points is
+    chosen. The assignment is solved exactly with the Hungarian algorithm.
+
+    Returns the best score and a list of (seat, player index) tuples.
+    """
+    if table is None:
+        table = eligibility_table(seats)
+
+    points = np.asarray(points, dtype=float)
+    none = np.zeros(len(seats), dtype=bool)
+    eligible = np.array([table.get(position, none) for position in positions], dtype=bool).reshape(len(points), len(seats)).T
+
+    if not eligible.any():
+        return 0.0, []
+
+    # An offset larger than any lineup score makes filling another seat worth
+    # more than any combination of points. Ineligible pairs cost the same as
+    # leaving the seat empty.
+    offset = np.abs(points).sum() + 1.0
+    cost = np.where(eligible, -(points + offset), 0.0)
+    seat_idx, player_idx = linear_sum_assignment(cost)
+
+    lineup = [(seats[i], j) for i, j in zip(seat_idx, player_idx) if eligible[i, j]]
+    score = sum(points[j] for _, j in lineup)
+
+    return score, lineup
+
+
+def greedy_best_scores(players, seats, keys):
+    """
+    Best lineup score for every group of players in a single vectorized pass.
+    Only valid when is_greedy_exact(seats).
+    """
+    num_seats = pd.Series(seats).value_counts()
+    dedicated = dict((eligible_positions(seat)[0], num) for seat, num in num_seats.iteritems() if len(eligible_positions(seat)) == 1)
+    flex = [seat for seat in num_seats.index if len(eligible_positions(seat)) > 1]
+    num_flex = num_seats[flex].sum() if flex else 0
+    flex_positions = eligible_positions(flex[0]) if flex else []
+
+    group = [players[key] for key in keys]
+
+    # Best players at each position fill the dedicated seats. Players without
+    # a position can't fill any seat, and are left out of the ranking (pandas
+    # can't group by a key that is missing for every player).
+    position_seats = players['position'].map(dedicated).fillna(0).values
+    has_position = players['position'].notnull().values
+    rank = np.full(len(players), np.inf)
+    if has_position.any():
+        ranked = players[has_position]
+        rank[has_position] = ranked.groupby([ranked[key] for key in keys] + [ranked['position']])['actual_points'].rank(method='first', ascending=False).fillna(np.inf).values
+    in_lineup = rank <= position_seats
+
+    # Best of the remaining flex-eligible players fill the flex seats
+    in_flex = players['position'].isin(flex_positions).values & ~in_lineup
+    flex_points = players['actual_points'].where(in_flex)
+    flex_rank = flex_points.groupby(group).rank(method='first', ascending=False).fillna(np.inf).values
+    in_lineup |= in_flex & (flex_rank <= num_flex)
+
+    best_points = pd.Series(np.where(in_lineup, players['actual_points'], 0.0), index=players.index)
+
+    return best_points.groupby(group).sum()
+
+
+def best_scores(players, slots, keys=('team_id', 'week')):
+    """
+    Best lineup score (from actual_points) for every (team_id, week) in
+    players, for any roster slot configuration. Configurations that can be
+    filled greedily are scored in one vectorized pass; all others are solved
+    exactly for each team and week with optimal_lineup.
+
+    Returns a Series indexed by keys.
+    """
+    keys = list(keys)
+    players = players.reset_index(drop=True)
+    seats = lineup_seats(slots)
+
+    if is_greedy_exact(seats):
+        return greedy_best_scores(players, seats, keys)
+
+    table = eligibility_table(seats)
+    points = players['actual_points'].values
+    positions = players['position'].values
+
+    scores = {}
+    for key, idx in players.groupby(keys).indices.iteritems():
+        scores[key] = optimal_lineup(points[idx], positions[idx], seats, table)[0]
+
+    scores = pd.Series(scores)
+    scores.index.names = keys
+
+    return scores
+
+
+def best_lineup(players, slots):
+    """
+    Best lineup for the players of a single team and week. Returns the best
+    score and a DataFrame of the chosen players with the seat each one fills in
+    a best_slot column.
+    """
+    players = players.reset_index(drop=True)
+    seats = lineup_seats(slots)
+    score, lineup = optimal_lineup(players['actual_points'].values, players['position'].values, seats)
+
+    chosen = players.loc[[j for _, j in lineup], :].copy()
+    chosen['best_slot'] = [seat for seat, _ in lineup]
+
+    return score, chosen
@@ -1,40 +1,27 @@
 from __future__ import division
 import sys
 from bs4 import BeautifulSoup
-import requests
-import sqlite3
-
-
-def get_num_teams(league_id, season_id):
-    """
-    Get the number of teams in the league from the league settings page.
-    """
-    url = 'http://games.espn.com/ffl/leaguesetup/settings?leagueId={}&seasonId={}'.format(league_id, season_id)
-    soup = BeautifulSoup(requests.get(url).text, 'lxml')
-    table_settings = soup.find_all('table')
-    table_settings = table_settings[1]
-    rows = table_settings.find_all('tr')
-
-    for row in rows:
-        fields = [val.get_text() for val in row.children if len(val.get_text()) > 0]
-        if fields[0] == "Number of Teams":
-            num_teams = int(fields[1])
-
-    return num_teams
+import league_settings
+import page_cache
+import page_fetcher
+import db_writer
+import metrics
+import schema
 
 
 def load_matchup_page(league_id, season_id):
     """
     Load the league schedule page. Get table for regular season matchups only.
     """
-    url = 'http://games.espn.com/ffl/schedule?leagueId={}&seasonId={}'.format(league_id, season_id)
-    soup = BeautifulSoup(requests.get(url).text, 'lxml')
+    url = '{}/schedule?leagueId={}&seasonId={}'.format(page_fetcher.BASE_URL, league_id, season_id)
+    soup = BeautifulSoup(page_fetcher.fetch_page(url), 'lxml')
     table_matchup = soup.find_all('table')
     table_matchup = table_matchup[1]
 
     return table_matchup
 
 
+@metrics.timed('parse.matchups')
 def parse_matchups(n_matchups, table_matchup):
     """
     Loop through the number of weekly regular season matchups and parse:
@@ -63,42 +50,62 @@ def parse_matchups(n_matchups, table_matchup):
     return matchups
 
 
-def write_matchups_to_db(ff_db, matchups):
+def write_matchups_to_db(ff_db, league_id, season_id, matchups):
     """
-    Write matchup data to database.
+    Write matchup data of a league-season to database in a single transaction.
+    Matchups of the weeks in matchups replace the matchups saved for those
+    weeks.
     """
     print '\nOpening fantasy football database ...'
 
-    conn = sqlite3.connect(ff_db)
+    conn = db_writer.connect(ff_db)
     cur = conn.cursor()
 
-    cur.executescript('''
-    DROP TABLE IF EXISTS Matchups;
-
-    CREATE TABLE Matchups (
-        id  INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
-        week INTEGER,
-        home TEXT,
-        away TEXT
-    );
-    ''')
+    schema.create_table(cur, 'Matchups')
 
     print 'Writing matchup data to database ...'
 
-    for i in range(len(matchups)):
+    rows = [( league_id, season_id, int(matchup['week']), matchup['home'],
+              matchup['away'] ) for matchup in matchups]
+    weeks = sorted(set(( league_id, season_id, week ) for _, _, week, _, _ in rows))
 
-        cur.execute('''INSERT INTO Matchups
-            (week, home, away)
-            VALUES ( ?, ?, ? )''',
-            ( int(matchups[i]['week']), matchups[i]['home'], matchups[i]['away'] ) )
+    # Replace the matchups saved for each week parsed from the schedule
+    with db_writer.transaction(conn):
+        conn.executemany('''DELETE FROM Matchups WHERE Matchups.league_id = ?
+            AND Matchups.season_id = ? AND Matchups.week = ?''', weeks)
+        conn.executemany('''INSERT OR IGNORE INTO Matchups
+            (league_id, season_id, week, home, away)
+            VALUES ( ?, ?, ?, ?, ? )''', rows)
+    metrics.count('db.rows', len(rows))
 
-        conn.commit()
+    # Refresh query planner statistics after the bulk write
+    schema.analyze(cur)
+    conn.commit()
 
     print 'Matchup data written to database!\n'
 
     conn.close()
 
 
+def scrape_matchups(ff_db, league_id, season_id, num_teams=None):
+    """
+    Load, parse and write to ff_db the regular season matchups of a
+    league-season. num_teams is read from the league settings page if not
+    given. Returns the parsed matchups.
+    """
+    if num_teams is None:
+        num_teams = league_settings.get_num_teams(league_id, season_id)
+
+    # Number of weekly matchups
+    n_matchups = num_teams/2
+
+    table_matchup = load_matchup_page(league_id, season_id)
+    matchups = parse_matchups(n_matchups, table_matchup)
+    write_matchups_to_db(ff_db, league_id, season_id, matchups)
+
+    return matchups
+
+
 def main():
     """
     User-specified parameters:
@@ -113,15 +120,13 @@ def main():
     league_id = 000000
     season_id = 0000
 
-    # Get number of teams in the league and calculate number of weekly matchups
-    n_teams = get_num_teams(league_id, season_id)
-    n_matchups = n_teams/2
+    scrape_matchups(ff_db, league_id, season_id)
 
-    table_matchup = load_matchup_page(league_id, season_id)
-    matchups = parse_matchups(n_matchups, table_matchup)
-    write_matchups_to_db(ff_db, matchups)
+    page_cache.flush()
+    print page_cache.report()
 
 
 if __name__ == '__main__':
+    metrics.enable_from_argv()
     main()
     sys.exit(0)
@@ -0,0 +1,165 @@
+import atexit
+import functools
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# Instrumentation of the scrapers and the analysis. It is off unless enabled
+# for a run, e.g. by passing --metrics (or --metrics=LOG_FILE) to a script, in
+# which case every timing and count is appended as a JSON line to LOG_FILE and
+# a summary table is printed when the script exits.
+LOG_FILE = 'metrics.jsonl'
+FLAG = '--metrics'
+
+enabled = False
+
+# Totals of each counter, and every value observed by each timer or histogram
+counters = {}
+histograms = {}
+
+_log = None
+_lock = threading.Lock()
+
+
+def enable(log_file=None):
+    """
+    Turn instrumentation on for the rest of the run, logging to log_file
+    (LOG_FILE by default), and print a summary when the run exits.
+    """
+    global enabled, _log
+
+    if enabled:
+        return
+
+    _log = open(log_file or LOG_FILE, 'a')
+    enabled = True
+    atexit.register(finish)
+
+
+def enable_from_argv(argv=None):
+    """
+    Enable instrumentation if FLAG (optionally FLAG=LOG_FILE) is among the
+    command line arguments in argv (sys.argv by default), removing it so
+    scripts that read their own arguments don't see it.
+    """
+    if argv is None:
+        argv = sys.argv
+
+    for arg in list(argv[1:]):
+        if arg == FLAG or arg.startswith(FLAG + '='):
+            argv.remove(arg)
+            enable(arg[len(FLAG)+1:] or None)
+
+
+def emit(event, **fields):
+    """
+    Append a JSON line for an event, with a timestamp and the given fields, to
+    the log.
+    """
+    if not enabled:
+        return
+
+    fields['event'] = event
+    fields['time'] = round(time.time(), 3)
+    line = json.dumps(fields, sort_keys=True)
+
+    with _lock:
+        _log.write(line + '\n')
+
+
+def count(name, value=1, **fields):
+    """
+    Add value to a counter (e.g. bytes downloaded or rows written).
+    """
+    if not enabled:
+        return
+
+    with _lock:
+        counters[name] = counters.get(name, 0) + value
+    emit('count', name=name, value=value, **fields)
+
+
+def observe(name, value, **fields):
+    """
+    Record one value of a histogram (e.g. the seconds taken by one page
+    fetch).
+    """
+    if not enabled:
+        return
+
+    with _lock:
+        histograms.setdefault(name, []).append(value)
+    emit('observe', name=name, value=round(value, 6), **fields)
+
+
+@contextmanager
+def timer(name, **fields):
+    """
+    Time the body of a with statement and record the seconds in the histogram
+    name. Nothing is recorded if the body raises.
+    """
+    if not enabled:
+        yield
+        return
+
+    start = time.time()
+    yield
+    observe(name, time.time() - start, **fields)
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function in the histogram name.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def summary():
+    """
+    Table of every counter, and the number, total, median, 90th percentile and
+    maximum of the values of every histogram, recorded so far.
+    """
+    with _lock:
+        totals = dict(counters)
+        values = dict((name, np.array(observed)) for name, observed in histograms.items())
+
+    lines = ['{:<28} {:>8} {:>12} {:>10} {:>10} {:>10}'.format('Metric', 'N', 'Total', 'p50', 'p90', 'Max')]
+    for name in sorted(values):
+        observed = values[name]
+        lines.append('{:<28} {:>8} {:>12.3f} {:>10.4f} {:>10.4f} {:>10.4f}'.format(
+            name, len(observed), observed.sum(), np.percentile(observed, 50),
+            np.percentile(observed, 90), observed.max()))
+    for name in sorted(totals):
+        lines.append('{:<28} {:>8} {:>12}'.format(name, '', totals[name]))
+
+    return '\n'.join(lines)
+
+
+def finish():
+    """
+    Log the totals of all metrics, print the summary table and close the log.
+    Registered to run at exit by enable.
+    """
+    global enabled
+
+    if not enabled:
+        return
+
+    with _lock:
+        totals = dict(counters)
+        stats = dict((name, {'n': len(observed), 'total': round(sum(observed), 6)}) for name, observed in histograms.items())
+    emit('summary', counters=totals, histograms=stats)
+
+    print '\n' + summary()
+
+    enabled = False
+    _log.close()
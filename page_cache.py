@@ -0,0 +1,286 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+import urlparse
+
+# Directory of the on-disk page cache. Set to None to disable caching.
+CACHE_DIR = 'page_cache'
+MAX_SIZE = 500 * 1024**2 # bytes of page bodies kept before evicting pages
+
+# Time to live (in seconds) of cached pages. None means pages never expire.
+SEASON_TTL = 180 * 24 * 3600 # league settings and schedule
+TEAM_TTL = 24 * 3600 # team clubhouse pages without a week
+LIVE_TTL = 15 * 60 # weekly pages for the current (or an unknown) week
+PAST_WEEK_TTL = None # weekly pages for weeks before the current week
+
+# Current week of each season being scraped (see set_current_week). Weekly
+# pages of earlier weeks are final and are cached forever.
+current_weeks = {}
+
+# Seconds a write to the index waits for another connection (e.g. another
+# scraper sharing the cache) to finish writing
+INDEX_TIMEOUT = 30
+
+# Lookups keep the time each page was last used in memory, and write the
+# times to the index in batches of ACCESS_BATCH pages (and whenever a page is
+# stored or flush is called), rather than writing to the index on every hit
+ACCESS_BATCH = 100
+
+stats = {'hit': 0, 'miss': 0, 'expired': 0, 'revalidated': 0, 'stored': 0,
+         'evicted': 0}
+
+_lock = threading.Lock()
+
+# Connection to the index of each thread, and the cache directories whose
+# index has been created
+_local = threading.local()
+_created = set()
+
+# Last access times of pages not yet written to the index, keyed by url
+_accessed = {}
+
+
+def set_current_week(week, season_id=None):
+    """
+    Set the current week of the league, i.e. the first week that isn't final
+    yet, for pages of season_id (or of any season without a current week of
+    its own if season_id isn't given).
+    """
+    current_weeks[season_id] = week
+
+
+def ttl_for_url(url):
+    """
+    Time to live of the page at url, based on the ESPN endpoint and the week it
+    is for.
+    """
+    parsed = urlparse.urlparse(url)
+    query = urlparse.parse_qs(parsed.query)
+
+    if parsed.path.endswith('/leaguesetup/settings') or parsed.path.endswith('/schedule'):
+        return SEASON_TTL
+
+    if 'scoringPeriodId' in query:
+        week = int(query['scoringPeriodId'][0])
+        season_id = int(query['seasonId'][0]) if 'seasonId' in query else None
+        current_week = current_weeks.get(season_id, current_weeks.get(None))
+        if current_week is not None and week < current_week:
+            return PAST_WEEK_TTL
+        return LIVE_TTL
+
+    return TEAM_TTL
+
+
+def connect():
+    """
+    Connection to the cache index for this thread. The cache directory and
+    index are created the first time they are used, and each thread opens its
+    connection once and reuses it for every page. Called with _lock held.
+    """
+    if getattr(_local, 'cache_dir', None) == CACHE_DIR:
+        return _local.conn
+
+    index = os.path.join(CACHE_DIR, 'index.sqlite')
+    if CACHE_DIR not in _created:
+        if not os.path.exists(os.path.join(CACHE_DIR, 'objects')):
+            os.makedirs(os.path.join(CACHE_DIR, 'objects'))
+        conn = sqlite3.connect(index, timeout=INDEX_TIMEOUT)
+        conn.execute('''CREATE TABLE IF NOT EXISTS Pages (
+            url TEXT PRIMARY KEY,
+            digest TEXT,
+            size INTEGER,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL,
+            last_access REAL
+        )''')
+        conn.commit()
+        conn.close()
+        _created.add(CACHE_DIR)
+
+    _local.conn = sqlite3.connect(index, timeout=INDEX_TIMEOUT)
+    _local.cache_dir = CACHE_DIR
+
+    return _local.conn
+
+
+def object_path(digest):
+    """
+    Path of the file holding the page body with the given SHA-1 digest.
+    """
+    return os.path.join(CACHE_DIR, 'objects', digest[:2], digest)
+
+
+def write_accesses(conn):
+    """
+    Write the last access times kept in memory to the index. Called with
+    _lock held.
+    """
+    if _accessed:
+        conn.executemany('UPDATE Pages SET last_access = ? WHERE url = ?',
+                         [(accessed, url) for url, accessed in _accessed.items()])
+        conn.commit()
+        _accessed.clear()
+
+
+def flush():
+    """
+    Write the last access times of pages looked up since the last write to the
+    index. Scrapers call this once they are done.
+    """
+    if CACHE_DIR is None:
+        return
+
+    with _lock:
+        write_accesses(connect())
+
+
+def lookup(url):
+    """
+    Look up url in the cache. Returns None if the page isn't cached, otherwise
+    a dict with the cached body, the etag and last_modified validators and
+    whether the page is still fresh. Stale pages should be revalidated with a
+    conditional request. A body that can't be read (e.g. because another
+    thread evicted it in the meantime) counts as a miss.
+    """
+    if CACHE_DIR is None:
+        return None
+
+    with _lock:
+        conn = connect()
+        cur = conn.cursor()
+        cur.execute('''SELECT digest, etag, last_modified, fetched_at FROM Pages
+            WHERE url = ?''', (url, ))
+        row = cur.fetchone()
+
+    # The body is read outside the lock, so lookups of different pages don't
+    # wait for each other
+    body = None
+    if row is not None:
+        try:
+            with io.open(object_path(row[0]), 'r', encoding='utf-8') as f:
+                body = f.read()
+        except (IOError, OSError):
+            pass
+
+    with _lock:
+        if body is None:
+            stats['miss'] += 1
+            return None
+
+        digest, etag, last_modified, fetched_at = row
+        ttl = ttl_for_url(url)
+        now = time.time()
+        fresh = ttl is None or now - fetched_at < ttl
+        if fresh:
+            stats['hit'] += 1
+        else:
+            stats['expired'] += 1
+
+        _accessed[url] = now
+        if len(_accessed) >= ACCESS_BATCH:
+            write_accesses(connect())
+
+    return {'body': body, 'etag': etag, 'last_modified': last_modified,
+            'fresh': fresh}
+
+
+def revalidate(url):
+    """
+    Mark the cached copy of url as fresh after the server reported it has not
+    changed.
+    """
+    if CACHE_DIR is None:
+        return
+
+    with _lock:
+        conn = connect()
+        cur = conn.cursor()
+        now = time.time()
+        cur.execute('''UPDATE Pages SET fetched_at = ?, last_access = ?
+            WHERE url = ?''', (now, now, url))
+        conn.commit()
+        _accessed.pop(url, None)
+        stats['revalidated'] += 1
+
+
+def store(url, body, etag=None, last_modified=None):
+    """
+    Save a page body to the cache. Bodies are stored once per distinct content,
+    so pages with identical HTML share one file.
+    """
+    if CACHE_DIR is None:
+        return
+
+    data = body.encode('utf-8')
+    digest = hashlib.sha1(data).hexdigest()
+
+    with _lock:
+        conn = connect()
+        cur = conn.cursor()
+
+        path = object_path(digest)
+        if not os.path.exists(path):
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            # Write to a temporary file first so a crash never leaves a
+            # truncated body behind
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.rename(path + '.tmp', path)
+
+        now = time.time()
+        cur.execute('''INSERT OR REPLACE INTO Pages
+            (url, digest, size, etag, last_modified, fetched_at, last_access)
+            VALUES ( ?, ?, ?, ?, ?, ?, ? )''',
+            (url, digest, len(data), etag, last_modified, now, now))
+        _accessed.pop(url, None)
+        stats['stored'] += 1
+
+        # Pages are evicted by their last access, so write it first
+        write_accesses(conn)
+        evict(cur)
+        conn.commit()
+
+
+def evict(cur):
+    """
+    Remove the least recently used pages until the bodies kept in the cache
+    take up no more than MAX_SIZE bytes.
+    """
+    cur.execute('SELECT SUM(size) FROM (SELECT DISTINCT digest, size FROM Pages)')
+    total = cur.fetchone()[0] or 0
+    if total <= MAX_SIZE:
+        return
+
+    cur.execute('SELECT url, digest, size FROM Pages ORDER BY last_access')
+    for url, digest, size in cur.fetchall():
+        if total <= MAX_SIZE:
+            break
+        cur.execute('DELETE FROM Pages WHERE url = ?', (url, ))
+        stats['evicted'] += 1
+        # Only delete the body once no other url refers to it
+        cur.execute('SELECT COUNT(*) FROM Pages WHERE digest = ?', (digest, ))
+        if cur.fetchone()[0] == 0:
+            total -= size
+            if os.path.exists(object_path(digest)):
+                os.remove(object_path(digest))
+
+
+def report():
+    """
+    Summary of cache hits and misses since the start of the run.
+    """
+    lookups = stats['hit'] + stats['miss'] + stats['expired']
+    if lookups:
+        hit_rate = 100.0 * (stats['hit'] + stats['revalidated']) / lookups
+    else:
+        hit_rate = 0.0
+
+    return ('Page cache: {} lookups, {} hits, {} misses, {} expired ({} revalidated '
+            'unchanged), {} stored, {} evicted, {:.1f}% served from cache').format(
+            lookups, stats['hit'], stats['miss'], stats['expired'],
+            stats['revalidated'], stats['stored'], stats['evicted'], hit_rate)
@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+import urlparse
+import requests
+import metrics
+import page_cache
+
+# Root of all ESPN Fantasy Football pages. Point this at a local server to run
+# the scrapers against saved pages.
+BASE_URL = 'http://games.espn.com/ffl'
+
+# Settings for the shared HTTP session
+POOL_SIZE = 16 # connections kept alive per host
+TIMEOUT = (5, 30) # (connect, read) timeouts in seconds
+RETRIES = 3 # retries after the first attempt
+BACKOFF = 0.5 # base of the exponential backoff between retries in seconds
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class HostRateLimiter(object):
+    """
+    Limit the number of requests per second made to each host. Threads that
+    request a host too soon after the previous request to that host sleep until
+    their turn comes up. A requests_per_second of None disables rate limiting.
+    """
+    def __init__(self, requests_per_second=None):
+        self.requests_per_second = requests_per_second
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        if not self.requests_per_second:
+            return
+
+        host = urlparse.urlparse(url).netloc
+        interval = 1.0 / self.requests_per_second
+
+        # Reserve the next free slot for this host, then sleep outside the lock
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + interval
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def get_session():
+    """
+    Get the HTTP session shared by all loaders. Connections are pooled and kept
+    alive between requests to the same host.
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+
+    return _session
+
+
+def backoff_delay(attempt):
+    """
+    Delay before retry number attempt (starting at 0): exponential backoff with
+    full jitter.
+    """
+    return random.uniform(0, BACKOFF * 2**attempt)
+
+
+def fetch_page(url):
+    """
+    Fetch a single page and return its text. Pages still fresh in the page
+    cache are returned without a request. Stale pages are revalidated with a
+    request made conditional on their ETag/Last-Modified validators, so pages
+    that haven't changed are not downloaded again. Connection errors, timeouts
+    and server errors are retried up to RETRIES times with jittered backoff.
+    """
+    cached = page_cache.lookup(url)
+    if cached is not None and cached['fresh']:
+        metrics.count('fetch.cached')
+        return cached['body']
+
+    headers = {}
+    if cached is not None:
+        if cached['etag'] is not None:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified'] is not None:
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    session = get_session()
+
+    for attempt in range(RETRIES + 1):
+        start = time.time()
+        try:
+            response = session.get(url, headers=headers, timeout=TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            metrics.count('fetch.errors', url=url)
+            if attempt == RETRIES:
+                raise
+        else:
+            metrics.observe('fetch.latency', time.time() - start, url=url, status=response.status_code)
+            metrics.count('fetch.bytes', len(response.content))
+            if response.status_code not in RETRY_STATUS or attempt == RETRIES:
+                break
+        metrics.count('fetch.retries')
+        time.sleep(backoff_delay(attempt))
+
+    if response.status_code == 304 and cached is not None:
+        page_cache.revalidate(url)
+        return cached['body']
+
+    response.raise_for_status()
+    page_cache.store(url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+    return response.text
+
+
+def fetch_urls(urls, limiter=None):
+    """
+    Fetch a list of pages that belong together one after the other, waiting
+    for their turn with limiter (a HostRateLimiter) if given. Returns the text
+    of the pages in the same order as urls.
+    """
+    pages = []
+    for url in urls:
+        if limiter is not None:
+            limiter.wait(url)
+        pages.append(fetch_page(url))
+
+    return pages
@@ -0,0 +1,194 @@
+import glob
+import os
+import sys
+import sqlite3
+import numpy as np
+import pandas as pd
+import schema
+
+# pyarrow is only needed to export and read Parquet stores
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Columns each table is partitioned by, i.e. the directories of a store:
+# STORE/Players/league_id=.../season_id=.../week=.../part.parquet
+partition_columns = {'Players': ['league_id', 'season_id', 'week'],
+                     'Matchups': ['league_id', 'season_id', 'week'],
+                     'Teams': ['league_id', 'season_id'],
+                     'Slots': ['league_id', 'season_id']}
+
+# Arrow types of the SQLite column types used in schema.tables
+column_types = {'INTEGER': 'int64', 'TEXT': 'string', 'DECIMAL(5,1)': 'float64'}
+
+
+def require_pyarrow():
+    """
+    Raise an ImportError if pyarrow is not installed.
+    """
+    if pq is None:
+        raise ImportError('pyarrow is needed to export and read Parquet stores (pip install pyarrow)')
+
+
+def is_store(path):
+    """
+    Check whether path is a Parquet store (a directory) rather than a SQLite
+    database file. Analysis functions given a store as ff_db read from it.
+    """
+    return os.path.isdir(path)
+
+
+def table_schema(cur, table):
+    """
+    Arrow schema of the columns of table stored in Parquet files, i.e. all
+    columns except id and the partition columns.
+    """
+    cur.execute('PRAGMA table_info({})'.format(table))
+    columns = [(row[1], row[2]) for row in cur.fetchall()
+               if row[1] != 'id' and row[1] not in partition_columns[table]]
+
+    return pa.schema([pa.field(name, getattr(pa, column_types[kind])()) for name, kind in columns])
+
+
+def partition_path(root, table, key):
+    """
+    Directory of the partition of table with the given values of its partition
+    columns.
+    """
+    parts = ['{}={}'.format(column, value) for column, value in zip(partition_columns[table], key)]
+
+    return os.path.join(root, table, *parts)
+
+
+def export_table(ff_db, root, table, league_id=None, season_id=None, weeks=None):
+    """
+    Export the rows of table in ff_db to the Parquet store at root, optionally
+    only for a league_id, a season_id and a set of weeks. Each partition is
+    written to a single file, which replaces the one exported before. Returns
+    the number of partitions written.
+    """
+    require_pyarrow()
+
+    conn = sqlite3.connect(ff_db)
+    cur = conn.cursor()
+
+    keys = partition_columns[table]
+    arrow_schema = table_schema(cur, table)
+
+    condition = schema.partition_filter(table, league_id, season_id)
+    if weeks is not None and 'week' in keys:
+        condition += ' AND {}.week IN ({})'.format(table, ', '.join(str(int(week)) for week in weeks))
+
+    cur.execute('SELECT DISTINCT {} FROM {} WHERE {}'.format(', '.join(keys), table, condition))
+    partitions = cur.fetchall()
+
+    for key in partitions:
+        sqlstr = 'SELECT {} FROM {} WHERE {} ORDER BY id'.format(
+            ', '.join(arrow_schema.names), table,
+            ' AND '.join('{} = ?'.format(column) for column in keys))
+        rows = pd.read_sql_query(sqlstr, conn, params=key)
+
+        arrays = [pa.array(rows[field.name].values, type=field.type, from_pandas=True) for field in arrow_schema]
+        data = pa.Table.from_arrays(arrays, schema=arrow_schema)
+
+        # Write to a temporary file first, so readers never see a partial file
+        path = partition_path(root, table, key)
+        if not os.path.exists(path):
+            os.makedirs(path)
+        pq.write_table(data, os.path.join(path, 'part.parquet.tmp'))
+        os.rename(os.path.join(path, 'part.parquet.tmp'), os.path.join(path, 'part.parquet'))
+
+    conn.close()
+
+    return len(partitions)
+
+
+def export_tables(ff_db, root, league_id=None, season_id=None, weeks=None):
+    """
+    Export the Players, Matchups, Teams and Slots tables of ff_db to the Parquet
+    store at root. See export_table. Returns a dict of the number of partitions
+    written, keyed by table.
+    """
+    return dict((table, export_table(ff_db, root, table, league_id, season_id, weeks))
+                for table in sorted(partition_columns))
+
+
+def partitions(root, table):
+    """
+    Sorted list of the partitions of table in the Parquet store at root, as
+    tuples of the values of its partition columns.
+    """
+    keys = partition_columns[table]
+    pattern = os.path.join(root, table, *['{}=*'.format(column) for column in keys])
+
+    return sorted(tuple(int(part.split('=')[1]) for part in os.path.relpath(os.path.dirname(path), os.path.join(root, table)).split(os.sep))
+                  for path in glob.glob(os.path.join(pattern, 'part.parquet')))
+
+
+def read_table(root, table, columns=None, league_id=None, season_id=None, weeks=None):
+    """
+    Read a table from the Parquet store at root into a DataFrame, optionally
+    only for a league_id, a season_id and a set of weeks, and only the given
+    columns. Only the files of matching partitions are opened, and only the
+    columns asked for are read from them.
+    """
+    require_pyarrow()
+
+    keys = partition_columns[table]
+    path = os.path.join(root, table)
+
+    filters = [(column, '=', int(value)) for column, value
+               in [('league_id', league_id), ('season_id', season_id)] if value is not None]
+    if weeks is not None and 'week' in keys:
+        filters.append(('week', 'in', set(int(week) for week in weeks)))
+
+    if columns is None:
+        file_columns = None
+    else:
+        file_columns = [column for column in columns if column not in keys]
+
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns)
+
+    # Every file is written with the schema of table_schema, so file schemas
+    # aren't checked against each other
+    dataset = pq.ParquetDataset(path, filters=filters or None, validate_schema=False)
+    if not dataset.pieces:
+        return pd.DataFrame(columns=columns)
+
+    data = dataset.read(columns=file_columns).to_pandas()
+
+    # Partition columns are read as categoricals of the directory names
+    for column in keys:
+        data[column] = data[column].astype(str).astype(np.int64)
+
+    if columns is None:
+        columns = keys + [column for column in data.columns if column not in keys]
+
+    return data[columns]
+
+
+def main():
+    """
+    Export a database to a Parquet store from the command line, optionally only
+    for a league_id and season_id:
+
+    python parquet_store.py DATABASE STORE_DIR [LEAGUE_ID SEASON_ID]
+    """
+    ff_db = sys.argv[1]
+    root = sys.argv[2]
+    league_id = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    season_id = int(sys.argv[4]) if len(sys.argv) > 4 else None
+
+    counts = export_tables(ff_db, root, league_id, season_id)
+    for table in sorted(counts):
+        print '{} partitions of the {} table exported to {}'.format(counts[table], table, root)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import Queue
+import sys
+import threading
+import time
+import metrics
+
+# Items buffered between two stages. A stage whose output queue is full blocks
+# until the next stage catches up, so memory use is bounded by the queue sizes
+# however many items are streamed through.
+QUEUE_SIZE = 16
+POLL_INTERVAL = 0.1 # seconds between checks for a failed stage while blocked
+
+_DONE = object() # end of stream marker
+
+
+class StageStats(object):
+    """
+    Throughput of a pipeline stage: items processed, seconds spent working on
+    them, seconds blocked handing them to a full downstream queue
+    (backpressure) and seconds starved waiting for input, summed over the
+    stage's workers.
+    """
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.starved = 0.0
+        self.max_queued = 0 # most items ever waiting in the stage's input queue
+        self.lock = threading.Lock()
+
+    def add(self, busy=0.0, blocked=0.0, starved=0.0, items=1):
+        with self.lock:
+            self.items += items
+            self.busy += busy
+            self.blocked += blocked
+            self.starved += starved
+
+    def report(self, elapsed):
+        rate = self.items / elapsed if elapsed else 0.0
+        utilization = 100.0 * self.busy / (elapsed * self.workers) if elapsed else 0.0
+
+        return ('{}: {} items, {:.1f} items/s, {} workers {:.0f}% busy, {:.1f} s blocked, '
+                '{:.1f} s starved, {} queued at most').format(
+                self.name, self.items, rate, self.workers, utilization,
+                self.blocked, self.starved, self.max_queued)
+
+
+class Pipeline(object):
+    """
+    Stream items through a chain of stages running concurrently in threads and
+    connected by bounded queues. stages is a list of (name, func, workers)
+    tuples: each of workers threads takes items from the stage's input queue
+    and puts func(item) on the input queue of the next stage. Items may leave a
+    stage with several workers out of order.
+
+    run() yields the output of the last stage. The code consuming it is
+    recorded as one more stage, named sink, so its throughput is reported
+    alongside the others. If any stage raises, the pipeline stops and run()
+    re-raises the exception.
+    """
+    def __init__(self, stages, sink='sink', queue_size=None):
+        if queue_size is None:
+            queue_size = QUEUE_SIZE
+
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = [StageStats(name, workers) for name, _, workers in stages] + [StageStats(sink, 1)]
+        self.elapsed = 0.0
+
+    def run(self, items):
+        """
+        Generate the results of streaming items (a list or generator) through
+        all stages. items is read lazily, so it is never held in memory.
+        """
+        queues = [Queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        abort = threading.Event()
+        errors = []
+        start = time.time()
+
+        def put(queue, item, stats):
+            # Blocks while queue is full, unless the pipeline is stopped
+            wait = time.time()
+            while not abort.is_set():
+                try:
+                    queue.put(item, timeout=POLL_INTERVAL)
+                except Queue.Full:
+                    continue
+                if stats is not None:
+                    stats.add(blocked=time.time() - wait, items=0)
+                return True
+            return False
+
+        def get(queue, stats):
+            # Blocks while queue is empty, unless the pipeline is stopped
+            wait = time.time()
+            while not abort.is_set():
+                try:
+                    item = queue.get(timeout=POLL_INTERVAL)
+                except Queue.Empty:
+                    continue
+                stats.add(starved=time.time() - wait, items=0)
+                return item
+            return _DONE
+
+        def feed():
+            try:
+                for item in items:
+                    if not put(queues[0], item, None):
+                        return
+                    self.stats[0].max_queued = max(self.stats[0].max_queued, queues[0].qsize())
+            except Exception:
+                errors.append(sys.exc_info())
+                abort.set()
+                return
+            put(queues[0], _DONE, None)
+
+        def work(i, func, remaining):
+            stats = self.stats[i]
+            downstream = self.stats[i+1]
+            while True:
+                item = get(queues[i], stats)
+                if item is _DONE:
+                    break
+                began = time.time()
+                try:
+                    result = func(item)
+                except Exception:
+                    errors.append(sys.exc_info())
+                    abort.set()
+                    return
+                stats.add(busy=time.time() - began)
+                if not put(queues[i+1], result, stats):
+                    return
+                downstream.max_queued = max(downstream.max_queued, queues[i+1].qsize())
+
+            # Let the other workers of the stage see the end of the stream, and
+            # pass it on once all of them are done
+            put(queues[i], _DONE, None)
+            with remaining['lock']:
+                remaining['workers'] -= 1
+                last = remaining['workers'] == 0
+            if last:
+                put(queues[i+1], _DONE, None)
+
+        threads = [threading.Thread(target=feed)]
+        for i, (_, func, workers) in enumerate(self.stages):
+            remaining = {'lock': threading.Lock(), 'workers': workers}
+            threads.extend(threading.Thread(target=work, args=(i, func, remaining)) for _ in range(workers))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        sink = self.stats[-1]
+        try:
+            while True:
+                item = get(queues[-1], sink)
+                if item is _DONE:
+                    break
+                began = time.time()
+                yield item
+                sink.add(busy=time.time() - began)
+        finally:
+            abort.set()
+            for thread in threads:
+                thread.join()
+            self.elapsed = time.time() - start
+            for stats in self.stats:
+                metrics.emit('pipeline_stage', stage=stats.name, items=stats.items, workers=stats.workers,
+                             busy=round(stats.busy, 3), blocked=round(stats.blocked, 3),
+                             starved=round(stats.starved, 3), seconds=round(self.elapsed, 3))
+
+        if errors:
+            exc_type, exc_value, traceback = errors[0]
+            raise exc_type, exc_value, traceback
+
+    def report(self):
+        """
+        Summary of the throughput of each stage of the last run.
+        """
+        lines = ['Pipeline: {:.1f} s'.format(self.elapsed)]
+        lines.extend('  ' + stats.report(self.elapsed) for stats in self.stats)
+
+        return '\n'.join(lines)
@@ -1,7 +1,16 @@
+import io
 import sys
+import time
 from bs4 import BeautifulSoup
-import requests
-import sqlite3
+from lxml import etree
+import db_writer
+import league_settings
+import metrics
+import page_cache
+import page_fetcher
+import pipeline
+import schema
+import sync_state
 
 # Player attributes as parsed from ESPN lineups page
 player_attr = {'SLOT': 'slot',
@@ -20,32 +29,58 @@ player_attr = {'SLOT': 'slot',
                '%OWN': 'percent_own',
                '+/-': 'percent_ownership_change'}
 
+# Parser used for lineup and scoring pages: 'lxml' for the streaming lxml
+# parser, or 'bs4' for BeautifulSoup
+PARSER = 'lxml'
 
-def get_num_teams(league_id, season_id):
+# Worker threads of the parse and normalize stages of the player pipeline
+# (pages are fetched by max_workers threads)
+PARSE_WORKERS = 2
+NORMALIZE_WORKERS = 1
+
+
+def lineup_url(league_id, team_id, week, season_id):
     """
-    Get the number of teams in the league from the league settings page.
+    URL of the weekly team lineup page.
     """
-    url = 'http://games.espn.com/ffl/leaguesetup/settings?leagueId={}&seasonId={}'.format(league_id, season_id)
-    soup = BeautifulSoup(requests.get(url).text, 'lxml')
-    table_settings = soup.find_all('table')
-    table_settings = table_settings[1]
+    return '{}/clubhouse?leagueId={}&teamId={}&scoringPeriodId={}&seasonId={}'.format(page_fetcher.BASE_URL, league_id, team_id, week, season_id)
+
+
+def scoring_url(league_id, team_id, week, season_id):
+    """
+    URL of the weekly 'QUICK BOX SCORE' page for a team_id.
+    """
+    return '{}/boxscorequick?leagueId={}&teamId={}&scoringPeriodId={}&seasonId={}&view=scoringperiod&version=quick'.format(page_fetcher.BASE_URL, league_id, team_id, week, season_id)
+
 
-    rows = table_settings.find_all('tr')
-    for row in rows:
-        fields = [val.get_text() for val in row.children if len(val.get_text()) > 0]
-        if fields[0] == "Number of Teams":
-            num_teams = int(fields[1])
+def find_lineup_table(html):
+    """
+    Get the player table from the HTML of a weekly team lineup page.
+    """
+    soup = BeautifulSoup(html, 'lxml')
+    table_lineup = soup.find('table', {'class': 'playerTableTable'})
 
-    return num_teams
+    return table_lineup
+
+
+def find_scoring_tables(html):
+    """
+    Get the STARTERS and BENCH tables for the team_id from the HTML of a weekly
+    'QUICK BOX SCORE' page.
+    """
+    soup = BeautifulSoup(html, 'lxml')
+    table_scoring = soup.find_all('table', {'class': 'playerTableTable'}) # returns 4 tables (2 for the team_id and 2 for the opposing team)
+    table_scoring = table_scoring[0:2] # table_scoring[0] is the STARTERS table for the team_id and scoring_table[1] is the BENCH table for the team_id
+
+    return table_scoring
 
 
 def load_lineup_page(league_id, team_id, week, season_id):
     """
     Load the weekly team lineup page.
     """
-    url = 'http://games.espn.com/ffl/clubhouse?leagueId={}&teamId={}&scoringPeriodId={}&seasonId={}'.format(league_id, team_id, week, season_id)
-    soup = BeautifulSoup(requests.get(url).text, 'lxml')
-    table_lineup = soup.find('table', {'class': 'playerTableTable'})
+    html = page_fetcher.fetch_page(lineup_url(league_id, team_id, week, season_id))
+    table_lineup = find_lineup_table(html)
 
     return table_lineup
 
@@ -56,10 +91,8 @@ def load_scoring_page(league_id, team_id, week, season_id):
     loaded. team_id specified so that the data for the team of interest is
     always the first two tables (STARTERS and BENCH) parsed from the webpage.
     """
-    url = 'http://games.espn.com/ffl/boxscorequick?leagueId={}&teamId={}&scoringPeriodId={}&seasonId={}&view=scoringperiod&version=quick'.format(league_id, team_id, week, season_id)
-    soup = BeautifulSoup(requests.get(url).text, 'lxml')
-    table_scoring = soup.find_all('table', {'class': 'playerTableTable'}) # returns 4 tables (2 for the team_id and 2 for the opposing team)
-    table_scoring = table_scoring[0:2] # table_scoring[0] is the STARTERS table for the team_id and scoring_table[1] is the BENCH table for the team_id
+    html = page_fetcher.fetch_page(scoring_url(league_id, team_id, week, season_id))
+    table_scoring = find_scoring_tables(html)
 
     return table_scoring
 
@@ -172,79 +205,289 @@ def parse_scoring(table_scoring):
     return scores
 
 
-def write_players_to_db(ff_db, players, scores):
+def find_player_tables(html, count):
+    """
+    Stream-parse the HTML of a page with lxml and return the first count
+    'playerTableTable' tables. Parsing stops as soon as the last table needed
+    has been read, so the rest of the page is never parsed.
     """
-    Write player data to database.
+    tables = []
+    source = io.BytesIO(html.encode('utf-8'))
+
+    for _, table in etree.iterparse(source, events=('end', ), tag='table', html=True, encoding='utf-8'):
+        if 'playerTableTable' in table.get('class', '').split():
+            tables.append(table)
+            if len(tables) == count:
+                break
+
+    return tables
+
+
+def row_fields(row):
+    """
+    Non-empty text of each child node (elements and text between them) of a
+    table row, the same as [val.get_text() for val in row.children] with empty
+    strings dropped.
+    """
+    fields = [row.text]
+    for child in row:
+        if child.tag is not etree.Comment:
+            fields.append(child.xpath('string()'))
+        fields.append(child.tail)
+
+    return [unicode(field) for field in fields if field]
+
+
+def row_classes(row):
+    """
+    Classes of a table row.
+    """
+    return row.get('class', '').split()
+
+
+def parse_lineup_html(week, team_id, html):
+    """
+    Parse player data from the HTML of a weekly team lineup page with lxml.
+    Returns the same data as parse_lineup.
+    """
+    rows = list(find_player_tables(html, 1)[0].iter('tr'))
+    headers = row_fields(rows[1])
+    players = []
+    player_num = 1 # keep track of slot number to fill in unique player name for empty slots
+
+    for row in rows[2:]:
+        if 'pncPlayerRow' in row_classes(row):
+            player_raw = [val.replace(u'\xa0', ' ') for val in row_fields(row)]
+            players.append(map_player_data(week, team_id, headers, player_raw, player_num))
+            player_num += 1
+
+    return players
+
+
+def parse_scoring_html(html):
+    """
+    Parse player scoring data from the HTML of a weekly 'QUICK BOX SCORE' page
+    with lxml. Returns the same data as parse_scoring.
+    """
+    scores = []
+
+    # STARTERS table rows start at the fourth row, BENCH table rows at the third
+    for table, first_row in zip(find_player_tables(html, 2), [3, 2]):
+        for row in list(table.iter('tr'))[first_row:]:
+            if 'pncPlayerRow' in row_classes(row):
+                score = row_fields(row)[-1].replace(u'\xa0', ' ')
+                if score == '--': # Empty slot or BYE week
+                    scores.append(0)
+                else:
+                    scores.append(score)
+
+    return scores
+
+
+def benchmark_parsers(html_lineup, html_scoring, repeat=20):
+    """
+    Compare the BeautifulSoup and lxml parsers on the HTML of a saved lineup
+    page and scoring page. Returns a dict keyed by parser ('bs4' and 'lxml')
+    with the average seconds taken to parse both pages, and the number of tree
+    nodes built for them (a measure of memory use).
+    """
+    def parse_bs4():
+        parse_lineup(1, 1, find_lineup_table(html_lineup))
+        parse_scoring(find_scoring_tables(html_scoring))
+
+    def parse_lxml():
+        parse_lineup_html(1, 1, html_lineup)
+        parse_scoring_html(html_scoring)
+
+    # BeautifulSoup builds the whole page, while lxml stops after the last
+    # table needed
+    soups = [BeautifulSoup(html, 'lxml') for html in [html_lineup, html_scoring]]
+    roots = [tables[-1].getroottree().getroot() for tables in [find_player_tables(html_lineup, 1), find_player_tables(html_scoring, 2)]]
+    nodes = {'bs4': sum(len(soup.find_all(True)) + len(soup.find_all(text=True)) for soup in soups),
+             'lxml': sum(len(root.xpath('//node()')) for root in roots)}
+
+    results = {}
+    for name, parse in [('bs4', parse_bs4), ('lxml', parse_lxml)]:
+        start = time.time()
+        for _ in range(repeat):
+            parse()
+        results[name] = {'seconds': (time.time() - start) / repeat, 'nodes': nodes[name]}
+
+    return results
+
+
+def normalize_player(player, score):
+    """
+    Convert the data parsed for a player (and the player's score) to the row
+    of values written to the Players table.
+    """
+    # ESPN gives 'rd', 'th', etc. that need to be stripped
+    if player['opponent_rank'] != 0:
+        opponent_rank = int(player['opponent_rank'][:-2])
+    else:
+        opponent_rank = 0
+
+    # Most data was parsed as unicode, so need to convert to numerical data
+    return ( int(player['week']), player['team_id'], player['slot'],
+             player['player'], player['team'], player['position'],
+             player['opponent'], player['game_status'], int(player['player_rank']),
+             float(player['points']), float(player['average_points']),
+             float(player['last_points']), float(player['projected_points']),
+             float(score), opponent_rank, float(player['percent_start']),
+             float(player['percent_own']), float(player['percent_ownership_change']) )
+
+
+@metrics.timed('parse.player_page')
+def parse_player_page(key, pages):
+    """
+    Parse the players and their scores from the fetched lineup and scoring
+    pages, (html_lineup, html_scoring), of a (week, team_id) key. Returns a
+    (key, players, scores) tuple.
+    """
+    week, team_id = key
+    html_lineup, html_scoring = pages
+
+    if PARSER == 'lxml':
+        players = parse_lineup_html(week, team_id, html_lineup)
+        scores = parse_scoring_html(html_scoring)
+    else:
+        players = parse_lineup(week, team_id, find_lineup_table(html_lineup))
+        scores = parse_scoring(find_scoring_tables(html_scoring))
+
+    return key, players, scores
+
+
+def normalize_player_page(key, players, scores):
+    """
+    Convert the players and scores parsed for a (week, team_id) key to a
+    (key, rows) tuple of the rows written to the Players table.
+    """
+    return key, [normalize_player(player, score) for player, score in zip(players, scores)]
+
+
+def parse_player_pages(pages):
+    """
+    Generate ((week, team_id), rows) tuples, where rows is the list of player
+    rows parsed from the fetched lineup and scoring pages in
+    ((week, team_id), (html_lineup, html_scoring)) tuples.
+    """
+    for key, page in pages:
+        yield normalize_player_page(*parse_player_page(key, page))
+
+
+def player_pipeline(league_id, season_id, max_workers=8, requests_per_second=None, limiter=None):
+    """
+    Pipeline (see pipeline.Pipeline) that fetches, parses and normalizes the
+    lineup and scoring pages of (week, team_id) keys in overlapping stages.
+    Its run() yields ((week, team_id), rows) tuples for write_players_to_db,
+    which is reported as the write stage. At most max_workers pages are
+    fetched at once, limited to requests_per_second. Pass a limiter (a
+    page_fetcher.HostRateLimiter) instead to share the limit with other
+    pipelines running at the same time.
+    """
+    if limiter is None:
+        limiter = page_fetcher.HostRateLimiter(requests_per_second)
+
+    def fetch(key):
+        week, team_id = key
+        urls = [lineup_url(league_id, team_id, week, season_id), scoring_url(league_id, team_id, week, season_id)]
+        return key, page_fetcher.fetch_urls(urls, limiter)
+
+    stages = [('fetch', fetch, max_workers),
+              ('parse', lambda item: parse_player_page(*item), PARSE_WORKERS),
+              ('normalize', lambda item: normalize_player_page(*item), NORMALIZE_WORKERS)]
+
+    return pipeline.Pipeline(stages, sink='write')
+
+
+def write_players_to_db(ff_db, league_id, season_id, pages, current_week=None):
+    """
+    Write player data of a league-season to database. pages is a list (or
+    generator) of ((week, team_id), rows) tuples from parse_player_pages. The
+    rows of each (week, team_id) replace any rows already saved for it, so
+    lineup changes are picked up when a week is fetched again. All pages are
+    written over a single connection, in transactions of about
+    db_writer.BATCH_SIZE rows.
+
+    If current_week is given, the fetched pages are also recorded in the
+    SyncState table (see sync_state), with weeks before current_week marked as
+    final.
     """
     print '\nOpening fantasy football database ...'
 
-    conn = sqlite3.connect(ff_db)
+    conn = db_writer.connect(ff_db)
     cur = conn.cursor()
 
-    cur.execute('''
-
-    CREATE TABLE IF NOT EXISTS Players (
-        id  INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
-        week INTEGER,
-        team_id INTEGER,
-        slot TEXT,
-        player TEXT,
-        team TEXT,
-        position TEXT,
-        opponent TEXT,
-        game_status TEXT,
-        player_rank INTEGER,
-        points DECIMAL(5,1),
-        average_points DECIMAL(5,1),
-        last_points DECIMAL(5,1),
-        projected_points DECIMAL(5,1),
-        actual_points DECIMAL(5,1),
-        opponent_rank INTEGER,
-        percent_start DECIMAL(5,1),
-        percent_own DECIMAL(5,1),
-        percent_ownership_change DECIMAL(5,1),
-        UNIQUE (week, team_id, slot, player)
-    );
-    ''')
+    schema.create_table(cur, 'Players')
+
+    sync_state.create_sync_table(cur)
 
     print 'Writing player data to database ...'
 
-    for i in range(len(players)):
-        # ESPN gives 'rd', 'th', etc. that need to be stripped
-        if players[i]['opponent_rank'] != 0:
-            players[i]['opponent_rank'] = int(players[i]['opponent_rank'][:-2])
-        # Most data was parsed as unicode, so need to convert to numerical data
-        players[i]['week'] = int(players[i]['week'])
-        players[i]['player_rank'] = int(players[i]['player_rank'])
-        players[i]['points'] = float(players[i]['points'])
-        players[i]['average_points'] = float(players[i]['average_points'])
-        players[i]['last_points'] = float(players[i]['last_points'])
-        players[i]['projected_points'] = float(players[i]['projected_points'])
-        scores[i] = float(scores[i])
-        players[i]['percent_start'] = float(players[i]['percent_start'])
-        players[i]['percent_own'] = float(players[i]['percent_own'])
-        players[i]['percent_ownership_change'] = float(players[i]['percent_ownership_change'])
-
-        cur.execute('''INSERT OR IGNORE INTO Players
-            (week, team_id, slot, player, team, position, opponent, game_status,
-            player_rank, points, average_points, last_points, projected_points,
-            actual_points, opponent_rank, percent_start, percent_own,
-            percent_ownership_change)
-            VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )''',
-            ( players[i]['week'], players[i]['team_id'], players[i]['slot'],
-            players[i]['player'], players[i]['team'], players[i]['position'],
-            players[i]['opponent'], players[i]['game_status'], players[i]['player_rank'],
-            players[i]['points'], players[i]['average_points'], players[i]['last_points'],
-            players[i]['projected_points'], scores[i], players[i]['opponent_rank'],
-            players[i]['percent_start'], players[i]['percent_own'], players[i]['percent_ownership_change'] ) )
-
-        conn.commit()
-
-    print 'Player data written to database!\n'
+    count = 0
+
+    for batch in db_writer.page_batches(pages):
+        keys = [key for key, _ in batch]
+        rows = [( league_id, season_id ) + row for _, page_rows in batch for row in page_rows]
+
+        with db_writer.transaction(conn):
+            conn.executemany('''DELETE FROM Players
+                WHERE Players.league_id = ? AND Players.season_id = ?
+                AND Players.week = ? AND Players.team_id = ?''',
+                [( league_id, season_id, week, team_id ) for week, team_id in keys])
+            conn.executemany('''INSERT OR REPLACE INTO Players
+                (league_id, season_id, week, team_id, slot, player, team, position,
+                opponent, game_status, player_rank, points, average_points,
+                last_points, projected_points, actual_points, opponent_rank,
+                percent_start, percent_own, percent_ownership_change)
+                VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )''', rows)
+            if current_week is not None:
+                sync_state.mark_fetched(conn, league_id, season_id, keys, ['lineup', 'scoring'], current_week)
+
+        count += len(rows)
+        metrics.count('db.rows', len(rows))
+
+    # Refresh query planner statistics after the bulk write
+    schema.analyze(cur)
+    conn.commit()
+
+    print '{} rows of player data written to database!\n'.format(count)
 
     conn.close()
 
 
+def scrape_players(ff_db, league_id, season_id, weeks, num_teams=None, max_workers=8,
+                   requests_per_second=None, sync=True, limiter=None, current_week=None):
+    """
+    Fetch, parse and write to ff_db the players of every team in a list of
+    weeks of a league-season, streaming the lineup and scoring pages of each
+    week and team_id through player_pipeline. num_teams is read from the
+    league settings page if not given. With sync, only weeks that are missing
+    from ff_db or were not yet final when last fetched are fetched. Weeks
+    before current_week (the first week that isn't final, see
+    league_settings.get_current_week, if not given) are final. Returns the
+    pipeline, for its report.
+    """
+    if num_teams is None:
+        num_teams = league_settings.get_num_teams(league_id, season_id)
+    team_ids = range(1, num_teams+1)
+
+    # Pages of final weeks are recorded as final and cached forever
+    if current_week is None:
+        current_week = league_settings.get_current_week(season_id)
+    page_cache.set_current_week(current_week, season_id)
+
+    keys = [(week, team_id) for week in weeks for team_id in team_ids]
+    if sync:
+        keys = sync_state.pending(ff_db, league_id, season_id, keys, ['lineup', 'scoring'])
+        print '{} of {} team-weeks need to be fetched'.format(len(keys), len(weeks)*len(team_ids))
+
+    stream = player_pipeline(league_id, season_id, max_workers, requests_per_second, limiter)
+    write_players_to_db(ff_db, league_id, season_id, stream.run(keys), current_week)
+
+    return stream
+
+
 def main():
     """
     User-specified parameters:
@@ -252,6 +495,12 @@ def main():
     (2) league_id: id number of the ESPN FF league
     (3) season_id: year of FF season
     (4) weeks: list of matchup weeks
+    (5) max_workers: number of pages fetched concurrently
+    (6) requests_per_second: limit on requests made to ESPN (None for no limit)
+    (7) sync: only fetch weeks that are missing from ff_db or were not yet final
+        when last fetched
+    (8) current_week: first week of the season that isn't final, before which
+        every week is final (None to work it out from the date)
 
     Returns:
     Writes to ff_db all player data from a set of regular season weeks.
@@ -259,20 +508,25 @@ def main():
     ff_db = 'DATABASE_NAME.sqlite'
     league_id = 000000
     season_id = 0000
-    weeks = [1, 2, 3, ...]
+    weeks = [1, 2, 3]
+    max_workers = 8
+    requests_per_second = 10
+    sync = True
+    current_week = None
 
-    num_teams = get_num_teams(league_id, season_id)
-    team_ids = range(1, num_teams+1)
+    # Lineup and scoring pages for every week and team_id are fetched, parsed,
+    # normalized and written in overlapping stages connected by bounded queues,
+    # so memory use stays flat however many weeks are fetched. Rows are
+    # streamed to the database over a single connection.
+    stream = scrape_players(ff_db, league_id, season_id, weeks, max_workers=max_workers,
+                            requests_per_second=requests_per_second, sync=sync, current_week=current_week)
 
-    for week in weeks:
-        for team_id in team_ids:
-            table_lineup = load_lineup_page(league_id, team_id, week, season_id)
-            table_scoring = load_scoring_page(league_id, team_id, week, season_id)
-            players = parse_lineup(week, team_id, table_lineup)
-            scores = parse_scoring(table_scoring)
-            write_players_to_db(ff_db, players, scores)
+    print stream.report()
+    page_cache.flush()
+    print page_cache.report()
 
 
 if __name__ == '__main__':
+    metrics.enable_from_argv()
     main()
     sys.exit(0)
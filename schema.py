@@ -0,0 +1,293 @@
+import sys
+import sqlite3
+
+# Table definitions for the data written by the scrapers. Every table is
+# partitioned by league_id and season_id, so one database can hold many
+# league-seasons.
+tables = {
+    'Players': '''
+    CREATE TABLE IF NOT EXISTS Players (
+        id  INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        league_id INTEGER,
+        season_id INTEGER,
+        week INTEGER,
+        team_id INTEGER,
+        slot TEXT,
+        player TEXT,
+        team TEXT,
+        position TEXT,
+        opponent TEXT,
+        game_status TEXT,
+        player_rank INTEGER,
+        points DECIMAL(5,1),
+        average_points DECIMAL(5,1),
+        last_points DECIMAL(5,1),
+        projected_points DECIMAL(5,1),
+        actual_points DECIMAL(5,1),
+        opponent_rank INTEGER,
+        percent_start DECIMAL(5,1),
+        percent_own DECIMAL(5,1),
+        percent_ownership_change DECIMAL(5,1),
+        UNIQUE (league_id, season_id, week, team_id, slot, player)
+    );
+    ''',
+    'Teams': '''
+    CREATE TABLE IF NOT EXISTS Teams (
+        id  INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        league_id INTEGER,
+        season_id INTEGER,
+        team_id INTEGER,
+        team_abbr TEXT,
+        team_name TEXT,
+        division TEXT,
+        owner TEXT,
+        co_owner TEXT,
+        UNIQUE (league_id, season_id, team_id)
+    );
+    ''',
+    'Matchups': '''
+    CREATE TABLE IF NOT EXISTS Matchups (
+        id  INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        league_id INTEGER,
+        season_id INTEGER,
+        week INTEGER,
+        home TEXT,
+        away TEXT,
+        UNIQUE (league_id, season_id, week, home, away)
+    );
+    ''',
+    'Slots': '''
+    CREATE TABLE IF NOT EXISTS Slots (
+        id  INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        league_id INTEGER,
+        season_id INTEGER,
+        position TEXT,
+        slots INTEGER,
+        UNIQUE (league_id, season_id, position)
+    );
+    '''}
+
+# Indexes of each table, covering the columns read by the analysis queries.
+# Indexes lead with league_id and season_id, so queries for one league-season
+# never read the rows of the others.
+indexes = {
+    'Players': [
+        # Scores of a team and week (score_engine, including the ScoreCache
+        # fingerprints) and players of a week (projection error plots)
+        '''CREATE INDEX IF NOT EXISTS idx_players_team_week ON Players
+            (league_id, season_id, team_id, week, slot, player, position, projected_points, actual_points)''',
+        '''CREATE INDEX IF NOT EXISTS idx_players_week ON Players
+            (league_id, season_id, week, projected_points, player, position, slot, actual_points)''',
+        # Relative projection errors by position over all league-seasons
+        # (espn_projection_bias)
+        '''CREATE INDEX IF NOT EXISTS idx_players_position ON Players
+            (position, projected_points, slot, actual_points, week)'''],
+    'Teams': [
+        # Team names of matchups resolved to team_ids
+        '''CREATE INDEX IF NOT EXISTS idx_teams_name ON Teams
+            (league_id, season_id, team_name, team_id)'''],
+    'Matchups': [
+        '''CREATE INDEX IF NOT EXISTS idx_matchups_week ON Matchups
+            (league_id, season_id, week, home, away)'''],
+    'Slots': []}
+
+
+def hot_queries():
+    """
+    Hot queries of the analysis code that must be answered from an index, as
+    (description, query, parameters) tuples. Queries come from the functions
+    the analysis code builds them with, so the check follows any change to
+    them. The analysis modules import this one, so they are imported here
+    rather than at the top.
+    """
+    import espn_projection_bias
+    import score_analysis
+    import score_engine
+
+    sqlstr, params = espn_projection_bias.relative_error_query('QB', 'Bench')
+
+    return [
+        ('Scoring columns of a set of weeks', score_engine.players_query([1, 2], 1, 2017), ()),
+        ('ScoreCache fingerprints of a set of weeks', score_engine.fingerprint_query([1, 2], 1, 2017), ()),
+        ('Players with projections in a week', score_analysis.week_players_query(1, 1, 2017), ()),
+        ('Relative errors of a position', sqlstr, params),
+        ('Relative errors of every player', espn_projection_bias.error_table_query(), ()),
+        ('Teams of a league-season', score_engine.teams_query(1, 2017), ()),
+        ('Matchups of a set of weeks', score_engine.matchups_query([1, 2], 1, 2017), ()),
+        ('Roster slots of a league-season', score_engine.slots_query(1, 2017), ())]
+
+
+def partition_filter(table, league_id=None, season_id=None):
+    """
+    SQL condition restricting the rows of table to a league_id and season_id
+    (any league or season if None).
+    """
+    conditions = ['{}.{} = {}'.format(table, column, int(value))
+                  for column, value in [('league_id', league_id), ('season_id', season_id)]
+                  if value is not None]
+
+    return ' AND '.join(conditions) or '1'
+
+
+def table_columns(cur, table):
+    """
+    Column names of a table (an empty list if it doesn't exist).
+    """
+    cur.execute('PRAGMA table_info({})'.format(table))
+
+    return [row[1] for row in cur.fetchall()]
+
+
+def create_table(cur, table):
+    """
+    Create a table and its indexes if they don't already exist. Raises a
+    ValueError if the table was created before it had league_id and season_id
+    columns (see migrate_table).
+    """
+    columns = table_columns(cur, table)
+    if columns and 'league_id' not in columns:
+        raise ValueError('The {} table has no league_id and season_id columns. Run '
+                         '"python schema.py DATABASE LEAGUE_ID SEASON_ID" to migrate it.'.format(table))
+
+    cur.execute(tables[table])
+    for sqlstr in indexes[table]:
+        cur.execute(sqlstr)
+
+
+def create_schema(cur):
+    """
+    Create all tables and indexes that don't already exist. Adds the indexes to
+    databases created before they were defined.
+    """
+    for table in sorted(tables):
+        create_table(cur, table)
+
+
+def migrate_table(cur, table, league_id, season_id):
+    """
+    Rebuild a table created before it had league_id and season_id columns with
+    the current definition, assigning all of its rows to league_id and
+    season_id. Tables that are missing or already up to date are left as they
+    are. Returns True if the table was migrated.
+    """
+    columns = [column for column in table_columns(cur, table) if column != 'id']
+    if not columns or 'league_id' in columns:
+        return False
+
+    # Indexes of the old table would block creating those of the new one
+    cur.execute('''SELECT name FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL''', (table, ))
+    for (name, ) in cur.fetchall():
+        cur.execute('DROP INDEX {}'.format(name))
+
+    cur.execute('ALTER TABLE {0} RENAME TO {0}_old'.format(table))
+    create_table(cur, table)
+
+    # Later rows replace earlier ones that clash with the new keys (e.g. old
+    # roster slots of a position)
+    cur.execute('''INSERT OR REPLACE INTO {0} (league_id, season_id, {1})
+        SELECT ?, ?, {1} FROM {0}_old ORDER BY id'''.format(table, ', '.join(columns)),
+        (league_id, season_id))
+    cur.execute('DROP TABLE {}_old'.format(table))
+
+    return True
+
+
+def migrate(cur, league_id, season_id):
+    """
+    Migrate every table of a database created before tables had league_id and
+    season_id columns, assigning all existing rows to league_id and season_id.
+    Returns the names of the tables migrated.
+    """
+    return [table for table in sorted(tables) if migrate_table(cur, table, league_id, season_id)]
+
+
+def analyze(cur):
+    """
+    Gather table and index statistics for the query planner. Run after large
+    writes.
+    """
+    cur.execute('ANALYZE')
+
+
+def full_scans(cur, sqlstr, params=()):
+    """
+    Steps of the query plan of sqlstr that scan a whole table rather than
+    searching or scanning an index. Scans of the rows of a subquery (e.g. 'SCAN
+    (subquery-1)') read no table and are left out.
+    """
+    cur.execute('EXPLAIN QUERY PLAN ' + sqlstr, params)
+    details = [row[-1] for row in cur.fetchall()]
+
+    return [detail for detail in details
+            if detail.startswith('SCAN') and 'INDEX' not in detail and 'SUBQUERY' not in detail.upper()]
+
+
+def check_query_plans(ff_db=':memory:'):
+    """
+    Check that none of the hot_queries scans a whole table of ff_db (an empty
+    database with the schema by default). Tables and indexes missing from
+    ff_db are created first. Returns a list of (description, plan step) tuples
+    for queries that do. Note that after ANALYZE, the planner may rightly
+    prefer scanning tables of only a few rows.
+    """
+    conn = sqlite3.connect(ff_db)
+    cur = conn.cursor()
+    create_schema(cur)
+    conn.commit()
+
+    problems = []
+    for description, sqlstr, params in hot_queries():
+        for detail in full_scans(cur, sqlstr, params):
+            problems.append((description, detail))
+
+    conn.close()
+
+    return problems
+
+
+def main():
+    """
+    Check the query plans of the hot queries against the database given on the
+    command line (or an empty database with the schema), add any missing tables
+    and indexes, and gather planner statistics. Exits with status 1 if any hot
+    query scans a whole table.
+
+    If a league_id and season_id are also given, tables created before they
+    had league_id and season_id columns are first migrated, with their rows
+    assigned to that league-season:
+
+    python schema.py DATABASE LEAGUE_ID SEASON_ID
+    """
+    ff_db = sys.argv[1] if len(sys.argv) > 1 else ':memory:'
+
+    if len(sys.argv) > 3:
+        # Migrate in one transaction (sqlite3 would otherwise commit before
+        # each ALTER TABLE)
+        conn = sqlite3.connect(ff_db, isolation_level=None)
+        cur = conn.cursor()
+        cur.execute('BEGIN')
+        migrated = migrate(cur, int(sys.argv[2]), int(sys.argv[3]))
+        cur.execute('COMMIT')
+        conn.close()
+        for table in migrated:
+            print 'Migrated the {} table to league {}, season {}'.format(table, sys.argv[2], sys.argv[3])
+
+    problems = check_query_plans(ff_db)
+    for description, detail in problems:
+        print 'Full table scan in query "{}": {}'.format(description, detail)
+
+    conn = sqlite3.connect(ff_db)
+    analyze(conn.cursor())
+    conn.commit()
+    conn.close()
+
+    if problems:
+        return 1
+
+    print 'All hot queries use an index.'
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
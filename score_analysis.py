@@ -1,103 +1,90 @@
 import os
 import sys
 import math
+import multiprocessing
+import time
 import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
-import requests
 import sqlite3
 from matplotlib import pylab as plt
+import artifact_cache
+import compact_store
+import league_settings
+import metrics
+import parquet_store
+import schema
+import score_engine
+import standings
 
 
-def get_num_teams(league_id, season_id):
+def get_scores(ff_db, team_id, week, league_id=None, season_id=None):
     """
-    Get the number of teams in the league from the league settings page.
+    Calculate the following scores for a given team_id and week (of a
+    league_id and season_id, if ff_db holds several league-seasons):
+    (1) score_proj: Score based on ESPN projections for starters
+    (2) score_actual: Score based on actual points for starters
+    (3) score_best: Score based on optimal combination of players from starters
+                    and bench players
+
+    To score many teams or weeks, use score_engine.get_league_scores, which
+    calculates scores for all of them at once.
     """
-    url = 'http://games.espn.com/ffl/leaguesetup/settings?leagueId={}&seasonId={}'.format(league_id, season_id)
-    soup = BeautifulSoup(requests.get(url).text, 'lxml')
-    table_settings = soup.find_all('table')
-    table_settings = table_settings[1]
+    scores = score_engine.get_league_scores(ff_db, [week], league_id=league_id, season_id=season_id)
+    scores = scores.loc[scores['team_id'] == team_id, :]
 
-    rows = table_settings.find_all('tr')
-    for row in rows:
-        fields = [val.get_text() for val in row.children if len(val.get_text()) > 0]
-        if fields[0] == "Number of Teams":
-            num_teams = int(fields[1])
+    score_proj, score_actual, score_best = scores[['score_proj', 'score_actual', 'score_best']].values[0]
 
-    return num_teams
+    return score_proj, score_actual, score_best
 
 
-def get_scores(ff_db, team_id, week):
+def lookup_scores(scores):
     """
-    Calculate the following scores for a given team_id and week:
-    (1) score_proj: Score based on ESPN projections for starters
-    (2) score_actual: Score based on actual points for starters
-    (3) score_best: Score based on optimal combination of players from starters
-                    and bench players
+    Map each (team_id, week) in a DataFrame from score_engine.get_league_scores
+    to its (score_proj, score_actual, score_best) tuple.
+    """
+    return dict(((team_id, week), (score_proj, score_actual, score_best))
+                for team_id, week, score_proj, score_actual, score_best
+                in scores[['team_id', 'week', 'score_proj', 'score_actual', 'score_best']].itertuples(index=False))
+
+
+def week_players_query(week, league_id=None, season_id=None):
     """
+    SQL query for the players with projected points > 0 of a week (see
+    load_week_players).
+    """
+    return '''SELECT Players.player, Players.position, Players.slot,
+        Players.projected_points, Players.actual_points
+        FROM Players WHERE %s AND Players.week = %s
+        AND Players.projected_points > 0 ORDER BY Players.id''' % (schema.partition_filter('Players', league_id, season_id), int(week))
+
+
+def load_week_players(ff_db, week, league_id=None, season_id=None):
+    """
+    Load the players with projected points > 0 of a week, optionally only for
+    a league_id and a season_id, for the projection error plots. ff_db may also
+    be a Parquet store, and players are read from the compact store of ff_db if
+    it has an up-to-date one.
+    """
+    columns = ['player', 'position', 'slot', 'projected_points', 'actual_points']
+
+    if parquet_store.is_store(ff_db):
+        df = parquet_store.read_table(ff_db, 'Players', columns, league_id, season_id, [week])
+    else:
+        df = compact_store.load_players(ff_db, [week], league_id, season_id, columns)
+    if df is not None:
+        return df.loc[df['projected_points'] > 0, :].reset_index(drop=True)
+
     conn = sqlite3.connect(ff_db)
-    cur = conn.cursor()
-
-    sqlstr = '''SELECT Players.* FROM Players
-        WHERE Players.team_id = %s and Players.week = %s''' % (team_id, week)
-    players = pd.read_sql_query(sqlstr, conn)
-
-    sqlstr = '''SELECT Slots.* FROM Slots'''
-    slots = pd.read_sql_query(sqlstr, conn)
-
-    # Tally projected and real scores for original starters
-    idx_starter = np.where(players.loc[:, 'slot'] != 'Bench')[0]
-    score_proj = players.loc[idx_starter, 'projected_points'].sum()
-    score_proj = float('{0:.1f}'.format(round(score_proj, 1)))
-    score_actual = players.loc[idx_starter, 'actual_points'].sum()
-    score_actual = float('{0:.1f}'.format(round(score_actual, 1)))
-
-    # Tally best possible score considering optimal lineup
-    # QB - will return 0 if no QBs on roster
-    num_QB = slots.loc[np.where(slots['position'] == 'QB')[0], 'slots'].values[0]
-    idx_QB = np.where(players.loc[:, 'position'] == 'QB')[0]
-    score_QB = players.loc[idx_QB, 'actual_points'].sort_values(ascending=False).values[0:num_QB].sum()
-
-    # RB
-    num_RB = slots.loc[np.where(slots['position'] == 'RB')[0], 'slots'].values[0]
-    idx_RB = np.where(players.loc[:, 'position'] == 'RB')[0]
-    score_RB = players.loc[idx_RB, 'actual_points'].sort_values(ascending=False).values[0:num_RB].sum()
-
-    # WR
-    num_WR = slots.loc[np.where(slots['position'] == 'WR')[0], 'slots'].values[0]
-    idx_WR = np.where(players.loc[:, 'position'] == 'WR')[0]
-    score_WR = players.loc[idx_WR, 'actual_points'].sort_values(ascending=False).values[0:num_WR].sum()
-
-    # TE
-    num_TE = slots.loc[np.where(slots['position'] == 'TE')[0], 'slots'].values[0]
-    idx_TE = np.where(players.loc[:, 'position'] == 'TE')[0]
-    score_TE = players.loc[idx_TE, 'actual_points'].sort_values(ascending=False).values[0:num_TE].sum()
-
-    # FLEX (RB, WR or TE) - will return 0 if no players available for FLEX position
-    num_FLEX = slots.loc[np.where(slots['position'] == 'FLEX')[0], 'slots'].values[0]
-    score_RB_FLEX = np.delete(players.loc[idx_RB, 'actual_points'].sort_values(ascending=False).values, np.arange(0, num_RB))
-    score_WR_FLEX = np.delete(players.loc[idx_WR, 'actual_points'].sort_values(ascending=False).values, np.arange(0, num_WR))
-    score_TE_FLEX = np.delete(players.loc[idx_TE, 'actual_points'].sort_values(ascending=False).values, np.arange(0, num_TE))
-    score_FLEX = np.sort(np.concatenate((score_RB_FLEX, score_WR_FLEX, score_TE_FLEX)))[::-1][0:num_FLEX].sum()
-
-    # D/ST
-    num_DST = slots.loc[np.where(slots['position'] == 'DST')[0], 'slots'].values[0]
-    idx_DST = np.where(players.loc[:, 'position'] == 'D/ST')[0]
-    score_DST = players.loc[idx_DST, 'actual_points'].sort_values(ascending=False).values[0:num_DST].sum()
-
-    # K
-    num_K = slots.loc[np.where(slots['position'] == 'K')[0], 'slots'].values[0]
-    idx_K = np.where(players.loc[:, 'position'] == 'K')[0]
-    score_K = players.loc[idx_K, 'actual_points'].sort_values(ascending=False).values[0:num_K].sum()
-
-    # Sum best scores for each position
-    score_best = score_QB + score_RB + score_WR + score_TE + score_FLEX + score_DST + score_K
-    score_best = float('{0:.1f}'.format(round(score_best, 1)))
 
-    return score_proj, score_actual, score_best
+    df = pd.read_sql_query(week_players_query(week, league_id, season_id), conn)
+
+    conn.close()
 
+    return df[columns]
 
-def make_standings_tables(ff_db, weeks):
+
+@metrics.timed('analysis.standings')
+def make_standings_tables(ff_db, weeks, scores=None, league_id=None, season_id=None, matchups=None, teams=None):
     """
     Create league standings using the following scoring methods:
     (1) Score based on ESPN projections (proj_standings)
@@ -106,146 +93,100 @@ def make_standings_tables(ff_db, weeks):
         (best_standings)
 
     League standings created for a set of team_ids across matchups over a given
-    set of weeks.
+    set of weeks. Standings are created for the league_id and season_id given,
+    or else for every league-season in ff_db, each ranked separately (with
+    league_id and season_id columns telling them apart). Only the rows of the
+    league-seasons asked for are read. scores, matchups and teams are
+    DataFrames from score_engine.get_league_scores, score_engine.load_matchups
+    and score_engine.load_teams; they are loaded from ff_db if not given. ff_db
+    may also be a Parquet store (see parquet_store).
     """
-    conn = sqlite3.connect(ff_db)
-    cur = conn.cursor()
-
-    sqlstr = '''SELECT Matchups.* FROM Matchups'''
-    matchups = pd.read_sql_query(sqlstr, conn)
-
-    sqlstr = '''SELECT Teams.team_id, Teams.team_name FROM Teams'''
-    teams = pd.read_sql_query(sqlstr, conn)
-
-    # Create copies of teams DataFrame
-    proj_standings = teams.copy()
-    actual_standings = teams.copy()
-    best_standings = teams.copy()
-
-    # Add columns for tallying W/L/T/PCT/PF/PA
-    proj_standings['W'] = 0 # nunber of wins
-    proj_standings['L'] = 0 # number of losses
-    proj_standings['T'] = 0 # number of ties
-    proj_standings['PCT'] = 0 # winning percentage
-    proj_standings['PF'] = 0 # points for
-    proj_standings['PA'] = 0 # points against
-    actual_standings['W'] = 0
-    actual_standings['L'] = 0
-    actual_standings['T'] = 0
-    actual_standings['PCT'] = 0
-    actual_standings['PF'] = 0
-    actual_standings['PA'] = 0
-    best_standings['W'] = 0
-    best_standings['L'] = 0
-    best_standings['T'] = 0
-    best_standings['PCT'] = 0
-    best_standings['PF'] = 0
-    best_standings['PA'] = 0
-
-    for week in weeks:
-        # Get matchups for a given week
-        idx = np.where(matchups['week'] == week)[0]
-        matchups_week = matchups.ix[idx, :].reset_index(drop=True)
-
-        for match in np.arange(np.shape(matchups_week)[0]):
-            # Get the team ids for the home and away teams for each matchup
-            home_id = teams.loc[np.where(teams['team_name'] == matchups_week.loc[match, 'home'])[0], 'team_id'].values[0]
-            away_id = teams.loc[np.where(teams['team_name'] == matchups_week.loc[match, 'away'])[0], 'team_id'].values[0]
-
-            # Get the index corresponding to the home/away team ids
-            home_idx = np.where(teams['team_id'] == home_id)[0]
-            away_idx = np.where(teams['team_id'] == away_id)[0]
-
-            # Get projected, actual and best possible scores for home/away teams
-            score_proj_home, score_actual_home, score_best_home = get_scores(ff_db, home_id, week)
-            score_proj_away, score_actual_away, score_best_away = get_scores(ff_db, away_id, week)
-
-            # Projected scores W/L/T
-            if score_proj_home > score_proj_away:
-                proj_standings.loc[home_idx, 'W'] += 1
-                proj_standings.loc[away_idx, 'L'] += 1
-            elif score_proj_home < score_proj_away:
-                proj_standings.loc[home_idx, 'L'] += 1
-                proj_standings.loc[away_idx, 'W'] += 1
-            elif score_proj_home == score_proj_away:
-                proj_standings.loc[home_idx, 'T'] += 1
-                proj_standings.loc[away_idx, 'T'] += 1
-
-            # Projected scores PCT/PF/PA - home
-            proj_standings.loc[home_idx, 'PCT'] = float('{0:.2f}'.format(round((proj_standings.loc[home_idx, 'W']+0.5*proj_standings.loc[home_idx, 'T']) / ((proj_standings.loc[home_idx, 'W']+0.5*proj_standings.loc[home_idx, 'T'])+(proj_standings.loc[home_idx, 'L']+0.5*proj_standings.loc[home_idx, 'T'])), 2)))
-            proj_standings.loc[home_idx, 'PF'] += score_proj_home
-            proj_standings.loc[home_idx, 'PA'] += score_proj_away
-
-            # Projected scores PCT/PF/PA - away
-            proj_standings.loc[away_idx, 'PCT'] = float('{0:.2f}'.format(round((proj_standings.loc[away_idx, 'W']+0.5*proj_standings.loc[away_idx, 'T']) / ((proj_standings.loc[away_idx, 'W']+0.5*proj_standings.loc[away_idx, 'T'])+(proj_standings.loc[away_idx, 'L']+0.5*proj_standings.loc[away_idx, 'T'])), 2)))
-            proj_standings.loc[away_idx, 'PF'] += score_proj_away
-            proj_standings.loc[away_idx, 'PA'] += score_proj_home
-
-            # Actual scores W/L/T
-            if score_actual_home > score_actual_away:
-                actual_standings.loc[home_idx, 'W'] += 1
-                actual_standings.loc[away_idx, 'L'] += 1
-            elif score_actual_home < score_actual_away:
-                actual_standings.loc[home_idx, 'L'] += 1
-                actual_standings.loc[away_idx, 'W'] += 1
-            elif score_actual_home == score_actual_away:
-                actual_standings.loc[home_idx, 'T'] += 1
-                actual_standings.loc[away_idx, 'T'] += 1
-
-            # Actual scores PCT/PF/PA - home
-            actual_standings.loc[home_idx, 'PCT'] = float('{0:.2f}'.format(round((actual_standings.loc[home_idx, 'W']+0.5*actual_standings.loc[home_idx, 'T']) / ((actual_standings.loc[home_idx, 'W']+0.5*actual_standings.loc[home_idx, 'T'])+(actual_standings.loc[home_idx, 'L']+0.5*actual_standings.loc[home_idx, 'T'])), 2)))
-            actual_standings.loc[home_idx, 'PF'] += score_actual_home
-            actual_standings.loc[home_idx, 'PA'] += score_actual_away
-
-            # Actual scores PCT/PF/PA - away
-            actual_standings.loc[away_idx, 'PCT'] = float('{0:.2f}'.format(round((actual_standings.loc[away_idx, 'W']+0.5*actual_standings.loc[away_idx, 'T']) / ((actual_standings.loc[away_idx, 'W']+0.5*actual_standings.loc[away_idx, 'T'])+(actual_standings.loc[away_idx, 'L']+0.5*actual_standings.loc[away_idx, 'T'])), 2)))
-            actual_standings.loc[away_idx, 'PF'] += score_actual_away
-            actual_standings.loc[away_idx, 'PA'] += score_actual_home
-
-            # Best scores W/L/T
-            if score_best_home > score_best_away:
-                best_standings.loc[home_idx, 'W'] += 1
-                best_standings.loc[away_idx, 'L'] += 1
-            elif score_best_home < score_best_away:
-                best_standings.loc[home_idx, 'L'] += 1
-                best_standings.loc[away_idx, 'W'] += 1
-            elif score_best_home == score_best_away:
-                best_standings.loc[home_idx, 'T'] += 1
-                best_standings.loc[away_idx, 'T'] += 1
-
-            # Best scores PCT/PF/PA - home
-            best_standings.loc[home_idx, 'PCT'] = float('{0:.2f}'.format(round((best_standings.loc[home_idx, 'W']+0.5*best_standings.loc[home_idx, 'T']) / ((best_standings.loc[home_idx, 'W']+0.5*best_standings.loc[home_idx, 'T'])+(best_standings.loc[home_idx, 'L']+0.5*best_standings.loc[home_idx, 'T'])), 2)))
-            best_standings.loc[home_idx, 'PF'] += score_best_home
-            best_standings.loc[home_idx, 'PA'] += score_best_away
-
-            # Best scores PCT/PF/PA - away
-            best_standings.loc[away_idx, 'PCT'] = float('{0:.2f}'.format(round((best_standings.loc[away_idx, 'W']+0.5*best_standings.loc[away_idx, 'T']) / ((best_standings.loc[away_idx, 'W']+0.5*best_standings.loc[away_idx, 'T'])+(best_standings.loc[away_idx, 'L']+0.5*best_standings.loc[away_idx, 'T'])), 2)))
-            best_standings.loc[away_idx, 'PF'] += score_best_away
-            best_standings.loc[away_idx, 'PA'] += score_best_home
-
-    # Sort standings by W, PCT, PF and then PA
-    proj_standings = proj_standings.sort_values(['W', 'PCT', 'PF', 'PA'], ascending=[False, False, False, False])
-    actual_standings = actual_standings.sort_values(['W', 'PCT', 'PF', 'PA'], ascending=[False, False, False, False])
-    best_standings = best_standings.sort_values(['W', 'PCT', 'PF', 'PA'], ascending=[False, False, False, False])
+    if scores is None:
+        scores = score_engine.get_league_scores(ff_db, weeks, league_id=league_id, season_id=season_id)
+    if matchups is None:
+        matchups = score_engine.load_matchups(ff_db, weeks, league_id, season_id)
+    if teams is None:
+        teams = score_engine.load_teams(ff_db, league_id, season_id)
+
+    # Tally W/L/T/PCT/PF/PA over all matchups of all weeks of each
+    # league-season at once
+    keys = ['league_id', 'season_id']
+    teams_by_season = dict(list(teams.groupby(keys)))
+    scores_by_season = dict(list(scores.groupby(keys)))
+
+    tables = {'proj': [], 'actual': [], 'best': []}
+    for key, season_matchups in matchups.groupby(keys):
+        season_tables = standings.build_standings(season_matchups, teams_by_season[key], scores_by_season[key], ('proj', 'actual', 'best'))
+        for mode in tables:
+            tables[mode].append(season_tables[mode])
+
+    proj_standings, actual_standings, best_standings = [pd.concat(tables[mode]) if tables[mode] else teams.iloc[:0]
+                                                         for mode in ['proj', 'actual', 'best']]
 
     return proj_standings, actual_standings, best_standings
 
 
-def plot_proj_accuracy(ff_db, team_ids, weeks):
+@metrics.timed('analysis.luck')
+def make_luck_tables(ff_db, weeks, scores=None, league_id=None, season_id=None, matchups=None, teams=None,
+                     num_schedules=10000, seed=0):
+    """
+    All-play and schedule luck standings (see standings.schedule_luck) for the
+    following scoring modes:
+    (1) Score based on ESPN projections
+    (2) Actual score
+    (3) Score based on optimal combination of players from starters and bench
+
+    Returns a dict keyed by mode ('proj', 'actual' and 'best') of (standings,
+    distribution) tuples, where distribution holds the probability of each
+    number of wins over num_schedules random schedules. Like
+    make_standings_tables, each league-season is ranked separately, and
+    scores, matchups and teams are loaded from ff_db if not given.
+    """
+    if scores is None:
+        scores = score_engine.get_league_scores(ff_db, weeks, league_id=league_id, season_id=season_id)
+    if matchups is None:
+        matchups = score_engine.load_matchups(ff_db, weeks, league_id, season_id)
+    if teams is None:
+        teams = score_engine.load_teams(ff_db, league_id, season_id)
+
+    keys = ['league_id', 'season_id']
+    teams_by_season = dict(list(teams.groupby(keys)))
+    scores_by_season = dict(list(scores.groupby(keys)))
+
+    tables = dict((mode, ([], [])) for mode in ['proj', 'actual', 'best'])
+    for key, season_matchups in matchups.groupby(keys):
+        season_tables = standings.schedule_luck(season_matchups, teams_by_season[key], scores_by_season[key],
+                                                ('proj', 'actual', 'best'), num_schedules, seed)
+        for mode in tables:
+            luck, _, distribution = season_tables[mode]
+            tables[mode][0].append(luck)
+            tables[mode][1].append(distribution)
+
+    return dict((mode, tuple(pd.concat(parts) if parts else teams.iloc[:0] for parts in tables[mode]))
+                for mode in tables)
+
+
+def plot_proj_accuracy(ff_db, team_ids, weeks, scores=None, league_id=None, season_id=None):
     """
     Plot actual scores vs. ESPN projected scores for a set of team_ids and
     weeks. Data points to the left of the unity line indicate that the ESPN
     projected score is greater than the actual score. Data points to the right
     of the unity line indicate the actual scores beat the ESPN projections.
+    scores is a DataFrame from score_engine.get_league_scores for the
+    league_id and season_id; it is calculated from ff_db if not given.
     """
     fig = plt.figure()
 
     scores_proj = []
     scores_actual = []
 
+    if scores is None:
+        scores = score_engine.get_league_scores(ff_db, weeks, league_id=league_id, season_id=season_id)
+    team_scores = lookup_scores(scores)
+
     for team_id in team_ids:
         for week in weeks:
-            score_proj, score_actual, _ = get_scores(ff_db, team_id, week)
+            score_proj, score_actual, _ = team_scores[(team_id, week)]
             scores_proj.append(score_proj)
             scores_actual.append(score_actual)
 
@@ -270,22 +211,27 @@ def plot_proj_accuracy(ff_db, team_ids, weeks):
     return fig
 
 
-def plot_manager_efficiency(ff_db, team_ids, weeks):
+def plot_manager_efficiency(ff_db, team_ids, weeks, scores=None, league_id=None, season_id=None):
     """
     Plot actual scores vs. best possible scores for a set of team_ids and weeks.
     Data points closer to the unity line indicate the manager set a more
     efficient lineup (didn't leave too many points on the bench). Data points
     further away from the unity line indicate the manager left a lot of points
-    on the bench.
+    on the bench. scores is a DataFrame from score_engine.get_league_scores for
+    the league_id and season_id; it is calculated from ff_db if not given.
     """
     fig = plt.figure()
 
     scores_actual = []
     scores_best = []
 
+    if scores is None:
+        scores = score_engine.get_league_scores(ff_db, weeks, league_id=league_id, season_id=season_id)
+    team_scores = lookup_scores(scores)
+
     for team_id in team_ids:
         for week in weeks:
-            _, score_actual, score_best = get_scores(ff_db, team_id, week)
+            _, score_actual, score_best = team_scores[(team_id, week)]
             scores_actual.append(score_actual)
             scores_best.append(score_best)
 
@@ -310,46 +256,55 @@ def plot_manager_efficiency(ff_db, team_ids, weeks):
     return fig
 
 
-def plot_absolute_proj_error(ff_db, week):
+def draw_error_bars(ax, df, column):
+    """
+    Draw a bar for the projection error in column of each player in df, with
+    the player's name, position and a symbol to indicate if they were played as
+    a starter above (or below) the bar. All bars are drawn in a single call,
+    each in the next color of the color cycle. Returns lists of the positive and
+    negative errors.
+    """
+    errors = df[column].values
+    idx = np.arange(len(df))
+    colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+
+    ax.bar(idx, errors, width=1, color=[colors[i % len(colors)] for i in idx])
+
+    for i, player, position, slot, error in zip(idx, df['player'], df['position'], df['slot'], errors):
+        # Indicate if player was a starter or not
+        if slot != 'Bench':
+            label = player + '(' + position + ')' + '*'
+        else:
+            label = player + '(' + position + ')'
+        if error >= 0:
+            ax.text(i, 1.05*error, label, ha='center', va='bottom', rotation='vertical')
+        else:
+            ax.text(i, 1.05*error, label, ha='center', va='top', rotation='vertical')
+
+    return list(errors[errors >= 0]), list(errors[errors < 0])
+
+
+def plot_absolute_proj_error(ff_db, week, league_id=None, season_id=None, players=None):
     """
     Bar plot of the absolute difference between the ESPN projected score and
     actual score for each player from the starting lineup and bench for a set of
     team_ids during a given week of matchups. Above each bar is the player's
     name, postion and a symbol to indicate if they were played as a starter.
+    Only players of the league_id and season_id are plotted, if given. players
+    is a DataFrame from load_week_players; it is loaded from ff_db if not
+    given.
     """
-    conn = sqlite3.connect(ff_db)
-    cur = conn.cursor()
-
-    sqlstr = '''SELECT Players.player, Players.position, Players.slot,
-        Players.projected_points, Players.actual_points
-        FROM Players WHERE Players.week = %s''' % (week)
-    df = pd.read_sql_query(sqlstr, conn)
-
     # Only consider players with projections > 0
-    idx = np.where(df.loc[:, 'projected_points'] > 0)[0]
-    df = df.ix[idx, :].reset_index(drop=True)
+    if players is None:
+        players = load_week_players(ff_db, week, league_id, season_id)
+    df = players.copy()
 
     df['abs_error'] = df['projected_points']-df['actual_points']
     df = df.sort_values(['abs_error'], ascending=[False]).reset_index(drop=True)
 
     fig, ax = plt.subplots(figsize=(40,20))
 
-    errors_pos = []
-    errors_neg = []
-
-    for idx, player, position, slot, abs_error in zip(df.index.values, df['player'], df['position'], df['slot'], df['abs_error']):
-        rect = ax.bar(idx, abs_error, width=1)
-        # Indicate if player was a starter or not
-        if slot != 'Bench':
-            label = player + '(' + position + ')' + '*'
-        else:
-            label = player + '(' + position + ')'
-        if rect[0].get_y() >= 0:
-            errors_pos.append(rect[0].get_height())
-            ax.text(rect[0].get_x() + rect[0].get_width()/2., 1.05*rect[0].get_height(), label, ha='center', va='bottom', rotation='vertical')
-        else:
-            errors_neg.append(-rect[0].get_height())
-            ax.text(rect[0].get_x() + rect[0].get_width()/2., -1.05*rect[0].get_height(), label, ha='center', va='top', rotation='vertical')
+    errors_pos, errors_neg = draw_error_bars(ax, df, 'abs_error')
 
     ax.text(3, -3, '* denotes player was started', fontsize=30)
     ax.text(3, -5, '$^1$ error = projected points - actual points', fontsize=30)
@@ -358,8 +313,8 @@ def plot_absolute_proj_error(ff_db, week):
 
     # Find max of all positive errors and set positive y-lim to nearest 5 greater than max+5
     # Find min of all negative errors and set negative y-lim to nearest 5 less than min-5
-    pos_ylim = int(math.ceil((max(errors_pos)+5) / 5.0)) * 5
-    neg_ylim = int(math.floor((min(errors_neg)-5) / 5.0)) * 5
+    pos_ylim = int(math.ceil((max(errors_pos + [0])+5) / 5.0)) * 5
+    neg_ylim = int(math.floor((min(errors_neg + [0])-5) / 5.0)) * 5
     # Check if neg_ylim greater than the location of text already on plot
     if neg_ylim > -5:
         neg_ylim = -5
@@ -373,46 +328,27 @@ def plot_absolute_proj_error(ff_db, week):
     return fig
 
 
-def plot_relative_proj_error(ff_db, week):
+def plot_relative_proj_error(ff_db, week, league_id=None, season_id=None, players=None):
     """
     Bar plot of the realative difference between the ESPN projected score and
     actual score for each player from the starting lineup and bench for a set of
     team_ids during a given week of matchups. Above each bar is the player's
     name, postion and a symbol to indicate if they were played as a starter.
+    Only players of the league_id and season_id are plotted, if given. players
+    is a DataFrame from load_week_players; it is loaded from ff_db if not
+    given.
     """
-    conn = sqlite3.connect(ff_db)
-    cur = conn.cursor()
-
-    sqlstr = '''SELECT Players.player, Players.position, Players.slot,
-        Players.projected_points, Players.actual_points
-        FROM Players WHERE Players.week = %s''' % (week)
-    df = pd.read_sql_query(sqlstr, conn)
-
     # Only consider players with projections > 0
-    idx = np.where(df.loc[:, 'projected_points'] > 0)[0]
-    df = df.ix[idx, :].reset_index(drop=True)
+    if players is None:
+        players = load_week_players(ff_db, week, league_id, season_id)
+    df = players.copy()
 
     df['abs_error'] = (df['projected_points']-df['actual_points']) / df['projected_points']
     df = df.sort_values(['abs_error'], ascending=[False]).reset_index(drop=True)
 
     fig, ax = plt.subplots(figsize=(40,20))
 
-    errors_pos = []
-    errors_neg = []
-
-    for idx, player, position, slot, abs_error in zip(df.index.values, df['player'], df['position'], df['slot'], df['abs_error']):
-        rect = ax.bar(idx, abs_error, width=1)
-        # Indicate if player was a starter or not
-        if slot != 'Bench':
-            label = player + '(' + position + ')' + '*'
-        else:
-            label = player + '(' + position + ')'
-        if rect[0].get_y() >= 0:
-            errors_pos.append(rect[0].get_height())
-            ax.text(rect[0].get_x() + rect[0].get_width()/2., 1.05*rect[0].get_height(), label, ha='center', va='bottom', rotation='vertical')
-        else:
-            errors_neg.append(-rect[0].get_height())
-            ax.text(rect[0].get_x() + rect[0].get_width()/2., -1.05*rect[0].get_height(), label, ha='center', va='top', rotation='vertical')
+    errors_pos, errors_neg = draw_error_bars(ax, df, 'abs_error')
 
     ax.text(3, -0.25, '* denotes player was started', fontsize=30)
     ax.text(3, -0.5, r'$^1$ error = $\mathregular{\frac{projected - actual}{projected}}$', fontsize=30)
@@ -421,8 +357,8 @@ def plot_relative_proj_error(ff_db, week):
 
     # Find max of all positive errors and set positive y-lim to nearest 0.5 greater than max+0.5
     # Find min of all negative errors and set negative y-lim to nearest 0.5 less than min-0.5
-    pos_ylim = int(math.ceil((max(errors_pos)+0.5) / 0.5)) * 0.5
-    neg_ylim = int(math.floor((min(errors_neg)-0.5) / 0.5)) * 0.5
+    pos_ylim = int(math.ceil((max(errors_pos + [0])+0.5) / 0.5)) * 0.5
+    neg_ylim = int(math.floor((min(errors_neg + [0])-0.5) / 0.5)) * 0.5
     # Check if neg_ylim greater than the location of text already on plot
     if neg_ylim > -0.5:
         neg_ylim = -0.5
@@ -436,6 +372,172 @@ def plot_relative_proj_error(ff_db, week):
     return fig
 
 
+def figure_jobs(path, team_ids, weeks, scores, players):
+    """
+    List the figures of the weekly report as (file path, plot function name,
+    arguments) tuples, for render_figures. All data the plots need is prepared
+    up front: scores is a DataFrame from score_engine.get_league_scores and
+    players is a DataFrame from load_week_players for the most recent week.
+    The largest figures come first.
+    """
+    this_week = weeks[-1]
+    if len(weeks) == 1:
+        weeks_name = 'week_' + str(weeks[0])
+    else:
+        weeks_name = 'weeks_' + str(weeks[0]) + '-' + str(weeks[-1])
+
+    return [(os.path.join(path, 'abs_error_week_' + str(this_week) + '.png'), 'plot_absolute_proj_error', (None, this_week, None, None, players)),
+            (os.path.join(path, 'rel_error_week_' + str(this_week) + '.png'), 'plot_relative_proj_error', (None, this_week, None, None, players)),
+            (os.path.join(path, 'proj_accuracy_' + weeks_name + '.png'), 'plot_proj_accuracy', (None, team_ids, weeks, scores)),
+            (os.path.join(path, 'manager_efficiency_' + weeks_name + '.png'), 'plot_manager_efficiency', (None, team_ids, weeks, scores))]
+
+
+def init_render_worker():
+    """
+    Set up a process for rendering figures with the non-interactive Agg
+    backend.
+    """
+    plt.switch_backend('Agg')
+
+
+def render_figure(job):
+    """
+    Draw a figure of a (file path, plot function name, arguments, dpi,
+    preview_dpi) job and save it. If preview_dpi is given, a lower resolution
+    preview is also saved, with '_preview' added to the file name. Returns the
+    file path and the seconds taken.
+    """
+    path, name, args, dpi, preview_dpi = job
+    start = time.time()
+
+    fig = globals()[name](*args)
+    fig.savefig(path, dpi=dpi, format='png')
+    if preview_dpi:
+        fig.savefig(os.path.splitext(path)[0] + '_preview.png', dpi=preview_dpi, format='png')
+    plt.close(fig)
+
+    return path, time.time() - start
+
+
+def render_figures(jobs, dpi=300, preview_dpi=None, processes=1):
+    """
+    Render the (file path, plot function name, arguments) jobs from figure_jobs
+    with the Agg backend, spread over processes worker processes (or in this
+    process if processes is 1). Returns a list of (file path, seconds) tuples in
+    the order figures were finished.
+    """
+    jobs = [(path, name, args, dpi, preview_dpi) for path, name, args in jobs]
+
+    if not jobs:
+        return []
+
+    if processes == 1:
+        init_render_worker()
+        return [render_figure(job) for job in jobs]
+
+    pool = multiprocessing.Pool(min(processes, len(jobs)), init_render_worker)
+    try:
+        return list(pool.imap_unordered(render_figure, jobs))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def make_report(ff_db, league_id, season_id, weeks, team_ids=None, out_dir=None, processes=1, preview_dpi=None,
+                num_schedules=10000):
+    """
+    Generate and save the figures and tables of main for a list of weeks of a
+    league-season, to 'figures' and 'tables' directories in out_dir (the
+    current working directory by default). team_ids are loaded from the Teams
+    table if not given. Figures and tables whose data and parameters haven't
+    changed since they were last saved are skipped (see artifact_cache).
+    """
+    # Determine most recent week for list of weeks
+    this_week = weeks[-1]
+
+    # Get team_ids for all teams in the league
+    if team_ids is None:
+        team_ids = list(score_engine.load_teams(ff_db, league_id, season_id)['team_id'])
+
+    # Get directory for saving files
+    out_dir = out_dir or os.getcwd()
+
+    print '\nGenerating and saving figures...'
+
+    # Make a directory for saving figures if it doesn't already exist
+    if not os.path.exists(out_dir + '/figures'):
+        os.makedirs(out_dir + '/figures')
+
+    # Calculate scores for all teams and weeks, and load the players of the
+    # most recent week, once for all figures and tables
+    scores = score_engine.get_league_scores(ff_db, weeks, league_id=league_id, season_id=season_id)
+    players = load_week_players(ff_db, this_week, league_id, season_id)
+
+    # Render and save figures in parallel, skipping those whose data hasn't
+    # changed
+    manifest_path = artifact_cache.manifest_path(out_dir)
+    manifest = artifact_cache.load_manifest(manifest_path)
+    jobs = figure_jobs(out_dir + '/figures', team_ids, weeks, scores, players)
+    digests = dict((path, artifact_cache.data_hash(name, 300, preview_dpi, *args[1:])) for path, name, args in jobs)
+
+    stale = []
+    for job in jobs:
+        if artifact_cache.is_fresh(manifest, manifest_path, job[0], digests[job[0]]):
+            print '{} unchanged, skipped'.format(os.path.basename(job[0]))
+        else:
+            stale.append(job)
+
+    for path, seconds in render_figures(stale, 300, preview_dpi, processes):
+        artifact_cache.record(manifest, manifest_path, path, digests[path])
+        metrics.observe('render.figure', seconds, figure=os.path.basename(path))
+        print '{} saved ({:.1f} s)'.format(os.path.basename(path), seconds)
+    artifact_cache.save_manifest(manifest, manifest_path)
+
+    print 'Generating and saving tables...\n'
+
+    # Make a directory for saving data tables if it doesn't already exist
+    if not os.path.exists(out_dir + '/tables'):
+        os.makedirs(out_dir + '/tables')
+
+    # Create standings tables and save each as a seperate CSV file, unless
+    # their matchups, teams and scores haven't changed
+    if len(weeks) == 1:
+        weeks_name = 'week_' + str(weeks[0])
+    else:
+        weeks_name = 'weeks_' + str(weeks[0]) + '-' + str(weeks[-1])
+    paths = [out_dir + '/tables/' + mode + '_standings_' + weeks_name + '.csv' for mode in ['proj', 'actual', 'best']]
+
+    matchups = score_engine.load_matchups(ff_db, weeks, league_id, season_id)
+    teams = score_engine.load_teams(ff_db, league_id, season_id)
+    digest = artifact_cache.data_hash('standings', weeks, scores, matchups, teams)
+
+    if all(artifact_cache.is_fresh(manifest, manifest_path, path, digest) for path in paths):
+        print 'Standings tables unchanged, skipped'
+    else:
+        tables = make_standings_tables(ff_db, weeks, scores, league_id, season_id, matchups, teams)
+        for path, table in zip(paths, tables):
+            table.to_csv(path, index=False)
+            artifact_cache.record(manifest, manifest_path, path, digest)
+            print '{} saved'.format(os.path.basename(path))
+        artifact_cache.save_manifest(manifest, manifest_path)
+
+    # Create all-play and schedule luck standings, and the distributions of
+    # wins over random schedules, from the same scores
+    paths = [out_dir + '/tables/' + mode + '_' + name + '_' + weeks_name + '.csv'
+             for mode in ['proj', 'actual', 'best'] for name in ['luck_standings', 'win_distribution']]
+    digest = artifact_cache.data_hash('luck', weeks, scores, matchups, teams, num_schedules)
+
+    if all(artifact_cache.is_fresh(manifest, manifest_path, path, digest) for path in paths):
+        print 'Schedule luck tables unchanged, skipped'
+    else:
+        tables = make_luck_tables(ff_db, weeks, scores, league_id, season_id, matchups, teams, num_schedules)
+        for path, table in zip(paths, [table for mode in ['proj', 'actual', 'best'] for table in tables[mode]]):
+            table.to_csv(path, index=False)
+            artifact_cache.record(manifest, manifest_path, path, digest)
+            print '{} saved'.format(os.path.basename(path))
+        artifact_cache.save_manifest(manifest, manifest_path)
+
+
 def main():
     """
     User-specified parameters:
@@ -443,6 +545,13 @@ def main():
     (2) league_id: id number of the ESPN FF league
     (3) season_id: year of FF season
     (4) weeks: list of matchup weeks
+    (5) processes: number of figures rendered at the same time
+    (6) preview_dpi: resolution of lower resolution previews of the figures
+        (None for no previews)
+    (7) num_schedules: number of random schedules for schedule luck standings
+
+    Figures and tables whose data and parameters haven't changed since they
+    were last saved are not generated again (see artifact_cache).
 
     Returns:
     (1) Creates 'figures' directory in current working directory (if it doesn't
@@ -454,66 +563,27 @@ def main():
         already exist)
     (4) Generates the following standings tables and saves them to the 'tables'
         directory: (a) proj_standings, (b) actual_standings and (c) best_standings
+    (5) Generates all-play and schedule luck standings, and distributions of
+        wins over random schedules, for each scoring mode and saves them to the
+        'tables' directory
     """
     ff_db = 'DATABASE_NAME.sqlite'
     league_id = 000000
     season_id = 0000
-    weeks = [1, 2, 3, ...]
-
-    # Determine most recent week for list of weeks
-    this_week = weeks[-1]
+    weeks = [1, 2, 3]
+    processes = multiprocessing.cpu_count()
+    preview_dpi = None
+    num_schedules = 10000
 
     # Get team_ids for all teams in the league
-    num_teams = get_num_teams(league_id, season_id)
+    num_teams = league_settings.get_num_teams(league_id, season_id)
     team_ids = range(1, num_teams+1)
 
-    # Get cwd for saving files
-    cwd = os.getcwd()
-
-    print '\nGenerating and saving figures...'
-
-    # Make a directory for saving figures if it doesn't already exist
-    if not os.path.exists('figures'):
-        os.makedirs('figures')
-
-    # Generate figures
-    fig_proj_accuracy = plot_proj_accuracy(ff_db, team_ids, weeks)
-    fig_manager_efficiency = plot_manager_efficiency(ff_db, team_ids, weeks)
-    fig_absolute_proj_error = plot_absolute_proj_error(ff_db, this_week)
-    fig_relative_proj_error = plot_relative_proj_error(ff_db, this_week)
-
-    # Increase size of player projection error figures
-    fig_absolute_proj_error.set_size_inches(40, 20)
-    fig_relative_proj_error.set_size_inches(40, 20)
-
-    # Save figures
-    if len(weeks) == 1:
-        fig_proj_accuracy.savefig(cwd + '/figures/proj_accuracy_week_' + str(weeks[0]) + '.png', dpi=300, format='png')
-        fig_manager_efficiency.savefig(cwd + '/figures/manager_efficiency_week_' + str(weeks[0]) + '.png', dpi=300, format='png')
-    elif len(weeks) > 1:
-        fig_proj_accuracy.savefig(cwd + '/figures/proj_accuracy_weeks_' + str(weeks[0]) + '-' + str(weeks[-1]) + '.png', dpi=300, format='png')
-        fig_manager_efficiency.savefig(cwd + '/figures/manager_efficiency_weeks_' + str(weeks[0]) + '-' + str(weeks[-1]) + '.png', dpi=300, format='png')
-    fig_absolute_proj_error.savefig(cwd + '/figures/abs_error_week_' + str(this_week) + '.png', dpi=300, format='png')
-    fig_relative_proj_error.savefig(cwd + '/figures/rel_error_week_' + str(this_week) + '.png', dpi=300, format='png')
-
-    print 'Generating and saving tables...\n'
-
-    # Make a directory for saving data tables if it doesn't already exist
-    if not os.path.exists('tables'):
-        os.makedirs('tables')
-
-    # Create standings tables and save each as a seperate CSV file
-    proj_standings, actual_standings, best_standings = make_standings_tables(ff_db, weeks)
-    if len(weeks) == 1:
-        proj_standings.to_csv(cwd + '/tables/proj_standings_week_' + str(weeks[0]) + '.csv', index=False)
-        actual_standings.to_csv(cwd + '/tables/actual_standings_week_' + str(weeks[0]) + '.csv', index=False)
-        best_standings.to_csv(cwd + '/tables/best_standings_week_' + str(weeks[0]) + '.csv', index=False)
-    elif len(weeks) > 1:
-        proj_standings.to_csv(cwd + '/tables/proj_standings_weeks_' + str(weeks[0]) + '-' + str(weeks[-1]) + '.csv', index=False)
-        actual_standings.to_csv(cwd + '/tables/actual_standings_weeks_' + str(weeks[0]) + '-' + str(weeks[-1]) + '.csv', index=False)
-        best_standings.to_csv(cwd + '/tables/best_standings_weeks_' + str(weeks[0]) + '-' + str(weeks[-1]) + '.csv', index=False)
+    make_report(ff_db, league_id, season_id, weeks, team_ids, processes=processes, preview_dpi=preview_dpi,
+                num_schedules=num_schedules)
 
 
 if __name__ == '__main__':
+    metrics.enable_from_argv()
     main()
     sys.exit(0)
@@ -0,0 +1,299 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import sqlite3
+import compact_store
+import db_writer
+import lineup_optimizer
+import metrics
+import parquet_store
+import schema
+
+# Columns identifying the scores of a team and week
+score_keys = ['league_id', 'season_id', 'team_id', 'week']
+
+# Columns of the Players table needed for scoring
+player_columns = score_keys + ['slot', 'position', 'projected_points', 'actual_points']
+
+
+def week_filter(weeks, table='Players'):
+    """
+    SQL condition restricting the rows of table to a set of weeks (all weeks if
+    weeks is None).
+    """
+    if weeks is None:
+        return '1'
+
+    return '%s.week IN (%s)' % (table, ', '.join(str(int(week)) for week in weeks))
+
+
+def players_query(weeks=None, league_id=None, season_id=None):
+    """
+    SQL query for the scoring columns of the Players table (see load_players).
+    """
+    return '''SELECT Players.league_id, Players.season_id, Players.team_id,
+        Players.week, Players.slot, Players.position, Players.projected_points,
+        Players.actual_points
+        FROM Players WHERE %s AND %s''' % (schema.partition_filter('Players', league_id, season_id), week_filter(weeks))
+
+
+@metrics.timed('analysis.load_players')
+def load_players(ff_db, weeks=None, league_id=None, season_id=None):
+    """
+    Load the columns of the Players table needed for scoring, optionally only
+    for a set of weeks, a league_id and a season_id. ff_db may also be a
+    Parquet store (see parquet_store). Players are read from the compact store
+    of ff_db if it has an up-to-date one (see compact_store).
+    """
+    if parquet_store.is_store(ff_db):
+        return parquet_store.read_table(ff_db, 'Players', player_columns, league_id, season_id, weeks)
+
+    players = compact_store.load_players(ff_db, weeks, league_id, season_id, player_columns)
+    if players is not None:
+        return players
+
+    conn = sqlite3.connect(ff_db)
+
+    players = pd.read_sql_query(players_query(weeks, league_id, season_id), conn)
+
+    conn.close()
+
+    return players
+
+
+def slots_query(league_id=None, season_id=None):
+    """
+    SQL query for the roster slots of the Slots table (see load_slots).
+    """
+    return '''SELECT Slots.league_id, Slots.season_id, Slots.position, Slots.slots
+        FROM Slots WHERE %s''' % schema.partition_filter('Slots', league_id, season_id)
+
+
+def load_slots(ff_db, league_id=None, season_id=None):
+    """
+    Load the roster slots of every league-season, optionally only for a
+    league_id and a season_id. ff_db may also be a Parquet store.
+    """
+    if parquet_store.is_store(ff_db):
+        return parquet_store.read_table(ff_db, 'Slots', ['league_id', 'season_id', 'position', 'slots'], league_id, season_id)
+
+    conn = sqlite3.connect(ff_db)
+
+    slots = pd.read_sql_query(slots_query(league_id, season_id), conn)
+
+    conn.close()
+
+    return slots
+
+
+def matchups_query(weeks=None, league_id=None, season_id=None):
+    """
+    SQL query for the matchups of the Matchups table (see load_matchups).
+    """
+    return '''SELECT Matchups.league_id, Matchups.season_id, Matchups.week,
+        Matchups.home, Matchups.away FROM Matchups
+        WHERE %s AND %s''' % (schema.partition_filter('Matchups', league_id, season_id),
+                               week_filter(weeks, 'Matchups'))
+
+
+def load_matchups(ff_db, weeks=None, league_id=None, season_id=None):
+    """
+    Load the matchups of a set of weeks (all weeks if None), optionally only
+    for a league_id and a season_id. ff_db may also be a Parquet store.
+    """
+    columns = ['league_id', 'season_id', 'week', 'home', 'away']
+
+    if parquet_store.is_store(ff_db):
+        return parquet_store.read_table(ff_db, 'Matchups', columns, league_id, season_id, weeks)
+
+    conn = sqlite3.connect(ff_db)
+
+    matchups = pd.read_sql_query(matchups_query(weeks, league_id, season_id), conn)
+
+    conn.close()
+
+    return matchups[columns]
+
+
+def teams_query(league_id=None, season_id=None):
+    """
+    SQL query for the team_ids and team names of the Teams table (see
+    load_teams).
+    """
+    return '''SELECT Teams.league_id, Teams.season_id, Teams.team_id,
+        Teams.team_name FROM Teams WHERE %s
+        ORDER BY Teams.league_id, Teams.season_id, Teams.team_id''' % schema.partition_filter('Teams', league_id, season_id)
+
+
+def load_teams(ff_db, league_id=None, season_id=None):
+    """
+    Load the team_ids and team names, optionally only for a league_id and a
+    season_id. ff_db may also be a Parquet store.
+    """
+    columns = ['league_id', 'season_id', 'team_id', 'team_name']
+
+    if parquet_store.is_store(ff_db):
+        teams = parquet_store.read_table(ff_db, 'Teams', columns, league_id, season_id)
+        return teams.sort_values(['league_id', 'season_id', 'team_id']).reset_index(drop=True)
+
+    conn = sqlite3.connect(ff_db)
+
+    teams = pd.read_sql_query(teams_query(league_id, season_id), conn)
+
+    conn.close()
+
+    return teams[columns]
+
+
+def compute_scores(players, slots):
+    """
+    Calculate the following scores for every (league_id, season_id, team_id,
+    week) in players in a single pass:
+    (1) score_proj: Score based on ESPN projections for starters
+    (2) score_actual: Score based on actual points for starters
+    (3) score_best: Score based on optimal combination of players from starters
+                    and bench players
+
+    Best scores of each league-season use its own roster slots from slots.
+    Returns a DataFrame with one row per team and week, sorted by score_keys.
+    """
+    players = players.reset_index(drop=True)
+
+    # Tally projected and real scores for original starters
+    starter = (players['slot'] != 'Bench').values
+    scores = players[score_keys].copy()
+    scores['score_proj'] = np.where(starter, players['projected_points'], 0.0)
+    scores['score_actual'] = np.where(starter, players['actual_points'], 0.0)
+    scores = scores.groupby(score_keys).sum()
+
+    # Best lineup for the roster slot configuration of each league-season
+    best = []
+    for (league_id, season_id), group in players.groupby(['league_id', 'season_id']):
+        config = slots.loc[(slots['league_id'] == league_id) & (slots['season_id'] == season_id), :]
+        best.append(lineup_optimizer.best_scores(group, config, score_keys))
+    scores['score_best'] = pd.concat(best) if best else np.nan
+
+    scores = scores.round(1).reset_index()
+
+    return scores[score_keys + ['score_proj', 'score_actual', 'score_best']]
+
+
+def slots_fingerprint(slots):
+    """
+    Hash of the roster slot configuration of the league.
+    """
+    config = sorted(zip(slots['position'], slots['slots']))
+
+    return hashlib.sha1(repr(config)).hexdigest()
+
+
+def fingerprint_query(weeks=None, league_id=None, season_id=None):
+    """
+    SQL query for the Players rows of each team and week, concatenated in a
+    fixed order (see players_fingerprints).
+    """
+    return '''SELECT league_id, season_id, team_id, week, GROUP_CONCAT(row, ';') AS rows FROM (
+        SELECT Players.league_id, Players.season_id, Players.team_id, Players.week,
+            IFNULL(Players.slot, '') || '|' || IFNULL(Players.player, '') || '|' ||
+            IFNULL(Players.position, '') || '|' || IFNULL(Players.projected_points, '') || '|' ||
+            IFNULL(Players.actual_points, '') AS row
+        FROM Players WHERE %s AND %s
+        ORDER BY Players.league_id, Players.season_id, Players.team_id,
+            Players.week, Players.slot, Players.player)
+        GROUP BY league_id, season_id, team_id, week''' % (schema.partition_filter('Players', league_id, season_id), week_filter(weeks))
+
+
+def players_fingerprints(conn, weeks=None, league_id=None, season_id=None):
+    """
+    Hash of the Players rows that the scores of each team and week depend on.
+    Returns a DataFrame with the score_keys and fingerprint columns.
+    """
+    fingerprints = pd.read_sql_query(fingerprint_query(weeks, league_id, season_id), conn)
+
+    fingerprints['fingerprint'] = [hashlib.sha1(rows.encode('utf-8')).hexdigest() for rows in fingerprints['rows']]
+
+    return fingerprints[score_keys + ['fingerprint']]
+
+
+@metrics.timed('analysis.scores')
+def get_league_scores(ff_db, weeks=None, use_cache=True, league_id=None, season_id=None):
+    """
+    Calculate projected, actual and best scores for every team_id in ff_db over
+    a set of weeks (all weeks if weeks is None). See compute_scores. Set
+    league_id and season_id to score a single league-season; by default, every
+    league-season in ff_db is scored, with league_id and season_id columns
+    telling them apart.
+
+    Scores are cached in the ScoreCache table of ff_db, together with a hash of
+    the Players rows and the Slots configuration they were calculated from.
+    Only team-weeks that are new, or whose rows or slots changed since they
+    were cached, are recalculated. Scores read from a Parquet store are never
+    cached.
+    """
+    slots = load_slots(ff_db, league_id, season_id)
+
+    if not use_cache or parquet_store.is_store(ff_db):
+        return compute_scores(load_players(ff_db, weeks, league_id, season_id), slots)
+
+    # Scores are cached while scrapers may be writing to ff_db, so writes wait
+    # for them like the scrapers' own connections do
+    conn = sqlite3.connect(ff_db, timeout=db_writer.TIMEOUT)
+    cur = conn.cursor()
+
+    # Scores cached before they were keyed by league_id and season_id are
+    # dropped and recalculated
+    columns = schema.table_columns(cur, 'ScoreCache')
+    if columns and 'league_id' not in columns:
+        cur.execute('DROP TABLE ScoreCache')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS ScoreCache (
+        league_id INTEGER,
+        season_id INTEGER,
+        team_id INTEGER,
+        week INTEGER,
+        fingerprint TEXT,
+        slots_fingerprint TEXT,
+        score_proj DECIMAL(5,1),
+        score_actual DECIMAL(5,1),
+        score_best DECIMAL(5,1),
+        PRIMARY KEY (league_id, season_id, team_id, week)
+    );''')
+
+    # Every team-week is fingerprinted with its Players rows and the slots of
+    # its league-season
+    fingerprints = players_fingerprints(conn, weeks, league_id, season_id)
+    slots_hashes = pd.DataFrame([( key[0], key[1], slots_fingerprint(config) )
+                                 for key, config in slots.groupby(['league_id', 'season_id'])],
+                                columns=['league_id', 'season_id', 'slots_fingerprint'])
+    fingerprints = fingerprints.merge(slots_hashes, on=['league_id', 'season_id'], how='left')
+    fingerprints['slots_fingerprint'] = fingerprints['slots_fingerprint'].fillna(slots_fingerprint(slots.iloc[:0]))
+
+    sqlstr = '''SELECT ScoreCache.* FROM ScoreCache WHERE %s''' % schema.partition_filter('ScoreCache', league_id, season_id)
+    cached = pd.read_sql_query(sqlstr, conn)
+    cached = fingerprints.merge(cached, on=score_keys + ['fingerprint', 'slots_fingerprint'], how='inner')
+
+    # Recalculate scores for team-weeks missing from the cache
+    stale = fingerprints.merge(cached[score_keys], on=score_keys, how='left', indicator=True)
+    stale = stale.loc[stale['_merge'] == 'left_only', score_keys + ['fingerprint', 'slots_fingerprint']]
+
+    if len(stale) > 0:
+        players = load_players(ff_db, stale['week'].unique(), league_id, season_id)
+        players = players.merge(stale[score_keys], on=score_keys, how='inner')
+        fresh = compute_scores(players, slots).merge(stale, on=score_keys)
+
+        rows = fresh[score_keys + ['fingerprint', 'slots_fingerprint', 'score_proj', 'score_actual', 'score_best']]
+        cur.executemany('''INSERT OR REPLACE INTO ScoreCache
+            (league_id, season_id, team_id, week, fingerprint, slots_fingerprint,
+            score_proj, score_actual, score_best)
+            VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ? )''',
+            [( int(row[0]), int(row[1]), int(row[2]), int(row[3]), row[4], row[5],
+               float(row[6]), float(row[7]), float(row[8]) ) for row in rows.itertuples(index=False)])
+        conn.commit()
+
+        cached = pd.concat([cached, rows], ignore_index=True)
+
+    conn.close()
+
+    scores = cached.sort_values(score_keys).reset_index(drop=True)
+
+    return scores[score_keys + ['score_proj', 'score_actual', 'score_best']]
@@ -0,0 +1,252 @@
+import multiprocessing
+import os
+import sys
+import numpy as np
+import numpy.random as npr
+import pandas as pd
+import bootstrap_engine
+import metrics
+import score_engine
+import standings
+
+# Teams with fewer scored weeks than this are simulated with the spread of
+# scores of the whole league instead of their own
+MIN_WEEKS = 3
+
+# Model of the season shared by the worker processes
+_worker = {}
+
+
+def fit_team_scores(scores, teams, column='score_actual'):
+    """
+    Fit a normal distribution to the weekly scores of each team, from a score
+    column of a DataFrame from score_engine.get_league_scores. Returns a
+    DataFrame of the mean and standard deviation of the scores of each team,
+    in the order of teams, and the number of weeks they were fitted to.
+    """
+    if not scores[column].notnull().any():
+        raise ValueError('No {} to fit score distributions to'.format(column))
+
+    grouped = scores.groupby('team_id')[column]
+    fit = pd.DataFrame({'mean': grouped.mean(), 'std': grouped.std(), 'weeks': grouped.count()})
+    fit = fit.reindex(teams['team_id'].values)
+    fit['weeks'] = fit['weeks'].fillna(0).astype(int)
+
+    # Teams without enough weeks get the league mean and spread
+    fit['mean'] = fit['mean'].fillna(scores[column].mean())
+    few = fit['weeks'] < MIN_WEEKS
+    fit.loc[few, 'std'] = scores[column].std()
+    fit.index.name = 'team_id'
+
+    return fit.reset_index()[['team_id', 'mean', 'std', 'weeks']]
+
+
+def season_model(matchups, teams, scores, current_week, column='score_actual'):
+    """
+    Model of a season for simulate_chunk. Matchups up to current_week are
+    tallied from scores; the remaining ones are simulated from the score
+    distributions of fit_team_scores. Returns a dict of the fit, the record
+    (W, L, T and PF arrays indexed by position in teams) so far, the games of
+    each team over the whole season, and a list of (home, away) team index
+    arrays for each remaining week.
+    """
+    home_ids, away_ids = standings.matchup_team_ids(matchups, teams)
+    weeks = matchups['week'].values.astype(int)
+
+    team_idx = np.zeros(np.max(teams['team_id'].values) + 1, dtype=int)
+    team_idx[teams['team_id'].values] = np.arange(len(teams))
+    home = team_idx[home_ids]
+    away = team_idx[away_ids]
+
+    played = weeks <= current_week
+    if played.any():
+        shape = (len(team_idx), max(np.max(weeks[played]), scores['week'].max()) + 1)
+        matrix = standings.score_matrix(scores, column, shape)
+        score_home = matrix[home_ids[played], weeks[played]]
+        score_away = matrix[away_ids[played], weeks[played]]
+
+        missing = np.isnan(score_home) | np.isnan(score_away)
+        if missing.any():
+            raise ValueError('No {} for matchups in weeks {}'.format(column, sorted(set(weeks[played][missing]))))
+
+        tallies = standings.tally_standings(len(teams), home[played], away[played], score_home, score_away)
+        record = dict((key, np.asarray(tallies[key])) for key in ['W', 'L', 'T', 'PF'])
+    else:
+        record = dict((key, np.zeros(len(teams), dtype=int)) for key in ['W', 'L', 'T'])
+        record['PF'] = np.zeros(len(teams))
+
+    fit = fit_team_scores(scores[scores['week'] <= current_week], teams, column)
+
+    remaining = sorted(set(weeks[~played]))
+    schedule = [(home[weeks == week], away[weeks == week]) for week in remaining]
+    games = np.bincount(np.append(home, away), minlength=len(teams))
+
+    return {'fit': fit,
+            'record': record,
+            'games': games,
+            'schedule': schedule}
+
+
+def simulate_chunk(model, size, seed):
+    """
+    Simulate size seasons of a season_model. All seasons are simulated at once,
+    one week at a time: the scores of every team in every season are drawn in
+    one array, and the matchups of the week are decided by comparing them.
+    Teams are seeded by winning percentage, then points for. Returns an array
+    counting the seasons each team (row) finished with each seed (column).
+    """
+    rng = npr.RandomState(seed)
+    mean = model['fit']['mean'].values
+    std = model['fit']['std'].values
+    n_teams = len(mean)
+
+    # Wins are counted in half wins, so ties count as one
+    record = model['record']
+    half_wins = np.tile(2*record['W'] + record['T'], (size, 1))
+    points_for = np.tile(record['PF'].astype(float), (size, 1))
+
+    for home, away in model['schedule']:
+        week_scores = mean + std*rng.standard_normal((size, n_teams))
+        score_home = week_scores[:, home]
+        score_away = week_scores[:, away]
+
+        tie = score_home == score_away
+        half_wins[:, home] += 2*(score_home > score_away) + tie
+        half_wins[:, away] += 2*(score_away > score_home) + tie
+        points_for[:, home] += score_home
+        points_for[:, away] += score_away
+
+    pct = half_wins / (2.0*np.maximum(model['games'], 1))
+
+    # order[i, k] is the team with seed k + 1 in season i
+    order = np.lexsort((-points_for, -pct), axis=1)
+    seeds = np.tile(np.arange(n_teams), size)
+
+    return np.bincount(order.ravel()*n_teams + seeds, minlength=n_teams**2).reshape(n_teams, n_teams)
+
+
+def init_worker(model):
+    """
+    Set up a worker process with the season model.
+    """
+    _worker['model'] = model
+
+
+def run_chunk(chunk):
+    """
+    Simulate a (size, seed) chunk of seasons in a worker process.
+    """
+    size, seed = chunk
+
+    return simulate_chunk(_worker['model'], size, seed)
+
+
+@metrics.timed('analysis.simulate_season')
+def simulate_season(matchups, teams, scores, current_week, num_seasons=10000, playoff_teams=4, byes=0,
+                    seed=None, processes=1, column='score_actual'):
+    """
+    Simulate the rest of a season num_seasons times from its matchups (a
+    DataFrame from score_engine.load_matchups for all weeks of one
+    league-season), teams and the scores of the weeks played so far (up to
+    current_week). Chunks of seasons are spread over processes worker
+    processes (or run in this process if processes is 1). Results are
+    reproducible for a given seed, whatever the number of processes.
+
+    Returns a DataFrame of each team's record so far, fitted score
+    distribution, and probabilities of making the playoffs (a top
+    playoff_teams seed), of a bye (a top byes seed) and of each seed, sorted by
+    playoff, bye and then seed probabilities.
+    """
+    model = season_model(matchups, teams, scores, current_week, column)
+    n_teams = len(teams)
+
+    # Seasons are drawn in chunks small enough to keep peak memory flat
+    plan = bootstrap_engine.chunk_plan(n_teams*max(len(model['schedule']), 1), num_seasons, seed)
+
+    if processes == 1:
+        chunks = [simulate_chunk(model, size, chunk_seed) for size, chunk_seed in plan]
+    else:
+        pool = multiprocessing.Pool(processes, init_worker, (model, ))
+        try:
+            chunks = pool.map(run_chunk, plan)
+        finally:
+            pool.close()
+            pool.join()
+
+    seed_probs = np.sum(chunks, axis=0) / float(num_seasons)
+
+    odds = teams[['team_id', 'team_name']].reset_index(drop=True)
+    for key in ['W', 'L', 'T', 'PF']:
+        odds[key] = model['record'][key]
+    odds['mean'] = np.round(model['fit']['mean'].values, 1)
+    odds['std'] = np.round(model['fit']['std'].values, 1)
+    odds['playoffs'] = seed_probs[:, :playoff_teams].sum(axis=1)
+    odds['bye'] = seed_probs[:, :byes].sum(axis=1)
+    seed_columns = ['seed_' + str(i+1) for i in range(n_teams)]
+    for i, seed_column in enumerate(seed_columns):
+        odds[seed_column] = seed_probs[:, i]
+
+    return odds.sort_values(['playoffs', 'bye'] + seed_columns, ascending=False)
+
+
+def save_playoff_odds(ff_db, league_id, season_id, current_week, out_dir=None, num_seasons=10000, playoff_teams=4,
+                      byes=0, processes=1):
+    """
+    Simulate the rest of a league-season after current_week with
+    simulate_season and save the odds to a 'tables' directory in out_dir (the
+    current working directory by default). Returns the odds.
+    """
+    matchups = score_engine.load_matchups(ff_db, None, league_id, season_id)
+    teams = score_engine.load_teams(ff_db, league_id, season_id)
+    scores = score_engine.get_league_scores(ff_db, range(1, current_week+1), league_id=league_id, season_id=season_id)
+
+    odds = simulate_season(matchups, teams, scores, current_week, num_seasons, playoff_teams, byes,
+                           seed=0, processes=processes)
+
+    out_dir = out_dir or os.getcwd()
+    if not os.path.exists(out_dir + '/tables'):
+        os.makedirs(out_dir + '/tables')
+
+    odds.to_csv(out_dir + '/tables/playoff_odds_week_' + str(current_week) + '.csv', index=False)
+
+    return odds
+
+
+def main():
+    """
+    User-specified parameters:
+    (1) ff_db: name of database to extract data from
+    (2) league_id: id number of the ESPN FF league
+    (3) season_id: year of FF season
+    (4) current_week: most recent matchup week played
+    (5) num_seasons: number of simulated seasons
+    (6) playoff_teams: number of teams making the playoffs
+    (7) byes: number of playoff teams with a first round bye
+    (8) processes: number of processes simulating seasons
+
+    Returns:
+    (1) Creates 'tables' directory in current working directory (if it doesn't
+        already exist)
+    (2) Simulates the matchups after current_week from each team's scores so
+        far, and saves each team's playoff, bye and seed probabilities to the
+        'tables' directory
+    """
+    ff_db = 'DATABASE_NAME.sqlite'
+    league_id = 000000
+    season_id = 0000
+    current_week = 0
+    num_seasons = 100000
+    playoff_teams = 4
+    byes = 0
+    processes = multiprocessing.cpu_count()
+
+    odds = save_playoff_odds(ff_db, league_id, season_id, current_week, num_seasons=num_seasons,
+                             playoff_teams=playoff_teams, byes=byes, processes=processes)
+
+    print odds[['team_name', 'W', 'PF', 'playoffs', 'bye']].to_string(index=False)
+
+
+if __name__ == '__main__':
+    metrics.enable_from_argv()
+    main()
+    sys.exit(0)
@@ -1,76 +1,91 @@
 import sys
-from bs4 import BeautifulSoup
-import requests
-import sqlite3
-
+import league_settings
+import page_cache
+import db_writer
+import metrics
+import schema
+
+# Slots named differently from the abbreviation of their settings page label
+# with '/' removed (e.g. 'Running Back (RB)' is 'RB', 'RB/WR (RB/WR)' is
+# 'RBWR' and 'Defense/Special Teams (D/ST)' is 'DST')
+slot_names = {'Flex': 'FLEX',
+              'BE': 'Bench'}
 
 def load_slot_page(league_id, season_id):
     """
     Load the league settings page. Get table for roster slots.
     """
-    url = 'http://games.espn.com/ffl/leaguesetup/settings?leagueId={}&seasonId={}'.format(league_id, season_id)
-    soup = BeautifulSoup(requests.get(url).text, 'lxml')
+    soup = league_settings.load_settings_page(league_id, season_id)
     table_slot = soup.find_all('table')
     table_slot = table_slot[2]
 
     return table_slot
 
 
+@metrics.timed('parse.slots')
 def parse_slots(table_slot):
     """
-    Loop through relevant roster positions and parse position and allowed
-    number of starters for that position.
+    Loop through every roster position in the table and parse position and
+    allowed number of starters for that position. Header and total rows, which
+    have no position abbreviation, are skipped.
     """
     slots = []
 
     rows = table_slot.find_all('tr')
 
-    for row in rows[3:10]:
+    for row in rows:
         temp = [val.get_text() for val in row.children if len(val.get_text()) > 0][0:2]
-        if temp[0].split('(')[0].strip() == 'Flex':
-            position = 'FLEX'
-        else:
-            position = temp[0].split('(')[1].split(')')[0].replace('/', '')
+        if len(temp) < 2 or '(' not in temp[0]:
+            continue
+        name = temp[0].split('(')[0].strip()
+        abbr = temp[0].split('(')[1].split(')')[0]
+        position = slot_names.get(name, slot_names.get(abbr, abbr.replace('/', '')))
         slots.append({'position': position, 'slots': int(temp[1])})
 
     return slots
 
 
-def write_slots_to_db(ff_db, slots):
+def write_slots_to_db(ff_db, league_id, season_id, slots):
     """
-    Write slot data to database.
+    Write slot data of a league-season to database in a single transaction.
+    The slots of a position replace any saved for it before.
     """
     print '\nOpening fantasy football database ...'
 
-    conn = sqlite3.connect(ff_db)
+    conn = db_writer.connect(ff_db)
     cur = conn.cursor()
 
-    cur.execute('''
-
-    CREATE TABLE IF NOT EXISTS Slots (
-        id  INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
-        position TEXT,
-        slots INTEGER,
-        UNIQUE (position, slots)
-    );
-    ''')
+    schema.create_table(cur, 'Slots')
 
     print 'Writing slot data to database ...'
 
-    for i in range(len(slots)):
+    rows = [( league_id, season_id, slot['position'], slot['slots'] ) for slot in slots]
 
-        cur.execute('''INSERT OR IGNORE INTO Slots
-            (position, slots)
-            VALUES ( ?, ? )''',
-            ( slots[i]['position'], slots[i]['slots'] ) )
+    db_writer.write_rows(conn, '''INSERT OR REPLACE INTO Slots
+        (league_id, season_id, position, slots)
+        VALUES ( ?, ?, ?, ? )''', rows, batch_size=0)
 
-        conn.commit()
+    # Refresh query planner statistics after the bulk write
+    schema.analyze(cur)
+    conn.commit()
 
     print 'Slot data written to database!\n'
 
     conn.close()
 
 
+def scrape_slots(ff_db, league_id, season_id):
+    """
+    Load, parse and write to ff_db the roster slots of a league-season.
+    Returns the parsed slots.
+    """
+    table_slot = load_slot_page(league_id, season_id)
+    slots = parse_slots(table_slot)
+    write_slots_to_db(ff_db, league_id, season_id, slots)
+
+    return slots
+
+
 def main():
     """
     User-specified parameters:
@@ -85,11 +100,13 @@ def main():
     league_id = 000000
     season_id = 0000
 
-    table_slot = load_slot_page(league_id, season_id)
-    slots = parse_slots(table_slot)
-    write_slots_to_db(ff_db, slots)
+    scrape_slots(ff_db, league_id, season_id)
+
+    page_cache.flush()
+    print page_cache.report()
 
 
 if __name__ == '__main__':
+    metrics.enable_from_argv()
     main()
     sys.exit(0)
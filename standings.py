@@ -0,0 +1,283 @@
+import numpy as np
+import numpy.random as npr
+import pandas as pd
+import bootstrap_engine
+
+standings_columns = ['W', 'L', 'T', 'PCT', 'PF', 'PA']
+
+
+def matchup_team_ids(matchups, teams):
+    """
+    Resolve the home and away team names of each matchup to team_ids. Returns
+    arrays of home team_ids and away team_ids.
+    """
+    team_ids = pd.Series(teams['team_id'].values, index=teams['team_name'].values)
+    home_ids = matchups['home'].map(team_ids)
+    away_ids = matchups['away'].map(team_ids)
+
+    unknown = set(matchups['home'][home_ids.isnull()]) | set(matchups['away'][away_ids.isnull()])
+    if unknown:
+        raise ValueError('Teams missing from the Teams table: ' + ', '.join(sorted(unknown)))
+
+    return home_ids.values.astype(int), away_ids.values.astype(int)
+
+
+def score_matrix(scores, column, shape):
+    """
+    Arrange a score column of a DataFrame from score_engine.get_league_scores
+    into an array of the given shape indexed by [team_id, week]. Team-weeks
+    without a score are NaN.
+    """
+    matrix = np.full(shape, np.nan)
+    matrix[scores['team_id'].values, scores['week'].values] = scores[column].values
+
+    return matrix
+
+
+def tally_standings(n_teams, home, away, score_home, score_away):
+    """
+    Tally W/L/T/PF/PA for each team index (0 to n_teams-1) from arrays of home
+    and away team indices and their scores, one element per matchup. Returns a
+    dict of arrays keyed by standings column.
+    """
+    home_win = score_home > score_away
+    away_win = score_home < score_away
+    tie = score_home == score_away
+
+    def tally(home_weights, away_weights):
+        return (np.bincount(home, weights=home_weights, minlength=n_teams) +
+                np.bincount(away, weights=away_weights, minlength=n_teams))
+
+    wins = tally(home_win, away_win).astype(int)
+    losses = tally(away_win, home_win).astype(int)
+    ties = tally(tie, tie).astype(int)
+    points_for = tally(score_home, score_away)
+    points_against = tally(score_away, score_home)
+
+    # Winning percentage is calculated once all matchups are tallied
+    games = wins + losses + ties
+    pct = np.where(games > 0, (wins + 0.5*ties) / np.maximum(games, 1), 0.0)
+
+    return {'W': wins, 'L': losses, 'T': ties,
+            'PCT': [round(val, 2) for val in pct],
+            'PF': [round(val, 1) for val in points_for],
+            'PA': [round(val, 1) for val in points_against]}
+
+
+def build_standings(matchups, teams, scores, modes=('proj', 'actual', 'best')):
+    """
+    Create league standings from a set of matchups for each scoring mode. A
+    mode is the name of a score_<mode> column of scores (a DataFrame from
+    score_engine.get_league_scores), so any score column can decide matchups.
+
+    Returns a dict of standings DataFrames keyed by mode, each sorted by W, PCT,
+    PF and then PA.
+    """
+    home_ids, away_ids = matchup_team_ids(matchups, teams)
+    weeks = matchups['week'].values.astype(int)
+
+    # Scores are looked up in arrays indexed by [team_id, week]
+    shape = (np.max(np.append(teams['team_id'].values, scores['team_id'].values)) + 1,
+             np.max(np.append(weeks, scores['week'].values)) + 1)
+
+    # Position of each team_id in the teams DataFrame
+    team_idx = np.zeros(shape[0], dtype=int)
+    team_idx[teams['team_id'].values] = np.arange(len(teams))
+    home = team_idx[home_ids]
+    away = team_idx[away_ids]
+
+    standings = {}
+
+    for mode in modes:
+        matrix = score_matrix(scores, 'score_' + mode, shape)
+        score_home = matrix[home_ids, weeks]
+        score_away = matrix[away_ids, weeks]
+
+        missing = np.isnan(score_home) | np.isnan(score_away)
+        if missing.any():
+            raise ValueError('No {} scores for matchups in weeks {}'.format(mode, sorted(set(weeks[missing]))))
+
+        tallies = tally_standings(len(teams), home, away, score_home, score_away)
+
+        table = teams.copy()
+        for column in standings_columns:
+            table[column] = tallies[column]
+
+        # Sort standings by W, PCT, PF and then PA
+        standings[mode] = table.sort_values(['W', 'PCT', 'PF', 'PA'], ascending=[False, False, False, False])
+
+    return standings
+
+
+def team_week_matrix(scores, teams, weeks, column):
+    """
+    Arrange a score column of a DataFrame from score_engine.get_league_scores
+    into an array indexed by [position in teams, position in weeks]. Team-weeks
+    without a score are NaN.
+    """
+    weeks = np.asarray(weeks, dtype=int)
+    shape = (np.max(np.append(teams['team_id'].values, scores['team_id'].values)) + 1,
+             np.max(np.append(weeks, scores['week'].values)) + 1)
+
+    return score_matrix(scores, column, shape)[np.ix_(teams['team_id'].values, weeks)]
+
+
+def opponent_matrix(matchups, teams, weeks):
+    """
+    Opponent of each team in each week of a set of matchups, as an array of
+    positions in teams indexed by [position in teams, position in weeks]. Teams
+    without a matchup in a week have opponent -1.
+    """
+    home_ids, away_ids = matchup_team_ids(matchups, teams)
+
+    team_idx = np.zeros(np.max(teams['team_id'].values) + 1, dtype=int)
+    team_idx[teams['team_id'].values] = np.arange(len(teams))
+    week_idx = dict((week, i) for i, week in enumerate(weeks))
+    columns = np.array([week_idx[week] for week in matchups['week'].values], dtype=int)
+
+    opponents = np.full((len(teams), len(weeks)), -1, dtype=int)
+    opponents[team_idx[home_ids], columns] = team_idx[away_ids]
+    opponents[team_idx[away_ids], columns] = team_idx[home_ids]
+
+    return opponents
+
+
+def all_play_records(matrix):
+    """
+    Record of every team against every other team in every week of a
+    team-week score matrix, as if all teams played each other every week.
+    Returns arrays of wins and ties indexed by [team, opponent] (losses are the
+    wins of the transposed array). Team-weeks without a score are not counted.
+    """
+    scored = ~np.isnan(matrix)
+    both = scored[:, None, :] & scored[None, :, :]
+
+    # Compare each team's score with every other team's score of the same week
+    with np.errstate(invalid='ignore'):
+        wins = ((matrix[:, None, :] > matrix[None, :, :]) & both).sum(axis=-1)
+        ties = ((matrix[:, None, :] == matrix[None, :, :]) & both).sum(axis=-1)
+    np.fill_diagonal(ties, 0)
+
+    return wins, ties
+
+
+def schedule_half_wins(matrix, opponents):
+    """
+    Half wins (2 for a win and 1 for a tie) of each team over a schedule, from
+    a team-week score matrix and an opponent array like opponent_matrix. The
+    opponent array may have extra leading dimensions, e.g. one per schedule, in
+    which case an array of half wins with those leading dimensions is returned.
+    """
+    weeks = np.arange(matrix.shape[1])
+    opponent_scores = matrix[np.maximum(opponents, 0), weeks]
+    played = opponents >= 0
+
+    with np.errstate(invalid='ignore'):
+        half_wins = 2*(matrix > opponent_scores) + (matrix == opponent_scores)
+
+    return np.sum(half_wins*played, axis=-1)
+
+
+def swapped_schedules(opponents):
+    """
+    Every team's opponents when playing every team's schedule. Returns an array
+    indexed by [schedule owner, team, week]: team i playing the schedule of
+    team j meets j's opponents, and meets j where j met i.
+    """
+    n_teams = len(opponents)
+    team = np.arange(n_teams)[None, :, None]
+    owner = np.arange(n_teams)[:, None, None]
+    schedule = opponents[:, None, :]
+
+    return np.where(schedule == team, owner, schedule)
+
+
+def random_schedules(n_teams, n_weeks, size, seed=None):
+    """
+    Draw size random schedules, each pairing the teams at random every week
+    (with a random team on bye in leagues of an odd number of teams). Returns
+    an array of opponents indexed by [schedule, team, week].
+    """
+    order = np.argsort(npr.RandomState(seed).random_sample((size, n_weeks, n_teams)), axis=-1)
+    pairs = n_teams - n_teams % 2
+    first = order[..., 0:pairs:2]
+    second = order[..., 1:pairs:2]
+
+    opponents = np.full((size, n_weeks, n_teams), -1, dtype=int)
+    np.put_along_axis(opponents, first, second, axis=-1)
+    np.put_along_axis(opponents, second, first, axis=-1)
+
+    return opponents.transpose(0, 2, 1)
+
+
+def schedule_luck(matchups, teams, scores, modes=('proj', 'actual', 'best'), num_schedules=10000, seed=None):
+    """
+    All-play and schedule luck standings from a set of matchups of one
+    league-season, for each scoring mode. The team-week score matrix of each
+    mode is built once, and every record is computed from it:
+
+    (1) W, L, T: record over the actual schedule
+    (2) AP_W, AP_L, AP_T, AP_PCT: all-play record against every other team
+        every week
+    (3) SWAP_W, SWAP_MIN, SWAP_MAX: mean, fewest and most wins over the
+        schedules of every team in the league
+    (4) RAND_W, RAND_SD: mean and standard deviation of wins over num_schedules
+        random schedules
+    (5) LUCK: wins over the actual schedule minus RAND_W
+
+    Ties count as half a win. Returns a dict keyed by mode of (standings,
+    head_to_head, distribution) tuples: standings sorted by AP_PCT, the
+    all-play wins of each team (row) against each other team (column), and the
+    probability of each number of wins (rounded down) over the random
+    schedules.
+    """
+    weeks = sorted(set(matchups['week'].values.astype(int)))
+    opponents = opponent_matrix(matchups, teams, weeks)
+    n_teams, n_weeks = opponents.shape
+    names = teams['team_name'].values
+
+    # Random schedules are drawn in chunks small enough to keep peak memory
+    # flat, and shared by all modes
+    plan = bootstrap_engine.chunk_plan(n_teams*n_weeks, num_schedules, seed)
+
+    results = {}
+
+    for mode in modes:
+        matrix = team_week_matrix(scores, teams, weeks, 'score_' + mode)
+
+        # Record over the actual schedule
+        opponent_scores = np.where(opponents >= 0, matrix[np.maximum(opponents, 0), np.arange(n_weeks)], np.nan)
+        with np.errstate(invalid='ignore'):
+            record = [np.sum(compare(matrix, opponent_scores), axis=1) for compare in [np.greater, np.less, np.equal]]
+        wins = record[0] + 0.5*record[2]
+
+        ap_wins, ap_ties = all_play_records(matrix)
+        swap_wins = schedule_half_wins(matrix, swapped_schedules(opponents)) / 2.0
+        rand_wins = np.concatenate([schedule_half_wins(matrix, random_schedules(n_teams, n_weeks, size, chunk_seed))
+                                    for size, chunk_seed in plan]) / 2.0
+
+        table = teams.copy()
+        table['W'], table['L'], table['T'] = record
+        table['AP_W'] = ap_wins.sum(axis=1)
+        table['AP_L'] = ap_wins.sum(axis=0)
+        table['AP_T'] = ap_ties.sum(axis=1)
+        games = table['AP_W'] + table['AP_L'] + table['AP_T']
+        table['AP_PCT'] = np.round((table['AP_W'] + 0.5*table['AP_T']) / np.maximum(games, 1), 3)
+        table['SWAP_W'] = np.round(swap_wins.mean(axis=0), 2)
+        table['SWAP_MIN'] = swap_wins.min(axis=0)
+        table['SWAP_MAX'] = swap_wins.max(axis=0)
+        table['RAND_W'] = np.round(rand_wins.mean(axis=0), 2)
+        table['RAND_SD'] = np.round(rand_wins.std(axis=0), 2)
+        table['LUCK'] = np.round(wins - rand_wins.mean(axis=0), 2)
+
+        head_to_head = pd.DataFrame(ap_wins, index=names, columns=names)
+
+        counts = np.bincount((np.floor(rand_wins).astype(int) + (n_weeks+1)*np.arange(n_teams)).ravel(),
+                             minlength=n_teams*(n_weeks+1)).reshape(n_teams, n_weeks+1)
+        distribution = teams.copy()
+        for i in range(n_weeks+1):
+            distribution['W_' + str(i)] = counts[:, i] / float(len(rand_wins))
+
+        results[mode] = (table.sort_values(['AP_PCT', 'W'], ascending=False), head_to_head, distribution)
+
+    return results
@@ -0,0 +1,65 @@
+import sqlite3
+import time
+import db_writer
+import schema
+
+
+def create_sync_table(cur):
+    """
+    Create the SyncState table, which records the pages fetched for each
+    league, season, week and team_id, and whether their data is final.
+    """
+    # SyncState tables from before league_id was recorded are dropped, so
+    # their pages are fetched again (from the page cache if still there)
+    columns = schema.table_columns(cur, 'SyncState')
+    if columns and 'league_id' not in columns:
+        cur.execute('DROP TABLE SyncState')
+
+    cur.execute('''
+
+    CREATE TABLE IF NOT EXISTS SyncState (
+        league_id INTEGER,
+        season_id INTEGER,
+        week INTEGER,
+        team_id INTEGER,
+        page TEXT,
+        fetched_at REAL,
+        finalized INTEGER,
+        PRIMARY KEY (league_id, season_id, week, team_id, page)
+    );
+    ''')
+
+
+def pending(ff_db, league_id, season_id, keys, pages):
+    """
+    Filter a list of (week, team_id) keys down to those that still need to be
+    fetched: any of the given page types is missing from SyncState or was
+    fetched before its week was final.
+    """
+    conn = sqlite3.connect(ff_db, timeout=db_writer.TIMEOUT)
+    cur = conn.cursor()
+    create_sync_table(cur)
+
+    cur.execute('''SELECT week, team_id, page FROM SyncState
+        WHERE league_id = ? AND season_id = ? AND finalized = 1''', (league_id, season_id))
+    finalized = set(cur.fetchall())
+
+    conn.close()
+
+    return [(week, team_id) for week, team_id in keys
+            if not all((week, team_id, page) in finalized for page in pages)]
+
+
+def mark_fetched(cur, league_id, season_id, keys, pages, current_week):
+    """
+    Record that the given page types were fetched for a list of (week, team_id)
+    keys of a league-season. Weeks before current_week are final and won't be
+    fetched again.
+    """
+    now = time.time()
+
+    cur.executemany('''INSERT OR REPLACE INTO SyncState
+        (league_id, season_id, week, team_id, page, fetched_at, finalized)
+        VALUES ( ?, ?, ?, ?, ?, ?, ? )''',
+        [( league_id, season_id, week, team_id, page, now, int(week < current_week) )
+         for week, team_id in keys for page in pages])
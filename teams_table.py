@@ -1,37 +1,24 @@
 import sys
 from bs4 import BeautifulSoup
-import requests
-import sqlite3
-
-
-def get_num_teams(league_id, season_id):
-    """
-    Get the number of teams in the league from the league settings page.
-    """
-    url = 'http://games.espn.com/ffl/leaguesetup/settings?leagueId={}&seasonId={}'.format(league_id, season_id)
-    soup = BeautifulSoup(requests.get(url).text, 'lxml')
-    table_settings = soup.find_all('table')
-    table_settings = table_settings[1]
-
-    rows = table_settings.find_all('tr')
-    for row in rows:
-        fields = [val.get_text() for val in row.children if len(val.get_text()) > 0]
-        if fields[0] == "Number of Teams":
-            num_teams = int(fields[1])
-
-    return num_teams
+import league_settings
+import page_cache
+import page_fetcher
+import db_writer
+import metrics
+import schema
 
 
 def load_clubhouse_page(league_id, team_id, season_id):
     """
     Load the team clubhouse page.
     """
-    url = 'http://games.espn.com/ffl/clubhouse?leagueId={}&teamId={}&seasonId={}'.format(league_id, team_id, season_id)
-    team_soup = BeautifulSoup(requests.get(url).text, 'lxml')
+    url = '{}/clubhouse?leagueId={}&teamId={}&seasonId={}'.format(page_fetcher.BASE_URL, league_id, team_id, season_id)
+    team_soup = BeautifulSoup(page_fetcher.fetch_page(url), 'lxml')
 
     return team_soup
 
 
+@metrics.timed('parse.teams')
 def parse_teams(team_id, team_soup):
     """
     Parse the following team fields from the clubhouse page (team_soup) for a
@@ -59,36 +46,31 @@ def parse_teams(team_id, team_soup):
     return teams
 
 
-def write_teams_to_db(ff_db, teams):
+def write_teams_to_db(ff_db, league_id, season_id, teams):
     """
-    Write team data to database.
+    Write team data of a league-season (a list of dicts from parse_teams) to
+    database in a single transaction.
     """
     print '\nOpening fantasy football database ...'
 
-    conn = sqlite3.connect(ff_db)
+    conn = db_writer.connect(ff_db)
     cur = conn.cursor()
 
-    cur.execute('''
-
-    CREATE TABLE IF NOT EXISTS Teams (
-        id  INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
-        team_id INTEGER UNIQUE,
-        team_abbr TEXT,
-        team_name TEXT,
-        division TEXT,
-        owner TEXT,
-        co_owner TEXT
-    );
-    ''')
+    schema.create_table(cur, 'Teams')
 
     print 'Writing team data to database ...'
 
-    cur.execute('''INSERT OR REPLACE INTO Teams
-        (team_id, team_abbr, team_name, division, owner, co_owner)
-        VALUES ( ?, ?, ?, ?, ?, ? )''',
-        ( teams['team_id'], teams['team_abbr'], teams['team_name'],
-          teams['division'], teams['owner'], teams['co_owner'] ) )
+    rows = [( league_id, season_id, team['team_id'], team['team_abbr'],
+              team['team_name'], team['division'], team['owner'],
+              team['co_owner'] ) for team in teams]
 
+    db_writer.write_rows(conn, '''INSERT OR REPLACE INTO Teams
+        (league_id, season_id, team_id, team_abbr, team_name, division, owner,
+        co_owner)
+        VALUES ( ?, ?, ?, ?, ?, ?, ?, ? )''', rows, batch_size=0)
+
+    # Refresh query planner statistics after the bulk write
+    schema.analyze(cur)
     conn.commit()
 
     print 'Team data written to database!\n'
@@ -96,6 +78,23 @@ def write_teams_to_db(ff_db, teams):
     conn.close()
 
 
+def scrape_teams(ff_db, league_id, season_id, num_teams=None):
+    """
+    Load, parse and write to ff_db the teams of a league-season. num_teams is
+    read from the league settings page if not given. Returns the parsed teams.
+    """
+    if num_teams is None:
+        num_teams = league_settings.get_num_teams(league_id, season_id)
+
+    teams = []
+    for team_id in range(1, num_teams+1):
+        team_soup = load_clubhouse_page(league_id, team_id, season_id)
+        teams.append(parse_teams(team_id, team_soup))
+    write_teams_to_db(ff_db, league_id, season_id, teams)
+
+    return teams
+
+
 def main():
     """
     User-specified parameters:
@@ -110,15 +109,13 @@ def main():
     league_id = 000000
     season_id = 0000
 
-    num_teams = get_num_teams(league_id, season_id)
-    team_ids = range(1, num_teams+1)
+    scrape_teams(ff_db, league_id, season_id)
 
-    for team_id in team_ids:
-        team_soup = load_clubhouse_page(league_id, team_id, season_id)
-        teams = parse_teams(team_id, team_soup)
-        write_teams_to_db(ff_db, teams)
+    page_cache.flush()
+    print page_cache.report()
 
 
 if __name__ == '__main__':
+    metrics.enable_from_argv()
     main()
     sys.exit(0)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules under test live at the top of the repository, and the synthetic
+# database generator of the benchmarks is shared with the tests
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'benchmarks'))
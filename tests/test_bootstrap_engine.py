@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+import bootstrap_engine
+
+
+def test_bca_of_single_data_point():
+    table = pd.DataFrame({'week': [1, 2, 2, 2], 'error': [0.5, -0.2, 0.1, 0.4]})
+
+    results = bootstrap_engine.bootstrap_groups(table, 'error', [(), ('week', )], 200, {'mean': np.mean}, 0.05,
+                                                seed=0, method='bca')
+    single = results[results['week'] == 1].iloc[0]
+
+    assert single['n'] == 1
+    assert single['ci_low'] == single['ci_high'] == 0.5
+    assert results['ci_low'].notnull().all() and results['ci_high'].notnull().all()
+
+
+def test_one_pool_for_every_group_size():
+    rng = np.random.RandomState(0)
+    datasets = [rng.normal(size=(3, 5)), rng.normal(size=(2, 40)), rng.normal(size=7)]
+
+    pooled = bootstrap_engine.resample_datasets(datasets, 300, [np.mean, np.median], seed=1, processes=2)
+    for data, samples in zip(datasets, pooled):
+        assert np.array_equal(samples, bootstrap_engine.resample(data, 300, [np.mean, np.median], seed=1))
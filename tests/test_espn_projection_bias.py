@@ -0,0 +1,31 @@
+import sqlite3
+import numpy as np
+import compact_store
+import espn_projection_bias
+import parquet_store
+import synthetic_db
+
+
+def test_backends_agree_on_missing_slots(tmpdir):
+    ff_db = str(tmpdir.join('ff.sqlite'))
+    synthetic_db.make_database(ff_db, leagues=1, seasons=1, teams=4, weeks=2)
+    conn = sqlite3.connect(ff_db)
+    conn.execute("UPDATE Players SET slot = NULL WHERE team_id = 1 AND position = 'RB'")
+    conn.commit()
+    conn.close()
+
+    filters = [(None, None), ('RB', None), ('RB', 'Bench'), (None, 'Bench')]
+    sql = [espn_projection_bias.get_relative_errors(ff_db, *f) for f in filters]
+
+    store = str(tmpdir.join('parquet'))
+    parquet_store.export_tables(ff_db, store)
+    parquet = [espn_projection_bias.get_relative_errors(store, *f) for f in filters]
+
+    compact_store.build_store(ff_db)
+    assert compact_store.current_store(ff_db) is not None
+    compact = [espn_projection_bias.get_relative_errors(ff_db, *f) for f in filters]
+
+    assert len(sql[2]) < len(sql[1])
+    for expected, others in zip(sql, zip(parquet, compact)):
+        for errors in others:
+            assert np.allclose(np.sort(errors), np.sort(expected))
@@ -0,0 +1,22 @@
+import datetime
+import league_settings
+
+
+def test_current_week_during_season():
+    # Labor Day 2018 was Monday, September 3
+    assert league_settings.get_current_week(2018, datetime.date(2018, 8, 1)) == 1
+    assert league_settings.get_current_week(2018, datetime.date(2018, 9, 10)) == 1
+    assert league_settings.get_current_week(2018, datetime.date(2018, 9, 17)) == 2
+
+
+def test_week_final_after_stat_corrections():
+    # Week 1 of 2018 ended with the Monday game of September 10, and stat
+    # corrections came in until Thursday, September 13
+    for day in [11, 12, 13]:
+        assert league_settings.get_current_week(2018, datetime.date(2018, 9, day)) == 1
+    assert league_settings.get_current_week(2018, datetime.date(2018, 9, 14)) == 2
+
+
+def test_every_week_of_completed_season_is_final():
+    assert league_settings.get_current_week(2017, datetime.date(2018, 2, 1)) == 18
+    assert league_settings.get_current_week(2022, datetime.date(2023, 3, 1)) == 19
@@ -0,0 +1,101 @@
+import numpy as np
+import numpy.random as npr
+import pandas as pd
+import lineup_optimizer
+
+positions = ['QB', 'RB', 'WR', 'TE', 'D/ST', 'K', None]
+
+
+def random_players(rng, teams=6, weeks=3, roster=12):
+    """
+    Players of every team and week, with random positions (some missing) and
+    points. Every player of team 1 in week 1 has no position.
+    """
+    rows = []
+    for team_id in range(1, teams + 1):
+        for week in range(1, weeks + 1):
+            for _ in range(roster):
+                position = None if (team_id, week) == (1, 1) else positions[rng.randint(len(positions))]
+                rows.append((team_id, week, position, round(rng.normal(8, 6), 1)))
+
+    return pd.DataFrame(rows, columns=['team_id', 'week', 'position', 'actual_points'])
+
+
+def exact_scores(players, slots):
+    seats = lineup_optimizer.lineup_seats(slots)
+    scores = {}
+    for key, group in players.groupby(['team_id', 'week']):
+        scores[key] = lineup_optimizer.optimal_lineup(group['actual_points'].values, group['position'].values, seats)[0]
+
+    return scores
+
+
+def test_greedy_matches_exact():
+    slots = pd.DataFrame({'position': ['QB', 'RB', 'WR', 'TE', 'FLEX', 'DST', 'K', 'Bench'],
+                          'slots': [1, 2, 2, 1, 1, 1, 1, 7]})
+    assert lineup_optimizer.is_greedy_exact(lineup_optimizer.lineup_seats(slots))
+
+    players = random_players(npr.RandomState(0))
+    greedy = lineup_optimizer.best_scores(players, slots)
+    exact = exact_scores(players, slots)
+
+    assert sorted(greedy.index) == sorted(exact)
+    for key, score in exact.items():
+        assert np.isclose(greedy[key], score)
+    assert greedy[(1, 1)] == 0.0
+
+
+def test_greedy_without_any_positions():
+    slots = pd.DataFrame({'position': ['QB', 'RB', 'FLEX'], 'slots': [1, 2, 1]})
+    players = pd.DataFrame({'team_id': [1, 1], 'week': [1, 1], 'position': [None, None],
+                            'actual_points': [5.0, 3.0]})
+
+    scores = lineup_optimizer.best_scores(players, slots)
+
+    assert list(scores.values) == [0.0]
+
+
+def brute_force_score(points, positions, seats):
+    """
+    Best score over every assignment of players to seats, filling as many
+    seats as possible first (like optimal_lineup).
+    """
+    def fill(i, used):
+        if i == len(seats):
+            return 0, 0.0
+        best = fill(i + 1, used)
+        for j, position in enumerate(positions):
+            if j not in used and position in lineup_optimizer.eligible_positions(seats[i]):
+                filled, score = fill(i + 1, used | set([j]))
+                best = max(best, (filled + 1, score + points[j]))
+        return best
+
+    return fill(0, frozenset())[1]
+
+
+def test_exact_with_overlapping_flex_slots():
+    slots = pd.DataFrame({'position': ['QB', 'RB', 'WR', 'RBWR', 'FLEX', 'OP'], 'slots': [1, 1, 1, 1, 1, 1]})
+    seats = lineup_optimizer.lineup_seats(slots)
+    assert not lineup_optimizer.is_greedy_exact(seats)
+
+    players = random_players(npr.RandomState(1), teams=3, weeks=2, roster=7)
+    scores = lineup_optimizer.best_scores(players, slots)
+
+    assert scores[(1, 1)] == 0.0
+    for key, group in players.groupby(['team_id', 'week']):
+        expected = brute_force_score(group['actual_points'].values, group['position'].values, seats)
+        assert np.isclose(scores[key], expected)
+
+
+def test_greedy_suboptimal_with_overlapping_flex_slots():
+    # Greedily, the two best RB/WR players would fill both RB/WR seats and
+    # leave the WR/TE seat to the RB, but the TE is worth more there
+    slots = pd.DataFrame({'position': ['RBWR', 'WRTE'], 'slots': [2, 1]})
+    seats = lineup_optimizer.lineup_seats(slots)
+    players = pd.DataFrame({'team_id': 1, 'week': 1, 'position': ['WR', 'WR', 'TE', 'RB'],
+                            'actual_points': [10.0, 9.0, 8.0, 1.0]})
+    expected = brute_force_score(players['actual_points'].values, players['position'].values, seats)
+
+    assert expected == 27.0
+    assert lineup_optimizer.greedy_best_scores(players, seats, ['team_id', 'week'])[(1, 1)] < expected
+    assert lineup_optimizer.best_scores(players, slots)[(1, 1)] == expected
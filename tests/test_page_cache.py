@@ -0,0 +1,64 @@
+import os
+import shutil
+import sqlite3
+import pytest
+import page_cache
+
+URL = 'http://games.espn.com/ffl/clubhouse?leagueId=1&teamId=1&seasonId=2018&scoringPeriodId=1'
+
+
+@pytest.fixture
+def cache(monkeypatch, tmpdir):
+    monkeypatch.setattr(page_cache, 'CACHE_DIR', str(tmpdir))
+    monkeypatch.setattr(page_cache, 'current_weeks', {2018: 2})
+    monkeypatch.setattr(page_cache, 'stats', dict((key, 0) for key in page_cache.stats))
+    monkeypatch.setattr(page_cache, '_accessed', {})
+
+    return str(tmpdir)
+
+
+def last_access(cache_dir, url):
+    conn = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'))
+    row = conn.execute('SELECT last_access FROM Pages WHERE url = ?', (url, )).fetchone()
+    conn.close()
+
+    return row[0]
+
+
+def test_unreadable_body_is_a_miss(cache):
+    page_cache.store(URL, u'<html>week 1</html>')
+    assert page_cache.lookup(URL)['body'] == u'<html>week 1</html>'
+
+    # Evicted by another thread after its index row was read: the body is gone
+    # and something else (here a directory) is in its place
+    path = page_cache.object_path(page_cache.connect().execute('SELECT digest FROM Pages').fetchone()[0])
+    os.remove(path)
+    os.mkdir(path)
+
+    assert page_cache.lookup(URL) is None
+    assert page_cache.stats['miss'] == 1
+
+    shutil.rmtree(path)
+    assert page_cache.lookup(URL) is None
+    assert page_cache.stats['miss'] == 2
+
+
+def test_access_times_written_in_batches(cache, monkeypatch):
+    monkeypatch.setattr(page_cache, 'ACCESS_BATCH', 3)
+    urls = [URL.replace('teamId=1', 'teamId={}'.format(team_id)) for team_id in range(1, 4)]
+    for url in urls:
+        page_cache.store(url, url)
+    stored = [last_access(cache, url) for url in urls]
+
+    page_cache.lookup(urls[0])
+    page_cache.lookup(urls[1])
+    assert [last_access(cache, url) for url in urls] == stored
+
+    page_cache.lookup(urls[2])
+    accessed = [last_access(cache, url) for url in urls]
+    assert all(after > before for after, before in zip(accessed, stored))
+
+    page_cache.lookup(urls[0])
+    page_cache.flush()
+    assert last_access(cache, urls[0]) > accessed[0]
+    assert page_cache._accessed == {}
@@ -0,0 +1,169 @@
+import io
+import os
+import threading
+import time
+import BaseHTTPServer
+import SocketServer
+import pytest
+import requests
+import page_cache
+import page_fetcher
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures')
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Local ESPN stand-in serving the saved fixture pages, one thread per
+    request. statuses holds the statuses to answer the next requests of a path
+    with before serving the page, and every request is logged.
+    """
+    daemon_threads = True
+
+    def __init__(self, delay=0.0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.delay = delay
+        self.statuses = {}
+        self.log = []
+        self.active = 0
+        self.most_active = 0
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        path = self.path.split('?')[0].rsplit('/', 1)[-1]
+        with server.lock:
+            server.log.append((path, time.time(), dict(self.headers)))
+            server.active += 1
+            server.most_active = max(server.most_active, server.active)
+            statuses = server.statuses.get(path)
+            status = statuses.pop(0) if statuses else 200
+
+        time.sleep(server.delay)
+        with io.open(os.path.join(FIXTURES, path + '.html'), 'rb') as f:
+            body = f.read()
+        etag = '"{}"'.format(len(body))
+
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            status = 304
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', 'Mon, 03 Sep 2018 00:00:00 GMT')
+        if status == 200:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        with server.lock:
+            server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(monkeypatch, delay=0.0):
+    server = StubServer(delay)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    monkeypatch.setattr(page_fetcher, 'BASE_URL', 'http://127.0.0.1:{}/ffl'.format(server.server_port))
+    monkeypatch.setattr(page_fetcher, 'BACKOFF', 0.0)
+
+    return server
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(page_cache, 'CACHE_DIR', None)
+    server = start_server(monkeypatch)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def page_url(page, week=1, team_id=1):
+    return '{}/{}?leagueId=1&teamId={}&seasonId=2018&scoringPeriodId={}'.format(page_fetcher.BASE_URL, page,
+                                                                                team_id, week)
+
+
+def fixture_text(page):
+    with io.open(os.path.join(FIXTURES, page + '.html'), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_concurrent_fetch_urls(monkeypatch):
+    monkeypatch.setattr(page_cache, 'CACHE_DIR', None)
+    server = start_server(monkeypatch, delay=0.1)
+    results = {}
+
+    def fetch(team_id):
+        results[team_id] = page_fetcher.fetch_urls([page_url('clubhouse', team_id=team_id),
+                                                    page_url('boxscorequick', team_id=team_id)])
+
+    threads = [threading.Thread(target=fetch, args=(team_id, )) for team_id in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+    server.server_close()
+
+    assert len(server.log) == 8
+    assert server.most_active > 1
+    for team_id in range(1, 5):
+        assert results[team_id] == [fixture_text('clubhouse'), fixture_text('boxscorequick')]
+
+
+def test_rate_limiter_spaces_requests(server):
+    limiter = page_fetcher.HostRateLimiter(20)
+    threads = [threading.Thread(target=page_fetcher.fetch_urls,
+                                args=([page_url('clubhouse', week) for week in range(1, 3)], limiter))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    times = sorted(t for _, t, _ in server.log)
+    assert len(times) == 8
+    assert times[-1] - times[0] >= 0.9 * 7 / 20.0
+
+
+def test_retry_server_errors(server):
+    server.statuses['clubhouse'] = [503, 429, 500]
+
+    assert page_fetcher.fetch_page(page_url('clubhouse')) == fixture_text('clubhouse')
+    assert len(server.log) == 4
+
+
+def test_give_up_after_retries(server, monkeypatch):
+    monkeypatch.setattr(page_fetcher, 'RETRIES', 1)
+    server.statuses['clubhouse'] = [503, 503, 503]
+
+    with pytest.raises(requests.HTTPError):
+        page_fetcher.fetch_page(page_url('clubhouse'))
+    assert len(server.log) == 2
+
+
+def test_revalidate_stale_page(server, monkeypatch, tmpdir):
+    monkeypatch.setattr(page_cache, 'CACHE_DIR', str(tmpdir))
+    monkeypatch.setattr(page_cache, 'LIVE_TTL', 0)
+    monkeypatch.setattr(page_cache, 'current_weeks', {})
+    monkeypatch.setattr(page_cache, 'stats', dict((key, 0) for key in page_cache.stats))
+    url = page_url('boxscorequick')
+
+    first = page_fetcher.fetch_page(url)
+    second = page_fetcher.fetch_page(url)
+
+    assert first == second == fixture_text('boxscorequick')
+    assert len(server.log) == 2
+    headers = server.log[1][2]
+    assert headers['if-none-match'] == '"{}"'.format(len(fixture_text('boxscorequick').encode('utf-8')))
+    assert headers['if-modified-since'] == 'Mon, 03 Sep 2018 00:00:00 GMT'
+    assert page_cache.stats['stored'] == 1
+    assert page_cache.stats['revalidated'] == 1
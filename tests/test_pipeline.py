@@ -0,0 +1,119 @@
+import threading
+import time
+import pytest
+import pipeline
+
+# Seconds a test waits for a pipeline before failing it as deadlocked
+DEADLOCK_TIMEOUT = 10
+
+
+def finish(func):
+    """
+    Call func in a thread and return its result, or raise its exception. Fails
+    if func doesn't return within DEADLOCK_TIMEOUT.
+    """
+    outcome = {}
+
+    def call():
+        try:
+            outcome['result'] = func()
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=call)
+    thread.daemon = True
+    thread.start()
+    thread.join(DEADLOCK_TIMEOUT)
+    assert not thread.is_alive(), 'pipeline deadlocked'
+
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def test_output_order():
+    stages = [('double', lambda x: 2 * x, 1), ('increment', lambda x: x + 1, 1)]
+    stream = pipeline.Pipeline(stages, queue_size=2)
+
+    assert finish(lambda: list(stream.run(xrange(100)))) == [2 * x + 1 for x in range(100)]
+    assert [stats.items for stats in stream.stats] == [100, 100, 100]
+
+
+def test_several_workers_lose_order_only():
+    def jitter(x):
+        time.sleep(0.001 * (x % 3))
+        return x
+
+    stream = pipeline.Pipeline([('jitter', jitter, 4)], queue_size=2)
+
+    assert sorted(finish(lambda: list(stream.run(xrange(60))))) == range(60)
+
+
+def test_failing_stage_reaches_caller():
+    def fail(x):
+        if x == 5:
+            raise ValueError('bad item')
+        return x
+
+    # Small queues fill up behind the failed stage
+    stages = [('fail', fail, 2), ('slow', lambda x: time.sleep(0.01) or x, 1)]
+    stream = pipeline.Pipeline(stages, queue_size=1)
+
+    with pytest.raises(ValueError):
+        finish(lambda: list(stream.run(xrange(1000))))
+
+
+def test_failing_input_reaches_caller():
+    def items():
+        for x in range(10):
+            yield x
+        raise KeyError('bad input')
+
+    stream = pipeline.Pipeline([('identity', lambda x: x, 1)], queue_size=2)
+
+    with pytest.raises(KeyError):
+        finish(lambda: list(stream.run(items())))
+
+
+def test_slow_sink_bounds_items_in_flight():
+    read = [0]
+
+    def items():
+        for x in range(40):
+            read[0] += 1
+            yield x
+
+    queue_size = 2
+    stages = [('a', lambda x: x, 1), ('b', lambda x: x, 1)]
+    stream = pipeline.Pipeline(stages, queue_size=queue_size)
+
+    # Items read but not yet consumed: queue_size in each queue, and one more
+    # held by the feeder and each worker
+    bound = (len(stages) + 1) * queue_size + len(stages) + 1
+
+    def consume():
+        most = 0
+        for consumed, _ in enumerate(stream.run(items()), 1):
+            time.sleep(0.02)
+            most = max(most, read[0] - consumed)
+        return most
+
+    most = finish(consume)
+
+    assert 0 < most <= bound
+    assert stream.stats[1].blocked > 0.2
+    assert stream.stats[-1].busy > 0.5
+
+
+def test_sink_stopping_early():
+    stream = pipeline.Pipeline([('identity', lambda x: x, 2)], queue_size=2)
+
+    def first_items():
+        results = []
+        for item in stream.run(xrange(10**6)):
+            results.append(item)
+            if len(results) == 3:
+                break
+        return results
+
+    assert len(finish(first_items)) == 3
@@ -0,0 +1,29 @@
+import io
+import os
+import players_table
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures')
+
+
+def load_fixture(name):
+    with io.open(os.path.join(FIXTURES, name + '.html'), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_lxml_lineup_parser_matches_bs4():
+    html = load_fixture('clubhouse')
+
+    players = players_table.parse_lineup(3, 7, players_table.find_lineup_table(html))
+
+    assert len(players) == 16
+    assert players_table.parse_lineup_html(3, 7, html) == players
+
+
+def test_lxml_scoring_parser_matches_bs4():
+    html = load_fixture('boxscorequick')
+
+    scores = players_table.parse_scoring(players_table.find_scoring_tables(html))
+
+    assert len(scores) == 16
+    assert 0 in scores
+    assert players_table.parse_scoring_html(html) == scores
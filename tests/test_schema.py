@@ -0,0 +1,5 @@
+import schema
+
+
+def test_hot_queries_use_indexes():
+    assert schema.check_query_plans(':memory:') == []
@@ -0,0 +1,40 @@
+import sqlite3
+import pandas.testing
+import score_engine
+import synthetic_db
+
+
+def update(ff_db, sqlstr):
+    conn = sqlite3.connect(ff_db)
+    conn.execute(sqlstr)
+    conn.commit()
+    conn.close()
+
+
+def check_cache(ff_db):
+    """
+    Scores of ff_db through the ScoreCache, after checking that they match the
+    uncached scores. Returns them indexed by team_id and week.
+    """
+    cached = score_engine.get_league_scores(ff_db)
+    uncached = score_engine.get_league_scores(ff_db, use_cache=False)
+    pandas.testing.assert_frame_equal(cached, uncached, check_dtype=False)
+
+    return cached.set_index(['team_id', 'week'])
+
+
+def test_score_cache_follows_changed_rows(tmpdir):
+    ff_db = str(tmpdir.join('ff.sqlite'))
+    synthetic_db.make_database(ff_db, leagues=1, seasons=1, teams=4, weeks=2)
+    before = check_cache(ff_db)
+
+    # Points of one player change the scores of their team-week only
+    update(ff_db, "UPDATE Players SET actual_points = actual_points + 50 WHERE team_id = 1 AND week = 1 AND slot = 'QB'")
+    after = check_cache(ff_db)
+    assert after.loc[(1, 1), 'score_actual'] == round(before.loc[(1, 1), 'score_actual'] + 50, 1)
+    assert after.drop((1, 1)).equals(before.drop((1, 1)))
+
+    # Roster slots change the best scores of every team-week
+    update(ff_db, "UPDATE Slots SET slots = 1 WHERE position = 'RB'")
+    fewer_slots = check_cache(ff_db)
+    assert (fewer_slots['score_best'] != after['score_best']).all()
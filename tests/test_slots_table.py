@@ -0,0 +1,37 @@
+import io
+import os
+from bs4 import BeautifulSoup
+import slots_table
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures',
+                       'settings.html')
+
+
+def roster_table(extra_rows=''):
+    with io.open(FIXTURE, encoding='utf-8') as f:
+        html = f.read()
+    html = html.replace('<tr><td>Bench (BE)</td>', extra_rows + '<tr><td>Bench (BE)</td>')
+
+    return BeautifulSoup(html, 'lxml').find_all('table')[2]
+
+
+def test_parse_default_slots():
+    slots = slots_table.parse_slots(roster_table())
+
+    assert [(slot['position'], slot['slots']) for slot in slots] == [
+        ('QB', 1), ('RB', 2), ('WR', 2), ('TE', 1), ('FLEX', 1), ('DST', 1), ('K', 1), ('Bench', 7)]
+
+
+def test_parse_every_slot_row():
+    rows = ''.join('<tr><td>{}</td><td>{}</td><td>0</td></tr>'.format(label, num) for label, num in [
+        ('RB/WR (RB/WR)', 1), ('Offensive Player Utility (OP)', 1), ('Defensive Tackle/Defensive End (DT/DE)', 2),
+        ('Linebacker (LB)', 2), ('Defensive Player Utility (DP)', 1), ('Injured Reserve (IR)', 1)])
+    slots = dict((slot['position'], slot['slots']) for slot in slots_table.parse_slots(roster_table(rows)))
+
+    assert slots['RBWR'] == 1
+    assert slots['OP'] == 1
+    assert slots['DTDE'] == 2
+    assert slots['LB'] == 2
+    assert slots['DP'] == 1
+    assert slots['IR'] == 1
+    assert 'Total Starters' not in slots